@@ -0,0 +1,230 @@
+from .pdf_base import PdfBase
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+from os.path import abspath, join
+from time import perf_counter
+import os, re
+
+HEADER_REGEX = re.compile(rb'%PDF-(\d+\.\d+)')
+
+def find_pdfs(root, extensions=('.pdf',)):
+    """Every PDF under `root` (walked in sorted order so the input order is always the same)."""
+    if os.path.isfile(root):
+        return [abspath(root)]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        files += [abspath(join(dirpath, n)) for n in sorted(filenames) if n.lower().endswith(extensions)]
+    return files
+
+def json_safe(value):
+    """Parsed PDF values as JSON, references become "n g R" and anything else unknown a string."""
+    if isinstance(value, dict):
+        return {str(k): json_safe(v) for k, v in value.items()}
+    if isinstance(value, tuple) and len(value) == 3 and value[2] == 'R':
+        return f"{value[0]} {value[1]} R"
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('latin-1')
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+def _metadata(base):
+    doc = base.document
+    info = doc.get_trailer('info')
+    if isinstance(info, tuple):
+        info = doc.get_object(info)
+    if isinstance(info, dict):
+        # One level of references resolved, i.e. a /Title kept as its own object.
+        info = {k: doc.get_object(v) if isinstance(v, tuple) else v for k, v in info.items()}
+    header = HEADER_REGEX.match(bytes(doc.source[0:32]).lstrip())
+    return {
+        'version': header.group(1).decode('latin-1') if header else None,
+        'info': json_safe(info) if isinstance(info, dict) else {},
+        'encrypted': doc.get_trailer('encrypt') is not None,
+        'recovered': doc.recovered,
+        'linearized': doc._linearization()[0] is not None,
+        'updates': max(0, len(doc.sections) - 1),
+        'objects': len(doc.xref.table or {}) + len(doc.xref.compressed)
+    }
+
+def _images(base):
+    """The image XObjects of every page, described but not decoded."""
+    seen = {}
+    images = []
+    for page_number in range(1, base.total_pages + 1):
+        page = base._get_page(page_number)
+        for ref, x_stream in base._page_image_streams(page, page_number, seen):
+            images.append({
+                'object': ref[0],
+                'pages': seen[ref[:2]],
+                'filter': json_safe(x_stream.get_info('Filter')),
+                'width': x_stream.get_info('Width'),
+                'height': x_stream.get_info('Height'),
+                'color_space': json_safe(x_stream.get_info('ColorSpace')),
+                'bits': x_stream.get_info('BitsPerComponent'),
+                'bytes': len(x_stream.data)
+            })
+    return images
+
+def process_document(fname, text=True, images=True):
+    """The batch record of one PDF: { file, status, error, metadata, pages, text, page_errors, images, timings }.
+
+    A page that fails only costs that page (its text is [] and the error is in page_errors), anything
+    that stops the whole document is the record's error.
+    """
+    record = {'file': fname, 'size': None, 'status': 'ok', 'error': None, 'metadata': {}, 'pages': 0, 'text': [], 'page_errors': {}, 'images': []}
+    timings = record['timings'] = {}
+    start = last = perf_counter()
+
+    def lap(name):
+        nonlocal last
+        now = perf_counter()
+        timings[name] = now - last
+        last = now
+
+    try:
+        record['size'] = os.path.getsize(fname)
+        with PdfBase(fname) as base:
+            lap('open')
+            base.create_catalog()
+            record['pages'] = base.total_pages
+            record['metadata'] = _metadata(base)
+            lap('parse')
+            if text:
+                for page_number in range(1, base.total_pages + 1):
+                    try:
+                        # One page at a time so a failure only costs its page, fonts come from the page's own resources.
+                        record['text'].append(next(base.iter_text([page_number]))[1])
+                    except Exception as e:
+                        record['text'].append([])
+                        record['page_errors'][page_number] = str(e)
+                lap('extract')
+            if images:
+                record['images'] = _images(base)
+                lap('images')
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+    timings['total'] = perf_counter() - start
+    return record
+
+def _worker(conn, options):
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        index, fname = job
+        record = process_document(fname, **options)
+        record['index'] = index
+        conn.send(record)
+    conn.close()
+
+class BatchRunner:
+    """Runs process_document over a list of PDFs on a pool of worker processes.
+
+    The pool is managed here instead of with a ProcessPoolExecutor so a document can really be
+    stopped: a worker that's still busy after `timeout` seconds is killed and replaced, and so is
+    one that died (i.e. a crash inside of a C extension), the document gets a 'timeout'/'crashed'
+    record and the rest of the run goes on. Records come out in `order`, 'completion' (as soon as
+    they are done) or 'input' (held back until every document before them is done).
+    """
+    ORDERS = ('completion', 'input')
+
+    def __init__(self, workers=None, timeout=60, order='completion', text=True, images=True):
+        if order not in self.ORDERS:
+            raise Exception(f"Unknown order {order}, use one of {self.ORDERS}.")
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.order = order
+        self.options = {'text': text, 'images': images}
+        self.stats = {'ok': 0, 'error': 0, 'timeout': 0, 'crashed': 0, 'pages': 0, 'sec': 0}
+
+    def _spawn(self):
+        parent, child = Pipe()
+        process = Process(target=_worker, args=(child, self.options), daemon=True)
+        process.start()
+        child.close()
+        return process, parent
+
+    @staticmethod
+    def _stop(worker, kill=False):
+        process, conn = worker
+        if kill:
+            process.kill()
+        else:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        process.join(1)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    @staticmethod
+    def _failed(index, fname, status, error, seconds):
+        return {
+            'file': fname, 'index': index, 'size': None, 'status': status, 'error': error, 'metadata': {}, 'pages': 0,
+            'text': [], 'page_errors': {}, 'images': [], 'timings': {'total': seconds}
+        }
+
+    def run(self, files):
+        """Yields one record per file of `files`, see process_document."""
+        files = list(files)
+        start = perf_counter()
+        workers = [self._spawn() for _ in range(min(self.workers, len(files)))]
+        # { worker number: (index, fname, started, deadline) }
+        busy = {}
+        # Records waiting for the ones in front of them (input order).
+        held = {}
+        next_job = 0
+        next_out = 0
+        try:
+            while next_out < len(files):
+                for w in range(len(workers)):
+                    if w not in busy and next_job < len(files):
+                        workers[w][1].send((next_job, files[next_job]))
+                        now = perf_counter()
+                        busy[w] = (next_job, files[next_job], now, now + self.timeout)
+                        next_job += 1
+
+                finished = []
+                deadline = min(d for _, _, _, d in busy.values())
+                ready = wait([workers[w][1] for w in busy], timeout=max(0, deadline - perf_counter()))
+                for w in list(busy):
+                    index, fname, started, deadline = busy[w]
+                    if workers[w][1] in ready:
+                        try:
+                            finished.append(workers[w][1].recv())
+                            del busy[w]
+                            continue
+                        except (EOFError, OSError):
+                            code = workers[w][0].exitcode
+                            finished.append(self._failed(index, fname, 'crashed', f"Worker exited with code {code}.", perf_counter() - started))
+                    elif perf_counter() >= deadline:
+                        finished.append(self._failed(index, fname, 'timeout', f"Took longer than {self.timeout}s.", perf_counter() - started))
+                    else:
+                        continue
+                    del busy[w]
+                    self._stop(workers[w], kill=True)
+                    workers[w] = self._spawn()
+
+                for record in finished:
+                    self.stats[record['status']] += 1
+                    self.stats['pages'] += record['pages']
+                    if self.order == 'completion':
+                        next_out += 1
+                        yield record
+                        continue
+                    held[record['index']] = record
+                    while next_out in held:
+                        next_out += 1
+                        yield held.pop(next_out - 1)
+        finally:
+            for worker in workers:
+                self._stop(worker, kill=bool(busy))
+            self.stats['sec'] = perf_counter() - start
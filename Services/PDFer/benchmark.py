@@ -0,0 +1,1097 @@
+from .synthetic import SyntheticPdf
+from .pdf_doc import PdfDoc
+from .xref import object_bounds
+from .recovery import XRefRecovery
+from .pdf_base import PdfBase
+from .doc_index import RedisStore, MemoryStore
+from .pdf_scanner import PdfScanner, PdfLexer
+from .stream import Stream
+from .filter_helper import FilterHelper, LZWTable
+from .font import Font
+from .content_interpreter import ContentInterpreter
+from .pdf_parser import PDFParser
+from .jpeg_decoder import JpegDecoder
+from .object_parser import ObjectParser
+from .byte_source import HttpSource
+from .text_index import TextIndex
+from .batch import BatchRunner, find_pdfs
+from tempfile import TemporaryDirectory
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from contextlib import contextmanager
+from os.path import join
+from time import perf_counter
+from os.path import dirname
+import random, io, os, platform, re, subprocess
+import numpy as np
+from PIL import Image
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves the server's `data` with Range support, a local stand-in for a PDF on a web server.
+
+    The server counts the requests and the bytes it sent (`requests`, `bytes_sent`).
+    """
+    RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+    def do_GET(self):
+        data = self.server.data
+        size = len(data)
+        self.server.requests += 1
+        mo = self.RANGE.match(self.headers.get('Range') or '')
+        if mo is None:
+            start, end = 0, size - 1
+            self.send_response(200)
+        else:
+            if mo.group(1):
+                start = int(mo.group(1))
+                end = min(int(mo.group(2)), size - 1) if mo.group(2) else size - 1
+            else:
+                # Suffix range, the last n bytes.
+                start, end = max(0, size - int(mo.group(2))), size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        body = data[start:end + 1]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class PdfBenchmark:
+    """Micro benchmarks for the PDFer, all of them run against generated synthetic PDFs."""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+
+    @staticmethod
+    def _rate(count, seconds):
+        return count / seconds if seconds > 0 else float('inf')
+
+    def object_fetch(self, objects=10000, fetches=20000):
+        """Object fetch throughput, reopening the file per object (old) vs slicing the mmap (new)."""
+        rng = random.Random(self.seed)
+        with TemporaryDirectory() as tmp:
+            fname = SyntheticPdf(pages=10, objects=objects).write(join(tmp, 'fetch.pdf'))
+            with PdfDoc(fname) as doc:
+                table = doc.xref.table
+                numbers = [rng.choice(list(table.keys())) for _ in range(fetches)]
+
+                start = perf_counter()
+                for n in numbers:
+                    s, e = table[n]
+                    with open(fname, 'rb') as f:
+                        f.seek(s)
+                        f.read(e - s)
+                reopen = perf_counter() - start
+
+                start = perf_counter()
+                for n in numbers:
+                    doc.xref.get_object(n)
+                mapped = perf_counter() - start
+
+        return {
+            'objects': objects,
+            'fetches': fetches,
+            'reopen_per_sec': self._rate(fetches, reopen),
+            'mmap_per_sec': self._rate(fetches, mapped),
+            'speedup': reopen / mapped if mapped > 0 else float('inf')
+        }
+
+    @staticmethod
+    def _index_table(xref, xref_start):
+        # The old XRef._create_table, a list.index() per entry.
+        sorted_addresses = sorted([v['byte_offset'] for k, v in xref.items()])
+        table = {}
+        for k, v in xref.items():
+            start = v['byte_offset']
+            start_index = sorted_addresses.index(start)
+            if start_index == len(sorted_addresses) - 1:
+                table[k] = (start, xref_start)
+            else:
+                table[k] = (start, sorted_addresses[start_index + 1])
+        return table
+
+    def xref_scaling(self, sizes=(1000, 10000, 100000), index_limit=20000):
+        """Document open time and xref table construction as the object count grows."""
+        results = []
+        with TemporaryDirectory() as tmp:
+            for n in sizes:
+                fname = SyntheticPdf(pages=10, objects=n).write(join(tmp, f"scale_{n}.pdf"))
+                start = perf_counter()
+                with PdfDoc(fname) as doc:
+                    opened = perf_counter() - start
+                    xref, trailer = doc._parse_file_tail()
+                    start = perf_counter()
+                    object_bounds(xref, [doc._start], len(doc.source))
+                    bisected = perf_counter() - start
+                    indexed = None
+                    if n <= index_limit:
+                        # Quadratic, so it is skipped on the big documents.
+                        start = perf_counter()
+                        self._index_table(xref, doc._start)
+                        indexed = perf_counter() - start
+                results.append({
+                    'objects': n,
+                    'open_sec': opened,
+                    'bisect_table_sec': bisected,
+                    'index_table_sec': indexed
+                })
+        return results
+
+    def object_stream_fetch(self, objects=1000, streams=10):
+        """Fetches every object packed into one compressed object stream.
+
+        Then fetches every object twice from `streams` object streams with a byte budget that only
+        fits two of them, so evicted streams are inflated again.
+        """
+        with TemporaryDirectory() as tmp:
+            fname = SyntheticPdf(pages=1, objects=objects, object_streams=objects).write(join(tmp, 'objstm.pdf'))
+            with PdfDoc(fname) as doc:
+                numbers = list(doc.xref.compressed.keys())
+                start = perf_counter()
+                for n in numbers:
+                    doc.get_object(n)
+                fetched = perf_counter() - start
+                inflated = doc._object_streams.misses
+
+            fname = SyntheticPdf(pages=1, objects=objects, object_streams=objects // streams).write(join(tmp, 'budget.pdf'))
+            with PdfDoc(fname) as doc:
+                budget = 2 * max(len(doc._object_stream(s).data) for s, _ in doc.xref.compressed.values())
+            # One parsed object cached so that every fetch goes back to its object stream.
+            with PdfDoc(fname, cache_entries=1, stream_cache_bytes=budget) as doc:
+                compressed = list(doc.xref.compressed)
+                start = perf_counter()
+                for _ in range(2):
+                    for n in compressed:
+                        doc.get_object(n)
+                budget_fetched = perf_counter() - start
+                budget_inflated = doc._object_streams.misses
+                budget_streams = len(doc._object_stream_tables)
+
+        return {
+            'objects': len(numbers),
+            'object_streams_inflated': inflated,
+            'objects_per_sec': self._rate(len(numbers), fetched),
+            'budget_object_streams': budget_streams,
+            'budget_inflations': budget_inflated,
+            'budget_objects_per_sec': self._rate(2 * len(compressed), budget_fetched)
+        }
+
+    def recovery_scan(self, objects=100000):
+        """Throughput of the damaged file xref reconstruction scan."""
+        with TemporaryDirectory() as tmp:
+            fname = SyntheticPdf(pages=100, objects=objects).write(join(tmp, 'recover.pdf'))
+            with PdfDoc(fname) as doc:
+                start = perf_counter()
+                xref = XRefRecovery(doc.source.buffer()).scan()
+                scanned = perf_counter() - start
+                size = len(doc.source)
+
+        return {
+            'objects': len(xref),
+            'bytes': size,
+            'mb_per_sec': self._rate(size / 1e6, scanned)
+        }
+
+    def index_reopen(self, pages=2000):
+        """Opening a document and its catalog cold vs from a saved DocIndex."""
+        store = RedisStore(MemoryStore())
+        times = []
+        with TemporaryDirectory() as tmp:
+            fname = SyntheticPdf(pages=pages).write(join(tmp, 'reopen.pdf'))
+            for _ in range(2):
+                start = perf_counter()
+                with PdfBase(fname, index_store=store) as base:
+                    base.create_catalog()
+                    times.append(perf_counter() - start)
+
+        return {
+            'pages': pages,
+            'cold_ms': times[0] * 1000,
+            'indexed_ms': times[1] * 1000
+        }
+
+    def lexer(self, objects=2000):
+        """Tokens/sec of the old str scanner vs the bytes lexer (compact tokens, whitespace skipped)."""
+        with TemporaryDirectory() as tmp:
+            fname = SyntheticPdf(pages=10, objects=objects).write(join(tmp, 'lex.pdf'))
+            with open(fname, 'rb') as f:
+                data = f.read()
+        table = data[data.rindex(b'\nxref') + 1:data.rindex(b'startxref')]
+        # Only the object section, the binary streams would just be noise for the old scanner.
+        data = data[data.rindex(b'endstream'):data.rindex(b'xref')]
+        scanner = PdfScanner()
+        lexer = PdfLexer()
+
+        # The xref table and trailer the way PdfDoc used to read them vs through the lexer.
+        start = perf_counter()
+        PDFParser().parse(scanner.tokenize(table))
+        old_table_sec = perf_counter() - start
+        start = perf_counter()
+        ObjectParser().parse_xref_table(table)
+        new_table_sec = perf_counter() - start
+
+        start = perf_counter()
+        old = sum(1 for _ in scanner.tokenize(str(data, 'utf-8', 'ignore')))
+        old_sec = perf_counter() - start
+
+        start = perf_counter()
+        kinds, starts, ends = lexer.lex(data)
+        new_sec = perf_counter() - start
+
+        return {
+            'bytes': len(data),
+            'scanner_tokens': old,
+            'scanner_tokens_per_sec': self._rate(old, old_sec),
+            'scanner_mb_per_sec': self._rate(len(data) / 1e6, old_sec),
+            'lexer_tokens': len(kinds),
+            'lexer_tokens_per_sec': self._rate(len(kinds), new_sec),
+            'lexer_mb_per_sec': self._rate(len(data) / 1e6, new_sec),
+            'xref_scanner_sec': old_table_sec,
+            'xref_lexer_sec': new_table_sec
+        }
+
+    def _resource_objects(self, objects):
+        """Font, font descriptor and page resource dictionaries like a real document is full of."""
+        rng = random.Random(self.seed)
+        out = []
+        for n in range(1, objects + 1):
+            kind = n % 3
+            if kind == 0:
+                widths = ' '.join(str(rng.randint(200, 1000)) for _ in range(224))
+                body = (f"<< /Type /Font /Subtype /TrueType /BaseFont /ABCDEF+Font{n} /FirstChar 32 /LastChar 255 "
+                        f"/Widths [{widths}] /FontDescriptor {n + 1} 0 R /Encoding /WinAnsiEncoding /ToUnicode {n + 2} 0 R >>")
+            elif kind == 1:
+                body = (f"<< /Type /FontDescriptor /FontName /ABCDEF+Font{n} /Flags 32 /FontBBox [-{rng.randint(0, 600)} -250 "
+                        f"{rng.randint(800, 1500)} 950] /ItalicAngle 0 /Ascent 905 /Descent -212 /CapHeight 716 /StemV 80 "
+                        f"/FontFile2 {n + 5} 0 R >>")
+            else:
+                fonts = ' '.join(f"/F{i} {n + i} 0 R" for i in range(8))
+                images = ' '.join(f"/Im{i} {n + 20 + i} 0 R" for i in range(4))
+                body = (f"<< /Font << {fonts} >> /XObject << {images} >> /ExtGState << /GS0 {n + 40} 0 R /GS1 << /Type /ExtGState "
+                        f"/CA 1 /ca 0.5 /SM 0.02 >> >> /ProcSet [/PDF /Text /ImageB /ImageC] /ColorSpace << /CS0 /DeviceRGB >> >>")
+            out.append(bytes(f"{n} 0 obj\n{body}\nendobj\n", 'latin-1'))
+        return out
+
+    def object_parser(self, objects=3000):
+        """Objects/sec of PDFParser (str tokens) vs the ObjectParser (lexer tokens) on font and resource dictionaries."""
+        data = self._resource_objects(objects)
+        size = sum(len(d) for d in data)
+        scanner = PdfScanner()
+        parser = PDFParser()
+        object_parser = ObjectParser()
+
+        start = perf_counter()
+        for d in data:
+            parser.parse_indirect_object(scanner.tokenize(d))
+        old_sec = perf_counter() - start
+
+        start = perf_counter()
+        for d in data:
+            object_parser.parse_indirect_object(d)
+        new_sec = perf_counter() - start
+
+        return {
+            'objects': objects,
+            'bytes': size,
+            'old_objects_per_sec': self._rate(objects, old_sec),
+            'old_mb_per_sec': self._rate(size / 1e6, old_sec),
+            'objects_per_sec': self._rate(objects, new_sec),
+            'mb_per_sec': self._rate(size / 1e6, new_sec),
+            'speedup': old_sec / new_sec
+        }
+
+    def stream_slicing(self, size_mb=32, repeat=5):
+        """Locating a big stream body with /Length (new) vs the backtracking regex (old)."""
+        rng = random.Random(self.seed)
+        payload = rng.randbytes(size_mb << 20)
+        data = memoryview(b'1 0 obj\n<< /Length ' + bytes(str(len(payload)), 'latin-1') + b' >>\nstream\n' + payload + b'\nendstream\nendobj')
+        with TemporaryDirectory() as tmp:
+            with PdfDoc(SyntheticPdf().write(join(tmp, 'stream.pdf'))) as doc:
+                start = perf_counter()
+                for _ in range(repeat):
+                    Stream.FALLBACK_REGEX.match(data).groups()
+                old = perf_counter() - start
+
+                start = perf_counter()
+                for _ in range(repeat):
+                    doc._stream_object(data)
+                new = perf_counter() - start
+
+        return {
+            'bytes': len(payload),
+            'regex_mb_per_sec': self._rate(repeat * size_mb, old),
+            'length_mb_per_sec': self._rate(repeat * size_mb, new)
+        }
+
+    @staticmethod
+    def _legacy_png_prediction(row_size, bpp, data):
+        # The old byte at a time FilterHelper.png_prediction.
+        k = 0
+        predline = [0] * row_size
+        final = []
+        while k < len(data):
+            curr_pred = data[k]
+            k += 1
+            up_left_buffer = [0] * (bpp + 1)
+            for i in range(bpp, row_size):
+                if k >= len(data):
+                    break
+                raw = data[k]
+                k += 1
+                if curr_pred == 1:
+                    predline[i] = (predline[i - bpp] + raw) & 255
+                elif curr_pred == 2:
+                    predline[i] = (predline[i] + raw) & 255
+                elif curr_pred == 3:
+                    predline[i] = (((predline[i - bpp] + predline[i]) >> 1) + raw) & 255
+                elif curr_pred == 4:
+                    for j in range(bpp, 0, -1):
+                        up_left_buffer[j] = up_left_buffer[j - 1]
+                    up_left_buffer[0] = predline[i]
+                    a, b, c = predline[i - bpp], predline[i], up_left_buffer[bpp]
+                    p = a + b - c
+                    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                    predline[i] = ((a if pa <= pb and pa <= pc else b if pb <= pc else c) + raw) & 255
+                else:
+                    predline[i] = raw
+            final.append(predline[bpp:row_size])
+        return final
+
+    def predictors(self, width=4000, height=3000, legacy_rows=20):
+        """PNG/TIFF predictor decoding on a width x height RGB image, libpng and NumPy (new) vs byte at a time (old).
+
+        `mixed` has a random filter on every row like most PDF writers' Predictor 15 output.
+        """
+        rng = np.random.default_rng(self.seed)
+        # Smooth-ish pixels so it looks like a scan and not noise.
+        ramp = np.add.outer(np.arange(height), np.arange(width * 3)) // 7
+        pixels = ((ramp + rng.integers(0, 8, ramp.shape)) & 255).astype(np.uint8)
+        row_size = width * 3 + 3
+        mb = pixels.nbytes / 1e6
+
+        results = {'width': width, 'height': height}
+        for name, types in [
+            ('up', np.full(height, 2)),
+            ('sub', np.full(height, 1)),
+            ('average', np.full(height, 3)),
+            ('paeth', np.full(height, 4)),
+            ('mixed', rng.integers(0, 5, height))
+        ]:
+            data = SyntheticPdf.png_filter(pixels, 3, types)
+            start = perf_counter()
+            FilterHelper.png_prediction(width, row_size, 3, data)
+            lib = perf_counter() - start
+
+            start = perf_counter()
+            FilterHelper.png_prediction(width, row_size, 3, data, libpng=False)
+            new = perf_counter() - start
+
+            head = data[:legacy_rows * (row_size - 2)]
+            start = perf_counter()
+            self._legacy_png_prediction(row_size, 3, head)
+            old = perf_counter() - start
+
+            results[name] = {
+                'libpng_sec': lib,
+                'libpng_mb_per_sec': self._rate(mb, lib),
+                'numpy_sec': new,
+                'numpy_mb_per_sec': self._rate(mb, new),
+                'legacy_mb_per_sec': self._rate(legacy_rows * (row_size - 3) / 1e6, old)
+            }
+
+        # TIFF predictor 2 is the difference from the same component of the pixel to the left.
+        diff = pixels.reshape(height, width, 3).astype(np.int16)
+        diff[:, 1:] -= pixels.reshape(height, width, 3)[:, :-1]
+        data = (diff & 255).astype(np.uint8).tobytes()
+        start = perf_counter()
+        FilterHelper.tiff_prediction(8, 3, width, row_size, 3, data)
+        new = perf_counter() - start
+        results['tiff'] = {
+            'numpy_sec': new,
+            'numpy_mb_per_sec': self._rate(mb, new)
+        }
+        return results
+
+    @staticmethod
+    def _legacy_lzw(data, early_change=1):
+        # The old FilterHelper.lzw with its bit buffer and head/tail table chains.
+        output = io.BytesIO()
+        input_bits = 0
+        buff = 0
+        code = 0
+        prev_code = 0
+        entry_size = 0
+        table = {}
+        index = 258
+        bit_size = 9
+        seq_size = 0
+        is_clear_marker = True
+        eof = False
+        new_code = 0
+        k = 0
+        while k < len(data):
+            while input_bits < bit_size:
+                if k >= len(data):
+                    eof = True
+                    break
+                c = data[k]
+                k += 1
+                buff = (buff << 8) | (c & 255)
+                input_bits += 8
+            code = (buff >> (input_bits - bit_size)) & ((1 << bit_size) - 1)
+            input_bits -= bit_size
+            if code == 257 or eof:
+                break
+            if code == 256:
+                index = 258
+                bit_size = 9
+                seq_size = 0
+                is_clear_marker = True
+                continue
+            if index >= 4097:
+                raise Exception("Corrupt LZW Compression.")
+            entry_size = seq_size + 1
+            if code < 256:
+                output.write(bytes([code]))
+                new_code = code
+                seq_size = 1
+            elif code < index:
+                seq_size = table[code]['length']
+                j = code
+                sbuf = [0] * seq_size
+                for i in range(seq_size - 1, 0, -1):
+                    sbuf[i] = table[j]['tail']
+                    j = table[j]['head']
+                sbuf[0] = j
+                new_code = j
+                output.write(bytes(sbuf))
+            elif code == index:
+                output.write(bytes([new_code]))
+                seq_size += 1
+            else:
+                raise Exception("Corrupt LZW Compression.")
+            if is_clear_marker:
+                is_clear_marker = False
+            else:
+                table[index] = {
+                    'length': entry_size,
+                    'head': prev_code,
+                    'tail': new_code
+                }
+                index += 1
+                if index + early_change == 512:
+                    bit_size = 10
+                elif index + early_change == 1024:
+                    bit_size = 11
+                elif index + early_change == 2048:
+                    bit_size = 12
+            prev_code = code
+        output.seek(0)
+        b_out =  output.read()
+        output.close()
+        return b_out
+
+    def lzw(self, sizes=(1, 10, 100), legacy_max=1):
+        """LZWDecode on 1/10/100 MB of decoded data, table driven (new) vs head/tail chains (old).
+
+        The old decoder never trims its bit buffer so it is quadratic, past `legacy_max` MB it takes hours.
+        """
+        rng = np.random.default_rng(self.seed)
+        # Half content stream text, half noisy image rows, about like an old scanner PDF.
+        text = (b''.join(SyntheticPdf()._content(p) for p in range(1, 600)) * 4)[:1 << 19]
+        ramp = np.add.outer(np.arange(256), np.arange(2048)) // 9 + rng.integers(0, 4, (256, 2048))
+        block = (text + (ramp & 255).astype(np.uint8).tobytes())[:1 << 20]
+        encoded = SyntheticPdf.lzw_compress(block, eod=False)
+
+        results = {}
+        for mb in sizes:
+            data = encoded * mb + SyntheticPdf.lzw_compress(b'')
+            start = perf_counter()
+            FilterHelper.lzw(data)
+            new = perf_counter() - start
+            result = {
+                'compressed_bytes': len(data),
+                'table_mb_per_sec': self._rate(mb, new)
+            }
+            if mb <= legacy_max:
+                start = perf_counter()
+                self._legacy_lzw(data)
+                old = perf_counter() - start
+                result['legacy_mb_per_sec'] = self._rate(mb, old)
+                result['speedup'] = old / new if new > 0 else float('inf')
+            results[f"{mb}MB"] = result
+
+        # Fed 64 KiB at a time like the filter pipeline does.
+        table = LZWTable()
+        start = perf_counter()
+        size = sum(len(table.decode(encoded[i:i + (1 << 16)])) for i in range(0, len(encoded), 1 << 16))
+        results['incremental_mb_per_sec'] = self._rate(size / (1 << 20), perf_counter() - start)
+        return results
+
+    def parallel_text(self, pages=1000, workers=(1, 2, 4)):
+        """Whole document text extraction with PdfBase.extract_text on 1, 2, 4... worker processes."""
+        results = {'pages': pages, 'cpus': os.cpu_count()}
+        with TemporaryDirectory() as tmp:
+            # Every page has its own /F1 ... /F3, a font looked up by name alone gives the wrong text.
+            synthetic = SyntheticPdf(pages=pages, fonts=3, page_fonts=True)
+            fname = synthetic.write(join(tmp, 'text.pdf'))
+            for n in workers:
+                with PdfBase(fname) as base:
+                    base.create_catalog()
+                    start = perf_counter()
+                    text = base.extract_text(workers=n)
+                    seconds = perf_counter() - start
+                results[f"workers_{n}"] = {
+                    'sec': seconds,
+                    'pages_per_sec': self._rate(len(text), seconds)
+                }
+        return results
+
+    @staticmethod
+    def _legacy_translate(font, raw_text):
+        # The old Font.translate (fonts without a ToUnicode cmap), the Differences were rebuilt
+        # through toJSON() on every run and every piece went through str() looking for escapes.
+        enc_dict = {}
+        try:
+            new_key = None
+            curr_key = 0
+            for enc in font.toJSON()['encoding']['Differences']:
+                try:
+                    int(enc)
+                    new_key = enc
+                except:
+                    if new_key and enc != '.notdef':
+                        enc_dict.update({new_key: enc})
+                        curr_key = new_key
+                    elif enc != '.notdef':
+                        enc_dict.update({curr_key: enc})
+                    new_key = None
+                    curr_key += 1
+        except:
+            pass
+        for i, val in enumerate(raw_text):
+            if r'\x' in str(val) or r'\\' in str(val):
+                raw_text[i] = ''
+        encoding = font.encoding.get('BaseEncoding', 'standard') if isinstance(font.encoding, dict) else font.encoding
+        codec = 'mac_roman' if encoding.lower().startswith('mac') else 'cp1252'
+        return ''.join([str(text, codec) if isinstance(text, bytes) else text for text in raw_text])
+
+    def font_decoding(self, runs=20000, words=12):
+        """Decoding text runs with the compiled 256 entry tables vs the old per run translate.
+
+        The old translate only got plain ASCII right, so it is timed on ASCII runs, the tables
+        are timed on the same runs and on runs full of accented (high) bytes.
+        """
+        rng = random.Random(self.seed)
+        fonts = {
+            'WinAnsi': Font(None, {'Type': 'Font', 'Subtype': 'TrueType', 'BaseFont': 'Arial', 'Encoding': 'WinAnsiEncoding'}),
+            'MacRoman': Font(None, {'Type': 'Font', 'Subtype': 'Type1', 'BaseFont': 'Times', 'Encoding': 'MacRomanEncoding'}),
+            'Differences': Font(None, {'Type': 'Font', 'Subtype': 'Type1', 'BaseFont': 'Custom', 'Encoding': {
+                'Type': 'Encoding',
+                'BaseEncoding': 'WinAnsiEncoding',
+                'Differences': [39, 'quoteright', 96, 'quoteleft', 128, 'fi', 'fl', 'ff', 'ffi', 'ffl', 160, 'space', 200, 'eacute', 'egrave', 'agrave']
+            }})
+        }
+        ascii_letters = b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,;:\'`'
+        high = bytes(range(0xC0, 0x100))
+
+        def make_runs(alphabet):
+            return [[bytes(rng.choice(alphabet) for _ in range(rng.randint(2, 9))) for _ in range(words)] for _ in range(runs)]
+
+        ascii_runs = make_runs(ascii_letters)
+        accented_runs = make_runs(ascii_letters + high)
+        chars = sum(len(w) for run in ascii_runs for w in run)
+
+        results = {'runs': runs, 'chars': chars}
+        for name, font in fonts.items():
+            font._table = None
+            start = perf_counter()
+            font.table
+            compile_sec = perf_counter() - start
+
+            start = perf_counter()
+            for run in ascii_runs:
+                font.translate(run)
+            new = perf_counter() - start
+
+            start = perf_counter()
+            for run in accented_runs:
+                font.translate(run)
+            accented_sec = perf_counter() - start
+
+            start = perf_counter()
+            for run in ascii_runs:
+                self._legacy_translate(font, list(run))
+            old = perf_counter() - start
+
+            results[name] = {
+                'compile_usec': compile_sec * 1e6,
+                'table_mchars_per_sec': self._rate(chars / 1e6, new),
+                'accented_mchars_per_sec': self._rate(chars / 1e6, accented_sec),
+                'legacy_mchars_per_sec': self._rate(chars / 1e6, old),
+                'speedup': old / new if new > 0 else float('inf')
+            }
+        return results
+
+    def content_ops(self, lines=2000, repeat=3):
+        """Operators/sec of the ContentInterpreter on a dense page vs the old parse_content text scan.
+
+        Every line is a mix of text positioning, kerned TJ arrays and the path/color operators a
+        real page has between its text objects.
+        """
+        ops = []
+        for i in range(lines):
+            y = 780 - (i % 60) * 12
+            ops.append(bytes(
+                f"q 0.5 g 1 0 0 1 0 0 cm 36 {y} m 576 {y} l S 0 0 1 rg 36 {y} 540 0.5 re f Q\n"
+                f"BT /F1 9 Tf 1 0 0 1 36 {y} Tm 0 Tc 0 Tw (Line {i} of a dense page) Tj "
+                f"[(Ke) 40 (rned) -250 (te) 20 (xt) -250 (run)] TJ 12 0 Td <48656c6c6f> Tj ET\n",
+                'latin-1'
+            ))
+        data = b''.join(ops)
+        fonts = {'F1': Font(None, {'Type': 'Font', 'Subtype': 'Type1', 'BaseFont': 'Helvetica', 'Encoding': 'WinAnsiEncoding'})}
+
+        best = None
+        for _ in range(repeat):
+            interpreter = ContentInterpreter(fonts)
+            start = perf_counter()
+            runs = list(interpreter.runs(data))
+            text = ContentInterpreter.lines(runs)
+            seconds = perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+
+        start = perf_counter()
+        old = PDFParser().parse_content(PdfScanner().b_tokenize(data))
+        old_seconds = perf_counter() - start
+        return {
+            'bytes': len(data),
+            'operators': interpreter.operators,
+            'runs': len(runs),
+            'lines': len(text),
+            'ops_per_sec': self._rate(interpreter.operators, best),
+            'mb_per_sec': self._rate(len(data) / (1 << 20), best),
+            'legacy_ops_per_sec': self._rate(interpreter.operators, old_seconds),
+            'legacy_blocks': len(old),
+            'speedup': old_seconds / best if best > 0 else float('inf')
+        }
+
+    @staticmethod
+    def _legacy_page_tree(doc, pages_ref):
+        # The old Catalog._build_page_tree, every node read up front (and wrong for mixed trees).
+        page_tree = doc.get_object(pages_ref)
+        kids = page_tree['Kids']
+        if page_tree['Count'] == len(kids):
+            return kids
+        complete = []
+        for k in kids:
+            complete.extend(PdfBenchmark._legacy_page_tree(doc, k))
+        return complete
+
+    def page_tree(self, pages=5000, page=4321, fanouts=(0, 10)):
+        """Opening a document and reading one page through the lazy PageTree vs building the whole tree.
+
+        `objects` is how many objects the PageTree parsed to find the page and `peeked` how many
+        kids it only counted from their raw bytes. A flat tree (fanout 0) has to have its kids
+        counted up to the page, a balanced one only touches about fanout * log(pages) of them.
+        """
+        results = {}
+        with TemporaryDirectory() as tmp:
+            for fanout in fanouts:
+                fname = SyntheticPdf(pages=pages, fanout=fanout).write(join(tmp, f"tree_{fanout}.pdf"))
+                with PdfBase(fname) as base:
+                    start = perf_counter()
+                    base.create_catalog()
+                    base.get_page_text(page)
+                    lazy = perf_counter() - start
+                    loaded = base.catalog.pages.loaded
+                    peeked = base.catalog.pages.peeked
+                with PdfDoc(fname) as doc:
+                    start = perf_counter()
+                    root = doc.get_object(doc.get_trailer('root'))
+                    refs = self._legacy_page_tree(doc, root['Pages'])
+                    legacy = perf_counter() - start
+                results[f"fanout_{fanout}"] = {
+                    'objects': loaded,
+                    'peeked': peeked,
+                    'lazy_ms': lazy * 1000,
+                    'legacy_build_ms': legacy * 1000,
+                    'legacy_pages': len(refs)
+                }
+        return results
+
+    def image_export(self, pages=20, images=16, size=512, workers=(1, 4)):
+        """PdfBase.export_images vs decoding every page's images one at a time like get_page_images does.
+
+        All of the pages share the same `images` XObjects (half JPEG, half Flate + PNG predictor),
+        the export writes each one once and copies the JPEGs without decoding them.
+        """
+        results = {'pages': pages, 'images': images, 'cpus': os.cpu_count()}
+        with TemporaryDirectory() as tmp:
+            synthetic = SyntheticPdf(pages=pages, images=images, image_size=size)
+            fname = synthetic.write(join(tmp, 'images.pdf'))
+            for n in workers:
+                out_dir = join(tmp, f"out_{n}")
+                with PdfBase(fname) as base:
+                    base.create_catalog()
+                    start = perf_counter()
+                    written = base.export_images(out_dir, workers=n)
+                    seconds = perf_counter() - start
+                size_mb = sum(os.path.getsize(w['file']) for w in written if w['file']) / (1 << 20)
+                results[f"workers_{n}"] = {
+                    'sec': seconds,
+                    'files': len(written),
+                    'errors': sum(1 for w in written if w['error']),
+                    'mb_per_sec': self._rate(size_mb, seconds)
+                }
+            with PdfBase(fname) as base:
+                base.create_catalog()
+                start = perf_counter()
+                for page_number in range(1, pages + 1):
+                    for name, image in base.get_page_images(page_number).items():
+                        image.get_image()
+                results['per_page_decode_sec'] = perf_counter() - start
+        return results
+
+    def jpeg_decode(self, width=1920, height=1080, quality=85, repeat=3):
+        """JpegDecoder vs Pillow (libjpeg) on a ~2 MP photo-ish image, baseline 4:2:0, 4:4:4 and progressive.
+
+        Reports the best of `repeat` runs for both, how many times slower the JpegDecoder's own
+        decoding (libjpeg=False) is and the biggest/mean pixel difference from Pillow's output
+        (rounding and upsampling only). The libjpeg_ numbers are decode() as PDFer calls it, which
+        hands the image to libjpeg through OpenCV, so that is libjpeg against libjpeg.
+        """
+        rng = np.random.default_rng(self.seed)
+        y, x = np.mgrid[0:height, 0:width]
+        pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) & 255], axis=2).astype(np.uint8)
+        # Some detail so the AC coefficients aren't all zero.
+        pixels[height // 4:height // 2, width // 4:width // 2] = rng.integers(0, 256, (height // 2 - height // 4, width // 2 - width // 4, 3))
+
+        variants = {
+            'baseline_420': {'quality': quality},
+            'baseline_444': {'quality': quality, 'subsampling': 0},
+            'progressive': {'quality': quality, 'progressive': True}
+        }
+        results = {'megapixels': width * height / 1e6}
+        for name, options in variants.items():
+            buf = io.BytesIO()
+            Image.fromarray(pixels).save(buf, 'JPEG', **options)
+            data = buf.getvalue()
+
+            ours = libjpeg = pillow = float('inf')
+            for _ in range(repeat):
+                start = perf_counter()
+                decoded = JpegDecoder(data).decode(libjpeg=False)
+                ours = min(ours, perf_counter() - start)
+                start = perf_counter()
+                through_libjpeg = JpegDecoder(data).decode()
+                libjpeg = min(libjpeg, perf_counter() - start)
+                start = perf_counter()
+                expected = np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))
+                pillow = min(pillow, perf_counter() - start)
+            diff = np.abs(decoded.astype(np.int16) - expected)
+            libjpeg_diff = np.abs(through_libjpeg.astype(np.int16) - expected)
+            results[name] = {
+                'kb': len(data) / 1024,
+                'sec': ours,
+                'pillow_sec': pillow,
+                'x_pillow': ours / pillow,
+                'max_diff': int(diff.max()),
+                'mean_diff': float(diff.mean()),
+                'libjpeg_sec': libjpeg,
+                'libjpeg_x_pillow': libjpeg / pillow,
+                'libjpeg_max_diff': int(libjpeg_diff.max())
+            }
+        return results
+
+    @staticmethod
+    @contextmanager
+    def _serve(data):
+        """Serves `data` on a local RangeRequestHandler server, yields (server, url)."""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        server.data = data
+        server.requests = 0
+        server.bytes_sent = 0
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server, f"http://127.0.0.1:{server.server_address[1]}/synthetic.pdf"
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def remote_open(self, pages=500, objects=20000, page=250, block_size=64 * 1024):
+        """Opens a PDF served over HTTP range requests (by a local RangeRequestHandler) and reads one page.
+
+        Counts the requests and bytes it took against the size of the file, and times the same
+        thing from a local file and from memory.
+        """
+        synthetic = SyntheticPdf(pages=pages, objects=objects, fonts=3)
+        data = synthetic.build()
+        results = {'file_kb': len(data) / 1024, 'block_kb': block_size / 1024}
+
+        with self._serve(data) as (server, url):
+            start = perf_counter()
+            with PdfBase(HttpSource(url, block_size=block_size)) as base:
+                base.create_catalog()
+                opened = (server.requests, server.bytes_sent, perf_counter() - start)
+                base.get_page_text(page)
+                stats = base.document.source.stats()
+            results['http'] = {
+                'open_requests': opened[0],
+                'open_kb': opened[1] / 1024,
+                'open_sec': opened[2],
+                'page_requests': server.requests - opened[0],
+                'total_kb': server.bytes_sent / 1024,
+                'sec': perf_counter() - start,
+                'reads': stats['reads']
+            }
+
+        with TemporaryDirectory() as tmp:
+            fname = join(tmp, 'local.pdf')
+            with open(fname, 'wb') as f:
+                f.write(data)
+            for name, target in (('file', fname), ('bytes', data)):
+                start = perf_counter()
+                with PdfBase(target) as base:
+                    base.create_catalog()
+                    base.get_page_text(page)
+                results[f"{name}_sec"] = perf_counter() - start
+        return results
+
+    def first_page(self, pages=2000, objects=100000, block_size=16 * 1024):
+        """Time to the text of page 1 of a big linearized PDF over HTTP, with and without its first page hints.
+
+        Without them the whole xref chain and the page tree have to be read first.
+        """
+        synthetic = SyntheticPdf(pages=pages, objects=objects, fonts=3, linearized=True)
+        data = synthetic.build()
+        results = {'file_kb': len(data) / 1024, 'block_kb': block_size / 1024}
+        for first_page in (False, True):
+            with self._serve(data) as (server, url):
+                start = perf_counter()
+                with PdfBase(HttpSource(url, block_size=block_size), first_page=first_page) as base:
+                    base.create_catalog()
+                    base.get_page_text(1)
+                    sec = perf_counter() - start
+                    requests, sent = server.requests, server.bytes_sent
+            results['first_page' if first_page else 'full_xref'] = {
+                'sec': sec,
+                'requests': requests,
+                'kb': sent / 1024
+            }
+        return results
+
+    def text_search(self, pages=100000, words=120, vocabulary=20000, pages_per_doc=100):
+        """Builds a TextIndex over `pages` pages of random (Zipf distributed) words and times some queries.
+
+        Text goes straight into add_document, only the index is measured not the PDF text extraction.
+        """
+        rng = np.random.default_rng(self.seed)
+        vocab = [f"w{i}" for i in range(vocabulary)]
+        ranks = np.minimum(rng.zipf(1.3, pages * words), vocabulary) - 1
+        texts = [' '.join(vocab[r] for r in ranks[p * words:(p + 1) * words].tolist()) for p in range(pages)]
+        results = {'pages': pages, 'words': pages * words}
+
+        with TemporaryDirectory() as tmp:
+            index = TextIndex(join(tmp, 'index'))
+            start = perf_counter()
+            for d in range(0, pages, pages_per_doc):
+                doc = texts[d:d + pages_per_doc]
+                index.add_document(f"doc{d // pages_per_doc}.pdf", [(i + 1, [t]) for i, t in enumerate(doc)])
+            index.flush()
+            results['build_sec'] = perf_counter() - start
+            results['index_mb'] = index.stats()['bytes'] / (1 << 20)
+            results['text_mb'] = sum(len(t) + 1 for t in texts) / (1 << 20)
+
+            start = perf_counter()
+            index = TextIndex(join(tmp, 'index'))
+            index.search('w0')
+            results['open_ms'] = (perf_counter() - start) * 1000
+
+            queries = {
+                'common_term': 'w1',
+                'rare_term': f"w{vocabulary // 2}",
+                'and': 'w5 AND w50',
+                'or': 'w500 OR w600',
+                'not': 'w5 NOT w2',
+                'phrase': '"w3 w4"',
+                'long_phrase': '"w0 w0 w1"'
+            }
+            for name, query in queries.items():
+                best = float('inf')
+                for _ in range(3):
+                    start = perf_counter()
+                    hits = index.search(query)
+                    best = min(best, perf_counter() - start)
+                results[name] = {'ms': best * 1000, 'hits': len(hits)}
+        return results
+
+    def batch(self, documents=40, pages=50, timeout=30):
+        """BatchRunner over a directory of synthetic PDFs plus a broken one, for 1 worker and one per cpu."""
+        cpus = os.cpu_count() or 1
+        results = {'documents': documents + 1, 'cpus': cpus}
+        with TemporaryDirectory() as tmp:
+            for d in range(documents):
+                synthetic = SyntheticPdf(pages=pages, fonts=2, updates=d % 3, images=d % 2, image_size=64, page_fonts=d % 2 == 0)
+                synthetic.write(join(tmp, f"doc{d:04d}.pdf"))
+            with open(join(tmp, 'broken.pdf'), 'wb') as f:
+                f.write(b'%PDF-1.4\nthis is not a pdf\n')
+            files = find_pdfs(tmp)
+
+            for workers in sorted({1, cpus, 2}):
+                for order in BatchRunner.ORDERS:
+                    runner = BatchRunner(workers=workers, timeout=timeout, order=order)
+                    records = list(runner.run(files))
+                    results[f"workers_{workers}_{order}"] = {
+                        'sec': runner.stats['sec'],
+                        'docs_per_sec': self._rate(len(records), runner.stats['sec']),
+                        'pages_per_sec': self._rate(runner.stats['pages'], runner.stats['sec']),
+                        'ok': runner.stats['ok'],
+                        'error': runner.stats['error'],
+                        'mean_ms': {
+                            k: 1000 * sum(r['timings'].get(k, 0) for r in records) / len(records)
+                            for k in ('open', 'parse', 'extract', 'images', 'total')
+                        }
+                    }
+        return results
+
+    # The documents suite() runs on, `pages` and `objects` get multiplied by its scale.
+    CORPUS = {
+        'xref_table': {'pages': 200, 'objects': 5000, 'fonts': 3},
+        'xref_stream': {'pages': 200, 'objects': 5000, 'fonts': 3, 'object_streams': 100},
+        'incremental': {'pages': 200, 'objects': 5000, 'fonts': 3, 'updates': 4},
+        'incremental_xref_stream': {'pages': 200, 'objects': 5000, 'fonts': 3, 'updates': 4, 'xref_stream': True},
+        'images': {'pages': 20, 'fonts': 2, 'images': 8, 'image_size': 256}
+    }
+
+    @staticmethod
+    def _best(repeat, fn):
+        """(fastest time of `repeat` calls, what the last call returned)"""
+        best = float('inf')
+        result = None
+        for _ in range(repeat):
+            start = perf_counter()
+            result = fn()
+            best = min(best, perf_counter() - start)
+        return best, result
+
+    @staticmethod
+    def environment():
+        """What the numbers were measured on, so results from different commits can be lined up."""
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=dirname(__file__), capture_output=True, text=True, timeout=10
+            ).stdout.strip() or None
+        except Exception:
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count()
+        }
+
+    def suite(self, scale=1, fetches=5000, repeat=3):
+        """End to end numbers for every document in CORPUS: open, random object fetch, full text and image export.
+
+        The documents are generated the same way every time, so runs of different commits can be
+        compared (see compare()). Opening is PdfBase + create_catalog (xref, trailer, every
+        incremental update section and the page tree root), the fetches are uncached reads of
+        random objects, the text is iter_text over every page, the images go through export_images.
+        """
+        rng = random.Random(self.seed)
+        results = {'environment': self.environment(), 'scale': scale, 'corpus': {}}
+        with TemporaryDirectory() as tmp:
+            for name, options in self.CORPUS.items():
+                options = dict(options)
+                for key in ('pages', 'objects'):
+                    if key in options:
+                        options[key] = max(1, int(options[key] * scale))
+                synthetic = SyntheticPdf(**options)
+                fname = synthetic.write(join(tmp, f"{name}.pdf"))
+                result = results['corpus'][name] = {'options': options, 'mb': os.path.getsize(fname) / (1 << 20)}
+
+                def open_document():
+                    with PdfBase(fname) as base:
+                        base.create_catalog()
+                        return base.total_pages
+                result['open_sec'], result['pages'] = self._best(repeat, open_document)
+
+                with PdfDoc(fname) as doc:
+                    numbers = list(doc.xref.table) + list(doc.xref.compressed)
+                    picks = [rng.choice(numbers) for _ in range(fetches)]
+                    start = perf_counter()
+                    for n in picks:
+                        doc.get_object(n, search_stream=True, cache=False)
+                    result['fetch_per_sec'] = self._rate(fetches, perf_counter() - start)
+
+                with PdfBase(fname) as base:
+                    start = perf_counter()
+                    text = list(base.iter_text())
+                    seconds = perf_counter() - start
+                result['text_sec'] = seconds
+                result['text_pages_per_sec'] = self._rate(len(text), seconds)
+
+                if options.get('images'):
+                    with PdfBase(fname) as base:
+                        base.create_catalog()
+                        start = perf_counter()
+                        written = base.export_images(join(tmp, f"{name}_images"))
+                        result['export_sec'] = perf_counter() - start
+                    result['images_written'] = sum(1 for w in written if w['file'])
+                    result['image_errors'] = sum(1 for w in written if w['error'])
+        return results
+
+    @staticmethod
+    def _flatten(results, prefix=''):
+        flat = {}
+        for k, v in results.items():
+            if isinstance(v, dict):
+                flat.update(PdfBenchmark._flatten(v, f"{prefix}{k}."))
+            elif isinstance(v, (int, float)) and not isinstance(v, bool):
+                flat[prefix + k] = v
+        return flat
+
+    @classmethod
+    def compare(cls, old, new):
+        """{ 'bench.key': { 'old', 'new', 'change' } } for every timing/rate both results have.
+
+        `change` is new / old, for a _sec key under 1 is faster and for a _per_sec key over 1 is.
+        """
+        old = cls._flatten(old)
+        new = cls._flatten(new)
+        report = {}
+        for key in sorted(set(old) & set(new)):
+            if key.endswith('sec') and old[key]:
+                report[key] = {'old': old[key], 'new': new[key], 'change': new[key] / old[key]}
+        return report
+
+    def run(self, names=None):
+        benches = {
+            'object_fetch': self.object_fetch,
+            'xref_scaling': self.xref_scaling,
+            'object_stream_fetch': self.object_stream_fetch,
+            'recovery_scan': self.recovery_scan,
+            'index_reopen': self.index_reopen,
+            'lexer': self.lexer,
+            'stream_slicing': self.stream_slicing,
+            'predictors': self.predictors,
+            'lzw': self.lzw,
+            'parallel_text': self.parallel_text,
+            'font_decoding': self.font_decoding,
+            'content_ops': self.content_ops,
+            'page_tree': self.page_tree,
+            'image_export': self.image_export,
+            'jpeg_decode': self.jpeg_decode,
+            'remote_open': self.remote_open,
+            'first_page': self.first_page,
+            'text_search': self.text_search,
+            'object_parser': self.object_parser,
+            'batch': self.batch,
+            'suite': self.suite,
+        }
+        names = names or list(benches.keys())
+        return {name: benches[name]() for name in names}
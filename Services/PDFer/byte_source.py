@@ -0,0 +1,344 @@
+from .object_cache import ObjectCache
+from os.path import abspath
+import io, mmap, re
+import urllib.request
+
+class ByteSource:
+    """Random access to the bytes of a PDF, wherever they are.
+
+    A source slices like a bytes object (source[a:b]) and has len(), find() and rfind(), which is
+    all PdfDoc and XRef need, so they never care if the PDF is a local file, something already in
+    memory (an upload, a zip member that was read out) or a file behind HTTP range requests.
+    Every source counts the slices it served in `reads` and `bytes_read`.
+    """
+    # find/rfind on sources that aren't one buffer read this much at a time (doubling every time).
+    SEARCH_CHUNK = 4096
+
+    def __init__(self, name, size=0):
+        self.name = name
+        self.size = size
+        self.reads = 0
+        self.bytes_read = 0
+        self._closed = False
+
+    @staticmethod
+    def is_url(target):
+        return isinstance(target, str) and target.startswith(('http://', 'https://'))
+
+    @staticmethod
+    def is_local(target):
+        """True for a file path, the only kind of source a DocIndex store or a worker process can reopen."""
+        return isinstance(target, FileSource) or (isinstance(target, str) and not ByteSource.is_url(target))
+
+    @staticmethod
+    def open(target):
+        """The source for `target`: a path, an http(s) url, bytes (or bytearray/memoryview), a BytesIO or
+        any seekable file object (i.e. zipfile.ZipFile(...).open(member)). A source is returned as is."""
+        if isinstance(target, ByteSource):
+            return target
+        if isinstance(target, (bytes, bytearray, memoryview)):
+            return BytesSource(target)
+        if isinstance(target, io.BytesIO):
+            return BytesSource(target.getvalue())
+        if ByteSource.is_url(target):
+            return HttpSource(target)
+        if hasattr(target, 'read') and hasattr(target, 'seek'):
+            return FileObjectSource(target)
+        return FileSource(target)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            if key < 0:
+                key += self.size
+            if not 0 <= key < self.size:
+                raise IndexError('byte source index out of range')
+            return self.read(key, key + 1)[0]
+        start, stop, step = key.indices(self.size)
+        if step != 1:
+            raise ValueError('byte sources only slice with a step of 1')
+        data = self.read(start, stop) if stop > start else b''
+        self.reads += 1
+        self.bytes_read += len(data)
+        return data
+
+    def read(self, start, end):
+        """The bytes from start to end (already clamped to the source)."""
+        raise NotImplementedError
+
+    def find(self, sub, start=0, end=None):
+        end = self.size if end is None else min(end, self.size)
+        chunk = self.SEARCH_CHUNK
+        pos = start
+        while pos < end:
+            hi = min(end, pos + chunk)
+            # Overlap the next chunk so a match across the boundary isn't missed.
+            i = bytes(self.read(pos, min(end, hi + len(sub) - 1))).find(sub)
+            if i >= 0:
+                return pos + i
+            pos = hi
+            chunk *= 2
+        return -1
+
+    def rfind(self, sub, start=0, end=None):
+        end = self.size if end is None else min(end, self.size)
+        chunk = self.SEARCH_CHUNK
+        pos = end
+        while pos > start:
+            lo = max(start, pos - chunk)
+            i = bytes(self.read(lo, min(end, pos + len(sub) - 1))).rfind(sub)
+            if i >= 0:
+                return lo + i
+            pos = lo
+            chunk *= 2
+        return -1
+
+    def prefetch(self, start, end):
+        """Hints that start:end is about to be read, sources that fetch in blocks read it all in one go."""
+        pass
+
+    def buffer(self):
+        """The whole source as one buffer (only for full scans like xref recovery)."""
+        return self[0:self.size]
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'size': self.size,
+            'reads': self.reads,
+            'bytes_read': self.bytes_read
+        }
+
+class FileSource(ByteSource):
+    """A local file, one handle and one read-only map for the lifetime of the source.
+
+    Every read is a slice of the map (a memoryview, no copy is made).
+    """
+
+    def __init__(self, fname):
+        super().__init__(abspath(fname))
+        self._file = open(self.name, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        self.size = len(self._map)
+
+    def read(self, start, end):
+        return self._view[start:end]
+
+    def find(self, sub, start=0, end=None):
+        return self._map.find(sub, start, self.size if end is None else end)
+
+    def rfind(self, sub, start=0, end=None):
+        return self._map.rfind(sub, start, self.size if end is None else end)
+
+    def buffer(self):
+        return self._map
+
+    @property
+    def closed(self):
+        return self._map is None
+
+    def close(self):
+        """Unmaps the file, slices that were handed out are no longer valid."""
+        if self._map is None:
+            return
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Somebody is still holding a slice of the map, it gets unmapped once they let go.
+            pass
+        self._file.close()
+        self._map = None
+
+class BytesSource(ByteSource):
+    """A PDF that's already in memory, reads are memoryview slices of it."""
+
+    def __init__(self, data, name='<bytes>'):
+        super().__init__(name, len(data))
+        self._data = data if isinstance(data, (bytes, bytearray)) else bytes(data)
+        self._view = memoryview(self._data)
+
+    def read(self, start, end):
+        return self._view[start:end]
+
+    def find(self, sub, start=0, end=None):
+        return self._data.find(sub, start, self.size if end is None else end)
+
+    def rfind(self, sub, start=0, end=None):
+        return self._data.rfind(sub, start, self.size if end is None else end)
+
+    def buffer(self):
+        return self._data
+
+class BlockSource(ByteSource):
+    """A source that's slow to read from, reads go through a fixed size block cache.
+
+    The data is fetched in aligned `block_size` blocks and the last `max_blocks` of them are kept
+    (LRU). Small reads next to each other (the objects of a page, an xref and its trailer) land
+    in the same block so they only cost one fetch, and the missing blocks of a bigger read are
+    fetched with one read per run of consecutive blocks. Reads wider than half the cache skip it.
+    `fetches` and `bytes_fetched` count what actually went to the underlying file/server.
+    """
+
+    def __init__(self, name, size=0, block_size=64 * 1024, max_blocks=256):
+        super().__init__(name, size)
+        self.block_size = block_size
+        # Searches go a block at a time (at least), every read costs a fetch here.
+        self.SEARCH_CHUNK = max(self.SEARCH_CHUNK, block_size)
+        self.blocks = ObjectCache(max_entries=max_blocks)
+        self.fetches = 0
+        self.bytes_fetched = 0
+
+    def _fetch(self, start, end):
+        """One read of start:end from the underlying file/server."""
+        raise NotImplementedError
+
+    def fetch(self, start, end):
+        data = self._fetch(start, end)
+        self.fetches += 1
+        self.bytes_fetched += len(data)
+        return data
+
+    def _store(self, start, data):
+        """Caches the whole blocks in `data` (which starts at byte `start`)."""
+        bs = self.block_size
+        block = -(-start // bs)
+        while True:
+            lo = block * bs - start
+            if lo >= len(data):
+                break
+            hi = min(lo + bs, len(data))
+            if hi - lo < bs and start + hi < self.size:
+                break
+            self.blocks.put(block, bytes(data[lo:hi]))
+            block += 1
+            if start + hi >= self.size:
+                break
+
+    def read(self, start, end):
+        bs = self.block_size
+        first = start // bs
+        last = (end - 1) // bs
+        if last - first + 1 > (self.blocks.max_entries or 0) // 2:
+            return self.fetch(start, end)
+
+        blocks = [self.blocks.get(b) for b in range(first, last + 1)]
+        i = 0
+        while i < len(blocks):
+            if blocks[i] is not None:
+                i += 1
+                continue
+            j = i
+            while j < len(blocks) and blocks[j] is None:
+                j += 1
+            # One fetch for the whole run of missing blocks.
+            lo = (first + i) * bs
+            data = self.fetch(lo, min(self.size, (first + j) * bs))
+            for k in range(i, j):
+                blocks[k] = data[(k - i) * bs:(k - i + 1) * bs]
+                self.blocks.put(first + k, blocks[k])
+            i = j
+
+        offset = start - first * bs
+        data = blocks[0] if len(blocks) == 1 else b''.join(blocks)
+        return data[offset:offset + end - start]
+
+    def prefetch(self, start, end):
+        end = min(end, self.size)
+        if end > start and (end - 1) // self.block_size - start // self.block_size < (self.blocks.max_entries or 0) // 2:
+            self.read(start, end)
+
+    def close(self):
+        self.blocks.clear()
+        super().close()
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({
+            'fetches': self.fetches,
+            'bytes_fetched': self.bytes_fetched,
+            'block_size': self.block_size,
+            'cache': self.blocks.info()
+        })
+        return stats
+
+class FileObjectSource(BlockSource):
+    """Any seekable file object, i.e. a member of a zip archive opened with ZipFile.open()."""
+
+    def __init__(self, fileobj, name=None, block_size=64 * 1024, max_blocks=256):
+        super().__init__(name or getattr(fileobj, 'name', None) or '<file>', 0, block_size, max_blocks)
+        self._fileobj = fileobj
+        self.size = fileobj.seek(0, io.SEEK_END)
+
+    def _fetch(self, start, end):
+        self._fileobj.seek(start)
+        return self._fileobj.read(end - start)
+
+    def close(self):
+        self._fileobj.close()
+        super().close()
+
+class HttpSource(BlockSource):
+    """A PDF behind HTTP range requests.
+
+    Opening it costs one request, a suffix range for the last two blocks (where startxref, the
+    trailer and usually the xref are) which also says how big the file is. Servers that ignore
+    Range and send the whole file are handled too, the body is then kept as is.
+    """
+    CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+
+    def __init__(self, url, block_size=64 * 1024, max_blocks=256, headers=None, timeout=30):
+        super().__init__(url, 0, block_size, max_blocks)
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        # The whole file when the server doesn't do ranges.
+        self._whole = None
+        self._open()
+
+    def _request(self, byte_range):
+        request = urllib.request.Request(self.url, headers=dict(self.headers, Range=f"bytes={byte_range}"))
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            self.fetches += 1
+            body = response.read()
+            self.bytes_fetched += len(body)
+            return response.status, response.headers.get('Content-Range'), body
+
+    def _open(self):
+        status, content_range, body = self._request(f"-{2 * self.block_size}")
+        m = self.CONTENT_RANGE.match(content_range or '')
+        if status != 206 or m is None:
+            self._whole = body
+            self.size = len(body)
+            return
+        self.size = int(m.group(3))
+        self._store(int(m.group(1)), body)
+
+    def _fetch(self, start, end):
+        if self._whole is not None:
+            return self._whole[start:end]
+        status, content_range, body = self._request(f"{start}-{end - 1}")
+        if status != 206:
+            self._whole = body
+            return body[start:end]
+        return body
+
+    def fetch(self, start, end):
+        # _request does the counting, every request is a fetch.
+        return self._fetch(start, end)
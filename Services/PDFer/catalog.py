@@ -1,61 +1,211 @@
 from .page import Page
+from bisect import bisect_right
+import re
+
+class PageTree:
+    """The /Pages tree read lazily, page n is found by following the /Count of each node down.
+
+    (Source: PDF reference 1.7 Chapter 3, section 6, subsection 2 [3.6.2])
+    Only the nodes on the way to a page and their kids are ever loaded. The running page count
+    of every visited node's kids is kept so the next lookup in the same node is a bisect, kids
+    are only read up to the one that holds the page. Works like a read-only list of page
+    references (len, [i], iteration).
+    """
+    # Deeper than any sane tree, it's only there to stop a /Kids loop.
+    MAX_DEPTH = 64
+    # Counting kids only needs their /Type and /Count, those are picked out of the raw bytes.
+    PAGE_REGEX = re.compile(rb'/Type\s*/Page(?![A-Za-z0-9#])')
+    PAGES_REGEX = re.compile(rb'/Type\s*/Pages(?![A-Za-z0-9#])')
+    COUNT_REGEX = re.compile(rb'/Count\s+(\d+)')
+
+    def __init__(self, pdfdoc, pages_ref):
+        self.document = pdfdoc
+        self.root = pages_ref
+        # { ref[:2]: (kids, ends, leaves) }, ends[i] is the number of pages in kids[:i + 1].
+        self._nodes = {}
+        # Objects read (parsed) from the document so far and kids that were only peeked at.
+        self.loaded = 0
+        self.peeked = 0
+        root = self._get(pages_ref)
+        if root.get('Type') != 'Pages':
+            raise Exception('Invalid page tree node.')
+        self._count = int(root.get('Count', 0))
+
+    def _get(self, ref):
+        self.loaded += 1
+        return self.document.get_object(ref)
+
+    def _node(self, ref):
+        key = ref[:2]
+        node = self._nodes.get(key)
+        if node is None:
+            kids = self._get(ref).get('Kids', [])
+            if isinstance(kids, tuple):
+                kids = self._get(kids)
+            node = self._nodes[key] = (kids, [], [])
+        return node
+
+    @staticmethod
+    def _is_leaf(obj):
+        return obj.get('Type') == 'Page' or 'Kids' not in obj
+
+    def _kid_count(self, ref):
+        """(is a page, number of pages) of a kid, from its raw bytes when they are clear about it."""
+        try:
+            raw = self.document._raw_object(ref)
+        except Exception:
+            raw = None
+        if raw is not None:
+            raw = bytes(raw)
+            page = self.PAGE_REGEX.search(raw)
+            pages = self.PAGES_REGEX.search(raw)
+            counts = self.COUNT_REGEX.findall(raw)
+            if page and not pages and not counts:
+                self.peeked += 1
+                return True, 1
+            if pages and not page and len(counts) == 1:
+                self.peeked += 1
+                return False, int(counts[0])
+        # Anything unusual (i.e. nested dictionaries with their own /Type) gets parsed properly.
+        kid = self._get(ref)
+        if self._is_leaf(kid):
+            return True, 1
+        return False, int(kid.get('Count', 0))
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('page index out of range')
+
+        ref = self.root
+        for _ in range(self.MAX_DEPTH):
+            kids, ends, leaves = self._node(ref)
+            i = bisect_right(ends, index)
+            while i == len(ends):
+                # The page is past every kid counted so far, count the next one.
+                if len(ends) == len(kids):
+                    raise IndexError(f"page {index + 1} is missing from the page tree")
+                leaf, count = self._kid_count(kids[len(ends)])
+                ends.append((ends[-1] if ends else 0) + count)
+                leaves.append(leaf)
+                i = bisect_right(ends, index)
+            if leaves[i]:
+                return kids[i]
+            index -= ends[i - 1] if i else 0
+            ref = kids[i]
+        raise Exception('Page tree is too deep (or has a loop).')
+
+    def __iter__(self):
+        """Every page reference in order, walks the tree depth first."""
+        stack = [iter(self._node(self.root)[0])]
+        seen = {self.root[:2]}
+        while stack:
+            ref = next(stack[-1], None)
+            if ref is None:
+                stack.pop()
+                continue
+            if ref[:2] in seen:
+                continue
+            if self._kid_count(ref)[0]:
+                yield ref
+            elif len(stack) < self.MAX_DEPTH:
+                seen.add(ref[:2])
+                stack.append(iter(self._node(ref)[0]))
 
 class Catalog:
+    # Page attributes a page can get from its ancestors (PDF reference 1.7 Chapter 3, section 6, subsection 2 TABLE 3.27).
+    INHERITABLE = ('Resources', 'MediaBox', 'CropBox', 'Rotate')
 
     def __init__(self, pdfdoc):
         self.document = pdfdoc
         self.root = None
         # The Pages index should be directly associated with the page number as follows:
         # Page_number = index + 1 therefore Page = self.pages[page_number - 1]
-        self.pages = None
+        # Either a PageTree or the references out of a saved index (a list or PageRefs).
+        self._pages = None
+        self._pages_ref = None
+        # The page object of page 1 when the document is linearized (its /O), it's read without the page tree.
+        self.first_page = None
         self.info = {}
+        # Inherited attributes of the page tree nodes, { ref[:2]: { key: value } }.
+        self._inherited = {}
 
-    def _build_page_tree(self, pages_ref):
-        page_tree = self.document.get_object(pages_ref)
-        
-        if page_tree.pop('Type') != 'Pages':
-            raise Exception('Invalid page tree node.')
+    def _inherited_attributes(self, parent):
+        """The attributes a page gets from its /Parent chain, every node on the way is only read once."""
+        chain = []
+        while isinstance(parent, tuple) and parent[:2] not in self._inherited and len(chain) < PageTree.MAX_DEPTH:
+            node = self.document.get_object(parent)
+            chain.append((parent[:2], node))
+            parent = node.get('Parent')
+        attributes = self._inherited.get(parent[:2], {}) if isinstance(parent, tuple) else {}
+        for key, node in reversed(chain):
+            attributes = dict(attributes)
+            attributes.update({k: node[k] for k in self.INHERITABLE if k in node})
+            self._inherited[key] = attributes
+        return attributes
 
-        kids = page_tree.pop('Kids')
+    @property
+    def pages(self):
+        # With a first_page hint the page tree isn't read until some other page is asked for.
+        if self._pages is None and self._pages_ref is not None:
+            self._pages = PageTree(self.document, self._pages_ref)
+        return self._pages
 
-        if page_tree['Count'] == len(kids):
-            return kids
-
-        complete = []
-        for k in kids:
-            complete.extend(self._build_page_tree(k))
-        return complete
+    @pages.setter
+    def pages(self, pages):
+        self._pages = pages
 
     def setup(self, root):
         #TODO: check if catalog is of type Stream.
         catalog = self.document.get_object(root)
 
         # Required
-        if catalog.pop('Type') != 'Catalog':
+        if catalog.get('Type') != 'Catalog':
             raise Exception('Root is not a valid catalog entry.')
 
         self.root = root
         # Required - indirect reference
         # The Pages index should be directly associated with the page number as follows:
-        # Page_number = index + 1 therefore Page = self.pages[page_number - 1] 
-        self.pages = self._build_page_tree(catalog.pop('Pages'))
+        # Page_number = index + 1 therefore Page = self.pages[page_number - 1]
+        self._pages_ref = catalog['Pages']
+        if self.first_page is None:
+            self.pages = PageTree(self.document, self._pages_ref)
         # This is all optional stuff.
         # See https://www.adobe.com/content/dam/acom/en/devnet/pdf/pdf_reference_archive/pdf_reference_1-7.pdf
         # Chapter 3 Section 6.1 TABLE 3.25
         for k, v in catalog.items():
+            if k in ['Type', 'Pages']:
+                continue
             self.info[k.lower()] = v
 
+    def restore(self, catalog, pages):
+        """Sets up the catalog from a previous toJSON() and its page references instead of walking the page tree."""
+        self.root = catalog['root']
+        self.info = catalog['info']
+        self.pages = pages
+
     def get_page(self, page_number):
         """The Pages index should be directly associated with the page number as follows:
-        
+
         Page_number = index + 1 therefore Page = self.pages[page_number - 1]
         """
-        return Page(self.document, self.document.get_object(self.pages[page_number - 1]))
+        if page_number == 1 and self.first_page is not None:
+            page = self.document.get_object(self.first_page)
+            # Linearized files have the attributes on the page itself, the page tree is only read when they're missing.
+            if all(k in page for k in ('Resources', 'MediaBox')):
+                return Page(self.document, page)
+        else:
+            page = self.document.get_object(self.pages[page_number - 1])
+        return Page(self.document, page, self._inherited_attributes(page.get('Parent')))
 
     def toJSON(self):
         return {
             'root': self.root,
             'info': self.info,
             'total_pages': len(self.pages),
-            'pages': self.pages
+            'pages': list(self.pages)
         }
@@ -0,0 +1,229 @@
+from .pdf_scanner import PdfLexer
+from array import array
+from bisect import bisect_right
+from itertools import repeat
+import codecs, sys
+
+class ToUnicodeCMap:
+    """A ToUnicode CMap compiled for decoding the raw bytes of a string.
+
+    (Source: PDF reference 1.7 Chapter 5, section 9, subsection 2 [5.9.2] and Adobe Technical Note #5411)
+    The codespace ranges say how many bytes (1 - 4) make up the next code. Every code length
+    gets its own { code: text } table with the bfchars and the (small) bfranges spelled out,
+    bfranges bigger than EXPAND_LIMIT stay as a sorted range table that is searched with bisect.
+
+    The source entries are kept as the hex strings they were written with, that's what toJSON()
+    saves and the tables get compiled again the first time a restored cmap is used.
+    """
+    # bfranges with more codes than this aren't expanded, i.e. <0000> <FFFF> <0000> would be 65536 entries.
+    EXPAND_LIMIT = 256
+
+    def __init__(self, codespace=None, bf_char=None, bf_range=None):
+        # [(low, high)], [(src, dst)] and [(start, end, [dst, ...])] all as hex strings.
+        self.codespace = codespace or []
+        self.bf_char = bf_char or []
+        self.bf_range = bf_range or []
+        self._compiled = False
+        # Decoding tables for 1 byte codes, { id(fallback): (fallback, table) }.
+        self._byte_tables = {}
+
+    @classmethod
+    def parse(cls, data):
+        """Reads the codespace ranges, bfchars and bfranges out of a decompressed CMap stream."""
+        lexer = PdfLexer()
+        cmap = cls()
+        operands = []
+        # The array being filled in (bfrange destinations), operands collects everything else.
+        arrays = []
+        for kind, start, end in lexer.tokens(data):
+            if kind == PdfLexer.HEXSTRING:
+                val = ''.join(bytes(data[start + 1:end - 1]).decode('ascii').split())
+            elif kind == PdfLexer.ARRAY_OPEN:
+                arrays.append([])
+                continue
+            elif kind == PdfLexer.ARRAY_CLOSE:
+                if arrays:
+                    val = arrays.pop()
+                else:
+                    continue
+            elif kind == PdfLexer.KEYWORD:
+                keyword = bytes(data[start:end])
+                if keyword == b'endcodespacerange':
+                    cmap.codespace.extend(cls._group(operands, 2))
+                elif keyword == b'endbfchar':
+                    cmap.bf_char.extend(cls._group(operands, 2))
+                elif keyword == b'endbfrange':
+                    for src_start, src_end, dst in cls._group(operands, 3):
+                        cmap.bf_range.append((src_start, src_end, dst if isinstance(dst, list) else [dst]))
+                operands = []
+                continue
+            elif kind == PdfLexer.COMMENT:
+                continue
+            else:
+                # Names and numbers (i.e. a bfchar mapped to /space), they don't map to anything.
+                val = None
+            if arrays:
+                arrays[-1].append(val)
+            else:
+                operands.append(val)
+        return cmap
+
+    @staticmethod
+    def _group(operands, size):
+        groups = []
+        for i in range(0, len(operands) - size + 1, size):
+            group = operands[i:i + size]
+            # The source codes have to be hex strings, the destination can be hex or an array of them.
+            if all(isinstance(g, str) for g in group[:-1]) and group[-1] is not None:
+                groups.append(tuple(group))
+        return groups
+
+    @classmethod
+    def fromJSON(cls, data):
+        if data is None:
+            return None
+        if 'codespace' not in data:
+            # An old { 'hex code': 'character' } cmap out of a saved index.
+            return cls(bf_char=[(k, v.encode('utf-16-be', 'surrogatepass').hex()) for k, v in data.items()])
+        return cls(data['codespace'], data['bf_char'], data['bf_range'])
+
+    def toJSON(self):
+        return {
+            'codespace': self.codespace,
+            'bf_char': self.bf_char,
+            'bf_range': self.bf_range
+        }
+
+    @staticmethod
+    def _code(hex_code):
+        return len(hex_code) + 1 >> 1, int(hex_code or '0', 16)
+
+    @staticmethod
+    def _text(hex_text):
+        """Destinations are UTF-16BE, more than one character for ligatures (i.e. 'ffi')."""
+        b = bytes.fromhex(hex_text + '0' * (len(hex_text) & 1))
+        if len(b) & 1:
+            b = b'\x00' + b
+        return b.decode('utf-16-be', 'surrogatepass')
+
+    def _compile(self):
+        # { code length: { code: text } } and { code length: ([starts], [(start, end, text)]) }
+        self._maps = {}
+        ranges = {}
+        for src, dst in self.bf_char:
+            if not isinstance(dst, str):
+                continue
+            n, code = self._code(src)
+            self._maps.setdefault(n, {})[code] = self._text(dst)
+
+        for src_start, src_end, dst in self.bf_range:
+            n, first = self._code(src_start)
+            last = self._code(src_end)[1]
+            if last < first or not dst:
+                continue
+            table = self._maps.setdefault(n, {})
+            if len(dst) > 1 or last - first < self.EXPAND_LIMIT:
+                for offset, code in enumerate(range(first, last + 1)):
+                    text = self._range_text(dst, offset)
+                    if text is not None:
+                        table[code] = text
+            else:
+                ranges.setdefault(n, []).append((first, last, self._text(dst[0])))
+        self._ranges = {n: ([r[0] for r in sorted(entries)], sorted(entries)) for n, entries in ranges.items()}
+
+        # Without codespace ranges (plenty of ToUnicode maps skip them) the code lengths are whatever the entries use.
+        spaces = []
+        for low, high in self.codespace:
+            if not (isinstance(low, str) and isinstance(high, str)):
+                continue
+            n = len(low) + 1 >> 1
+            spaces.append((n, bytes.fromhex(low.zfill(2 * n)), bytes.fromhex(high.zfill(2 * n))))
+        if not spaces:
+            spaces = [(n, bytes(n), b'\xff' * n) for n in sorted(set(self._maps) | set(self._ranges))] or [(1, b'\x00', b'\xff')]
+        spaces.sort(key=lambda s: s[0])
+        # A little trie, the codespaces that can start with each lead byte (shortest first).
+        self._lead = [[s for s in spaces if s[1][0] <= b <= s[2][0]] for b in range(256)]
+        self._shortest = spaces[0][0]
+        widths = {s[0] for s in spaces}
+        self._width = widths.pop() if len(widths) == 1 else None
+        self._compiled = True
+
+    def _range_text(self, dst, offset):
+        if len(dst) > 1:
+            return self._text(dst[offset]) if offset < len(dst) and isinstance(dst[offset], str) else None
+        if not isinstance(dst[0], str):
+            return None
+        # The last character of the destination goes up with the code.
+        text = self._text(dst[0])
+        return text[:-1] + chr(ord(text[-1]) + offset) if text else None
+
+    def _lookup(self, n, code):
+        text = self._maps.get(n, {}).get(code)
+        if text is not None or n not in self._ranges:
+            return text
+        starts, entries = self._ranges[n]
+        i = bisect_right(starts, code) - 1
+        if i >= 0 and code <= entries[i][1]:
+            text = entries[i][2]
+            return text[:-1] + chr(ord(text[-1]) + code - entries[i][0])
+        return None
+
+    def _byte_table(self, fallback):
+        """The 256 entry table for 1 byte codes, codes without a mapping come from the font's own encoding."""
+        entry = self._byte_tables.get(id(fallback))
+        if entry is not None and entry[0] is fallback:
+            return entry[1]
+        chars = []
+        for b in range(256):
+            text = self._lookup(1, b)
+            chars.append(text if text is not None else (fallback[b] if fallback else ''))
+        # charmap_decode wants exactly one character per code.
+        table = ''.join(chars) if all(len(c) == 1 for c in chars) else chars
+        self._byte_tables[id(fallback)] = (fallback, table)
+        return table
+
+    def decode(self, raw, fallback=None):
+        """Decodes the raw bytes of a string, `fallback` is a 256 character table for unmapped 1 byte codes."""
+        if not self._compiled:
+            self._compile()
+        if not raw:
+            return ''
+
+        if self._width == 1:
+            table = self._byte_table(fallback)
+            if isinstance(table, str):
+                return codecs.charmap_decode(raw, 'strict', table)[0]
+            return ''.join([table[b] for b in raw])
+
+        if self._width == 2:
+            # Two byte codes (Identity-H and most CID fonts), the codes are one array of big endian shorts.
+            codes = array('H', raw[:len(raw) & ~1])
+            if sys.byteorder == 'little':
+                codes.byteswap()
+            get = self._maps.get(2, {}).get
+            if 2 not in self._ranges:
+                return ''.join(map(get, codes, repeat('')))
+            lookup = self._lookup
+            return ''.join([get(c) or lookup(2, c) or '' for c in codes])
+
+        text = []
+        i = 0
+        size = len(raw)
+        lead = self._lead
+        while i < size:
+            for n, low, high in lead[raw[i]]:
+                code = raw[i:i + n]
+                if len(code) == n and all(low[k] <= code[k] <= high[k] for k in range(1, n)):
+                    break
+            else:
+                # Not in any codespace, skip as many bytes as the shortest code.
+                i += self._shortest
+                continue
+            i += n
+            if n == 1:
+                text.append(self._byte_table(fallback)[code[0]])
+                continue
+            char = self._lookup(n, int.from_bytes(code, 'big'))
+            if char is not None:
+                text.append(char)
+        return ''.join(text)
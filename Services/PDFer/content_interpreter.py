@@ -0,0 +1,271 @@
+from .pdf_scanner import PdfLexer
+import collections, math, re
+
+# One shown string, x/y is where it starts on the page (default user space), size is the font size
+# after the text and graphics matrices and width is how far the text moved along x.
+TextRun = collections.namedtuple('TextRun', ['x', 'y', 'font', 'size', 'text', 'width'])
+
+class ContentInterpreter:
+    """Runs a page's content stream in one pass and emits positioned TextRuns.
+
+    (Source: PDF reference 1.7 Chapter 5, section 3 [5.3] Text Objects and Table 4.7)
+    The tokens come straight from the PdfLexer, operands are kept as (kind, start, end) and only
+    turned into numbers/strings when an operator actually needs them, so the path and color
+    operators that make up most of a page cost next to nothing. Only the state that moves text
+    around is tracked: the CTM (cm, q/Q), the text and line matrices (Tm, Td, TD, T*, ', ")
+    and the text state (Tf, Tc, Tw, Tz, TL, Ts).
+    """
+    IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    # Inline image data (BI ... ID <data> EI) is binary, it's skipped up to an EI surrounded by whitespace.
+    INLINE_IMAGE_END = re.compile(rb'[\x00\t\n\f\r ]EI(?=[\x00\t\n\f\r ]|$)')
+    # A TJ adjustment that moves right more than this (thousandths of an em) is a word break.
+    SPACE_ADJUSTMENT = 200
+
+    def __init__(self, fonts=None):
+        # { font_name: Font } for the page, see FontTable.page_fonts.
+        self.fonts = fonts or {}
+        self.lexer = PdfLexer()
+        # Operators run so far, for throughput numbers.
+        self.operators = 0
+        self._handlers = {
+            b'q': self._save,
+            b'Q': self._restore,
+            b'cm': self._concat,
+            b'BT': self._begin_text,
+            b'Tf': self._set_font,
+            b'Tc': self._set_char_spacing,
+            b'Tw': self._set_word_spacing,
+            b'Tz': self._set_scale,
+            b'TL': self._set_leading,
+            b'Ts': self._set_rise,
+            b'Td': self._move,
+            b'TD': self._move_set_leading,
+            b'Tm': self._set_matrix,
+            b'T*': self._next_line,
+            b'Tj': self._show,
+            b'TJ': self._show_array,
+            b"'": self._next_line_show,
+            b'"': self._next_line_show_spaced
+        }
+        self._reset()
+
+    def _reset(self):
+        self.ctm = self.IDENTITY
+        self.tm = self.IDENTITY
+        self.tlm = self.IDENTITY
+        self.font_name = None
+        self.font = None
+        self.size = 0.0
+        self.char_spacing = 0.0
+        self.word_spacing = 0.0
+        self.scale = 1.0
+        self.leading = 0.0
+        self.rise = 0.0
+        self._stack = []
+
+    @staticmethod
+    def multiply(m, n):
+        """m x n for the [a b c d e f] matrices PDF uses."""
+        a, b, c, d, e, f = m
+        A, B, C, D, E, F = n
+        return (a * A + b * C, a * B + b * D, c * A + d * C, c * B + d * D, e * A + f * C + E, e * B + f * D + F)
+
+    def runs(self, data):
+        """Yields a TextRun for every string shown in `data` (decompressed content stream bytes)."""
+        self._reset()
+        self._data = data
+        tokens = self.lexer.tokens
+        handlers = self._handlers
+        keyword = PdfLexer.KEYWORD
+        pos = 0
+        end = len(data)
+        while pos < end:
+            restart = None
+            operands = []
+            # Operand lists of the arrays/dicts that are still open.
+            nested = []
+            for kind, start, stop in tokens(data, pos=pos):
+                if kind == keyword and not nested:
+                    self.operators += 1
+                    handler = handlers.get(data[start:stop])
+                    if handler is not None:
+                        try:
+                            run = handler(operands)
+                        except (IndexError, ValueError, TypeError):
+                            # Missing or broken operands, skip the operator like a viewer would.
+                            run = None
+                        if run is not None:
+                            yield run
+                    elif data[start:stop] == b'ID':
+                        mo = self.INLINE_IMAGE_END.search(data, stop + 1)
+                        restart = mo.end() if mo else end
+                        break
+                    operands = []
+                elif kind == PdfLexer.ARRAY_OPEN or kind == PdfLexer.DICT_OPEN:
+                    nested.append(operands)
+                    operands = []
+                elif kind == PdfLexer.ARRAY_CLOSE or kind == PdfLexer.DICT_CLOSE:
+                    if nested:
+                        inner = operands
+                        operands = nested.pop()
+                        operands.append(inner)
+                elif kind != PdfLexer.COMMENT:
+                    operands.append((kind, start, stop))
+            if restart is None:
+                break
+            pos = restart
+        self._data = None
+
+    def _number(self, operand):
+        kind, start, stop = operand
+        return float(self._data[start:stop])
+
+    def _numbers(self, operands, count):
+        return [self._number(o) for o in operands[-count:]] if len(operands) >= count else None
+
+    def _string(self, operand):
+        kind, start, stop = operand
+        if kind != PdfLexer.STRING and kind != PdfLexer.HEXSTRING:
+            return None
+        return PdfLexer.string_value(self._data, start, stop)
+
+    def _save(self, operands):
+        self._stack.append((self.ctm, self.font_name, self.font, self.size, self.char_spacing,
+                            self.word_spacing, self.scale, self.leading, self.rise))
+
+    def _restore(self, operands):
+        if self._stack:
+            (self.ctm, self.font_name, self.font, self.size, self.char_spacing,
+             self.word_spacing, self.scale, self.leading, self.rise) = self._stack.pop()
+
+    def _concat(self, operands):
+        m = self._numbers(operands, 6)
+        if m is not None:
+            self.ctm = self.multiply(m, self.ctm)
+
+    def _begin_text(self, operands):
+        self.tm = self.tlm = self.IDENTITY
+
+    def _set_font(self, operands):
+        kind, start, stop = operands[-2]
+        self.font_name = bytes(self._data[start + 1:stop]).decode('latin-1')
+        self.font = self.fonts.get(self.font_name)
+        self.size = self._number(operands[-1])
+
+    def _set_char_spacing(self, operands):
+        self.char_spacing = self._number(operands[-1])
+
+    def _set_word_spacing(self, operands):
+        self.word_spacing = self._number(operands[-1])
+
+    def _set_scale(self, operands):
+        self.scale = self._number(operands[-1]) / 100
+
+    def _set_leading(self, operands):
+        self.leading = self._number(operands[-1])
+
+    def _set_rise(self, operands):
+        self.rise = self._number(operands[-1])
+
+    def _translate(self, tx, ty):
+        self.tlm = self.multiply((1.0, 0.0, 0.0, 1.0, tx, ty), self.tlm)
+        self.tm = self.tlm
+
+    def _move(self, operands):
+        tx, ty = self._numbers(operands, 2)
+        self._translate(tx, ty)
+
+    def _move_set_leading(self, operands):
+        tx, ty = self._numbers(operands, 2)
+        self.leading = -ty
+        self._translate(tx, ty)
+
+    def _set_matrix(self, operands):
+        m = self._numbers(operands, 6)
+        if m is not None:
+            self.tm = self.tlm = tuple(m)
+
+    def _next_line(self, operands=None):
+        self._translate(0.0, -self.leading)
+
+    def _show(self, operands):
+        return self._show_strings([self._string(operands[-1])])
+
+    def _show_array(self, operands):
+        items = []
+        for o in operands[-1]:
+            if isinstance(o, tuple):
+                items.append(self._number(o) if o[0] == PdfLexer.NUMBER else self._string(o))
+        return self._show_strings(items)
+
+    def _next_line_show(self, operands):
+        self._next_line()
+        return self._show(operands)
+
+    def _next_line_show_spaced(self, operands):
+        self.word_spacing = self._number(operands[-3])
+        self.char_spacing = self._number(operands[-2])
+        self._next_line()
+        return self._show(operands)
+
+    def _decode(self, raw):
+        if self.font is None:
+            return raw.decode('latin-1'), (len(raw) * 0.5, len(raw), raw.count(32))
+        return self.font.decode(raw), self.font.text_width(raw)
+
+    def _show_strings(self, items):
+        """Shows the strings (and TJ adjustments) in `items`, returns the TextRun for all of them."""
+        trm = self.multiply(self.tm, self.ctm)
+        x = trm[4] + self.rise * trm[2]
+        y = trm[5] + self.rise * trm[3]
+
+        text = []
+        tx = 0.0
+        for item in items:
+            if item is None:
+                continue
+            if isinstance(item, float):
+                # TJ adjustment in thousandths of an em, positive moves left.
+                tx -= item / 1000 * self.size * self.scale
+                if -item > self.SPACE_ADJUSTMENT and text and not text[-1].endswith(' '):
+                    text.append(' ')
+                continue
+            chars, (width, codes, spaces) = self._decode(item)
+            text.append(chars)
+            tx += (width * self.size + codes * self.char_spacing + spaces * self.word_spacing) * self.scale
+
+        self.tm = self.multiply((1.0, 0.0, 0.0, 1.0, tx, 0.0), self.tm)
+        text = ''.join(text)
+        if not text:
+            return None
+        size = self.size * math.hypot(trm[2], trm[3])
+        return TextRun(x, y, self.font_name, size, text, self.multiply(self.tm, self.ctm)[4] - trm[4])
+
+    @staticmethod
+    def lines(runs):
+        """Puts the runs in reading order, top to bottom then left to right, returns one str per line.
+
+        Runs are on the same line when their baselines are within half a font size. A space is
+        added between runs when there's a gap of more than a fifth of the font size between them.
+        """
+        ordered = sorted(runs, key=lambda r: (-r.y, r.x))
+        grouped = []
+        for run in ordered:
+            if grouped:
+                line = grouped[-1]
+                if abs(line[0].y - run.y) <= max(line[0].size, run.size, 1.0) * 0.5:
+                    line.append(run)
+                    continue
+            grouped.append([run])
+
+        lines = []
+        for line in grouped:
+            line.sort(key=lambda r: r.x)
+            text = [line[0].text]
+            for prev, run in zip(line, line[1:]):
+                gap = run.x - (prev.x + prev.width)
+                if gap > max(run.size, 1.0) * 0.2 and not prev.text.endswith(' ') and not run.text.startswith(' '):
+                    text.append(' ')
+                text.append(run.text)
+            lines.append(''.join(text))
+        return lines
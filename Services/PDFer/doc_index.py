@@ -0,0 +1,170 @@
+from array import array
+from os.path import abspath, expanduser, join, exists
+import os, mmap, struct, marshal, hashlib, tempfile
+
+class DirectoryStore:
+    """Keeps document indexes as files in a local directory, loaded back as memory maps."""
+
+    def __init__(self, path=None):
+        self.path = path or join(expanduser('~'), '.cache', 'fungrams', 'pdfer')
+        os.makedirs(self.path, exist_ok=True)
+
+    def _fname(self, key):
+        return join(self.path, f"{key}.idx")
+
+    def get(self, key):
+        fname = self._fname(key)
+        if not exists(fname):
+            return None
+        with open(fname, 'rb') as f:
+            # The map stays valid after the file is closed.
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def set(self, key, value):
+        # Write then rename so a reader never sees half of an index.
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        os.replace(tmp, self._fname(key))
+
+    def delete(self, key):
+        if exists(self._fname(key)):
+            os.remove(self._fname(key))
+
+class MemoryStore:
+    """In-process stand-in for a redis client, only `get`, `set` and `delete` are needed."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = bytes(value)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+class RedisStore:
+    """Keeps document indexes in redis, or anything else with a redis-like get/set/delete."""
+
+    def __init__(self, client, prefix='fungrams:pdfer:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return memoryview(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, bytes(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+class PageRefs:
+    """The page references of a DocIndex read lazily out of its int64 (obj_number, gen_number) pairs."""
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def __len__(self):
+        return len(self.pairs) // 2
+
+    def __getitem__(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('page index out of range')
+        return (self.pairs[2 * index], self.pairs[2 * index + 1], 'R')
+
+    def __iter__(self):
+        for i in range(0, len(self.pairs), 2):
+            yield (self.pairs[i], self.pairs[i + 1], 'R')
+
+class DocIndex:
+    """Everything needed to reopen a PDF without parsing its xref, trailer, or page tree again.
+
+    Binary layout (little endian):
+        header  - magic, xref_start, object count, page count, meta length
+        starts  - int64 * object count
+        ends    - int64 * object count
+        pages   - int64 * page count * 2 (obj_number, gen_number)
+        meta    - marshal'd dict of the trailer, compressed objects, catalog info (without the pages) and fonts
+
+    The arrays are read straight out of the loaded buffer with memoryview.cast so nothing is copied,
+    the pages come back as PageRefs over theirs.
+    """
+    MAGIC = b'PDFIDX01'
+    HEADER = struct.Struct('<8sqqqq')
+
+    def __init__(self, xref_start, starts, ends, pages, trailer, compressed=None, catalog=None, fonts=None):
+        self.xref_start = xref_start
+        self.starts = starts
+        self.ends = ends
+        # Page references in page order [(obj_number, gen_number, 'R'), ...] or PageRefs when loaded.
+        self.pages = pages
+        self.trailer = trailer
+        self.compressed = compressed or {}
+        self.catalog = catalog or {}
+        self.fonts = fonts or {}
+
+    @staticmethod
+    def key(fname, content_hash=False):
+        """Cache key from the path, size and modified time, or from the file's contents."""
+        fname = abspath(fname)
+        if content_hash:
+            h = hashlib.sha1()
+            with open(fname, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            return h.hexdigest()
+        st = os.stat(fname)
+        return hashlib.sha1(f"{fname}:{st.st_size}:{st.st_mtime_ns}".encode('utf-8')).hexdigest()
+
+    def dumps(self):
+        pages = array('q')
+        for p in self.pages:
+            pages.extend(p[:2])
+        meta = marshal.dumps({
+            'trailer': self.trailer,
+            'compressed': self.compressed,
+            # The pages are only in the binary section.
+            'catalog': {k: v for k, v in self.catalog.items() if k != 'pages'},
+            'fonts': self.fonts
+        })
+        header = self.HEADER.pack(self.MAGIC, self.xref_start, len(self.starts), len(self.pages), len(meta))
+        return b''.join([header, array('q', self.starts).tobytes(), array('q', self.ends).tobytes(), pages.tobytes(), meta])
+
+    @classmethod
+    def loads(cls, buff):
+        buff = memoryview(buff)
+        magic, xref_start, n_objects, n_pages, n_meta = cls.HEADER.unpack_from(buff)
+        if magic != cls.MAGIC:
+            raise Exception('Not a PDFer document index.')
+
+        pos = cls.HEADER.size
+        starts = buff[pos:pos + 8 * n_objects].cast('q')
+        pos += 8 * n_objects
+        ends = buff[pos:pos + 8 * n_objects].cast('q')
+        pos += 8 * n_objects
+        pages = buff[pos:pos + 16 * n_pages].cast('q')
+        pos += 16 * n_pages
+        meta = marshal.loads(buff[pos:pos + n_meta])
+
+        return cls(xref_start, starts, ends, PageRefs(pages), meta['trailer'], meta['compressed'], meta['catalog'], meta['fonts'])
+
+    @classmethod
+    def load(cls, store, fname, content_hash=False):
+        buff = store.get(cls.key(fname, content_hash))
+        if buff is None:
+            return None
+        try:
+            return cls.loads(buff)
+        except Exception:
+            return None
+
+    def save(self, store, fname, content_hash=False):
+        store.set(self.key(fname, content_hash), self.dumps())
@@ -1,138 +1,282 @@
-import math, io, zlib
+import math, struct, zlib
+import numpy as np
+import cv2 as cv
 
 class FilterHelper:
     """Static methods to help reformat/unfilter compressed streams."""
     @staticmethod
     def tiff_prediction(bits_per_component, colors, columns, row_size, bpp, data):
-        """Not yet implemented! only works on single row!"""
-        # initialize the prediction line to all zeros
-        predline = [0] * row_size
-        # Might want to do separate methods
-        if bits_per_component == 1:
-
-            buff_in = predline[bpp - 1]
-            for i in range(bpp, row_size, 8):
-                buff_in = (buff_in << 8) | predline[i]
-                predline[i] ^= buff_in >> colors
-
-        elif bits_per_component == 8:
-            for i in range(bpp, row_size):
-                predline[i] += predline[i - colors]
-        else:
-            up_left_buffer = [0] * (colors + 1)
-            bit_mask = (1 << bits_per_component) - 1
-            
-            buff_in = 0
-            buff_out = 0
-            
-            bits_in = 0
-            bits_out = 0
-            
-            j = bpp
-            k = bpp
-            for a in range(0, columns):
-                for b in range(0, colors):
-                    if bits_in < bits_per_component:
-                        j += 1
-                        buff_in = (buff_in << 8) | (predline[j] & 255)
-                        bits_in += 8
-
-                    up_left_buffer[b] += (buff_in >> (bits_in - bits_per_component)) & bit_mask
-
-                    bits_in -= bits_per_component
-                    buff_out = (buff_out << bits_per_component) | up_left_buffer[b]
-                    bits_out += bits_per_component
-                    if bits_out >= bits_per_component:
-                        k += 1
-                        predline[k] = buff_out >> (bits_out - 8)
-                        bits_out -= 8
-
-            if bits_out > 0:
-                k += 1
-                predline[k] = (buff_out << (8 - bits_out)) + (buff_in & ((1 << (8 - bits_out)) - 1))
-
-        return final
+        """TIFF Predictor 2, every sample is stored as the difference from the same color component to its left.
+
+        Returns a (rows, row_size - bpp) uint8 array. Undoing it is a running sum along each row
+        (per color component) which wraps around at the sample size.
+        """
+        row_bytes = row_size - bpp
+        data = np.frombuffer(data, dtype=np.uint8)
+        rows = len(data) // row_bytes
+        data = data[:rows * row_bytes].reshape(rows, row_bytes)
+
+        if bits_per_component == 8:
+            samples = data[:, :columns * colors].reshape(rows, columns, colors)
+            out = data.copy()
+            out[:, :columns * colors] = np.cumsum(samples, axis=1, dtype=np.uint8).reshape(rows, -1)
+            return out
+
+        if bits_per_component == 16:
+            samples = data[:, :columns * colors * 2].view('>u2').reshape(rows, columns, colors)
+            out = data.copy()
+            out[:, :columns * colors * 2] = np.cumsum(samples, axis=1, dtype=np.uint16).astype('>u2').reshape(rows, -1).view(np.uint8)
+            return out
+
+        # 1, 2 and 4 bit samples, unpack them to one sample per byte first.
+        bits = np.unpackbits(data, axis=1)[:, :columns * colors * bits_per_component]
+        shifts = np.arange(bits_per_component - 1, -1, -1, dtype=np.uint8)
+        samples = (bits.reshape(rows, columns, colors, bits_per_component) << shifts).sum(axis=3, dtype=np.uint8)
+        samples = np.cumsum(samples, axis=1, dtype=np.uint8) & ((1 << bits_per_component) - 1)
+        bits = (samples[..., None] >> shifts) & 1
+        out = np.packbits(bits.reshape(rows, -1), axis=1)
+        return out[:, :row_bytes]
+
+    # Bytes per pixel -> (bit depth, color type) of a PNG image with that many bytes per pixel, see _png_libpng.
+    PNG_LAYOUTS = {1: (8, 0), 2: (16, 0), 3: (8, 2), 4: (8, 6), 6: (16, 2), 8: (16, 6)}
 
     @staticmethod
-    def png_prediction(columns, row_size, bpp, data):
+    def png_prediction(columns, row_size, bpp, data, prev=None, libpng=True):
         """ Sources:
         * https://github.com/davidben/poppler/blob/master/poppler/Stream.cc
         * https://github.com/davidben/poppler
         * https://www.w3.org/TR/PNG-Filters.html
+
+        Every row is prefaced with its PNG filter byte, returns the unfiltered rows as a
+        (rows, row_size - bpp) uint8 array. `prev` is the row above the first one (zeros by default).
+        None/Sub/Up rows are undone with whole array operations. Average/Paeth rows need the
+        sample to their left first, so when there are any the rows go through libpng if there is a
+        PNG layout with the same bytes per pixel (see _png_libpng). Otherwise (or with libpng=False)
+        short runs of them are done one row at a time and long runs a diagonal at a time.
         """
-        k = 0
-        # initialize the prediction line to all zeros
-        predline = [0] * row_size
-        final = []
-        while k < len(data):
-            # Each row is prefaced with a 'prediction'
-            curr_pred = data[k]
-            # "Cut off" the prediction byte
-            k += 1
-            # initialize an empty up_left_buffer (only used for paeth prediction)
-            up_left_buffer = [0] * (bpp + 1)
-            # iterate through the row/line
-            for i in range(bpp, row_size):
-                # just in case
-                try:
-                    raw = data[k]
-                    k += 1
-                except Exception as e:
-                    break
-
-                # This conditional is evalulated per line/row(AKA: curr_pred shouldn't change in this for loop)
-                if curr_pred == 1:
-                    # PNG(1) Sub
-                    predline[i] = predline[i - bpp] + raw
-                elif curr_pred == 2:
-                    # PNG(2) Up
-                    predline[i] += raw
-                elif curr_pred == 3:
-                    # PNG(3) Average
-                    predline[i] = ((predline[i - bpp] + predline[i]) >> 1) + raw
-                elif curr_pred == 4:
-                    # PNG(4) Paeth
-                    # slide the up_left_buffer one over to the right
-                    for j in range(bpp, 0, -1):
-                        up_left_buffer[j] = up_left_buffer[j - 1]
-                    # set the start of the up_left_buffer to the current
-                    up_left_buffer[0] = predline[i]
-
-                    predline[i] = self._paeth_predictor(predline[i - bpp], predline[i], up_left_buffer[bpp]) + raw
-                else:
-                    # PNG(0) No prediction
-                    predline[i] = raw
-            # Each row/line is buffered by the previous line's pixel which eqauls bpp
-            final.append(predline[bpp:row_size])
-
-        return final
+        row_bytes = row_size - bpp
+        data = np.frombuffer(data, dtype=np.uint8)
+        rows = len(data) // (row_bytes + 1)
+        data = data[:rows * (row_bytes + 1)].reshape(rows, row_bytes + 1)
+        types = data[:, 0]
+        if libpng and rows and types.max() >= 3:
+            out = FilterHelper._png_libpng(data, row_bytes, bpp, prev)
+            if out is not None:
+                return out
+
+        raw = data[:, 1:]
+        out = np.empty((rows, row_bytes), dtype=np.uint8)
+        above = np.zeros(row_bytes, dtype=np.uint8) if prev is None else np.frombuffer(bytes(prev), dtype=np.uint8)
+
+        for start, end, wavefront in FilterHelper._png_runs(types):
+            if wavefront:
+                FilterHelper._png_wavefront(raw[start:end], types[start:end], above, bpp, out[start:end])
+            elif types[start] >= 3:
+                # PNG(3) Average and PNG(4) Paeth, a row at a time.
+                for k in range(start, end):
+                    solve = FilterHelper._png_average_row if types[k] == 3 else FilterHelper._png_paeth_row
+                    out[k] = solve(raw[k], above, bpp)
+                    above = out[k]
+            elif types[start] == 2:
+                # PNG(2) Up, a running sum down the columns.
+                out[start:end] = np.cumsum(raw[start:end], axis=0, dtype=np.uint8) + above
+            elif types[start] == 1:
+                # PNG(1) Sub, a running sum along the row for each byte of the pixel.
+                pad = -row_bytes % bpp
+                padded = np.pad(raw[start:end], ((0, 0), (0, pad)))
+                summed = np.cumsum(padded.reshape(end - start, -1, bpp), axis=1, dtype=np.uint8)
+                out[start:end] = summed.reshape(end - start, -1)[:, :row_bytes]
+            else:
+                # PNG(0) No prediction
+                out[start:end] = raw[start:end]
+            above = out[end - 1]
+
+        return out
 
     @staticmethod
-    def _paeth_predictor(left, above, upper_left):
-        """Reverses the paeth prediction."""
-        # Source: https://www.w3.org/TR/PNG-Filters.html
-        initial_estimate = left + above - upper_left
-
-        distance_left = abs(initial_estimate - left)
-        distance_above = abs(initial_estimate - above)
-        distance_upper_left = abs(initial_estimate - upper_left)
-        
-        if distance_left <= distance_above and distance_left <= distance_upper_left:
-            return left
-        elif distance_above <= distance_upper_left:
-            return above
-        else:
-            return upper_left
+    def _png_libpng(data, row_bytes, bpp, prev):
+        """Undoes the filters of the (rows, 1 + row_bytes) `data` with libpng (through OpenCV's PNG decoder).
+
+        The filters only ever look at bytes and the bytes per pixel, so the rows are wrapped up as a
+        PNG image with the same bytes per pixel (a stored, uncompressed zlib stream) whatever the
+        colors and bits per component really are. `prev` goes in front as an unfiltered extra row.
+        Returns None when there's no such layout or the decoder turns the image down.
+        """
+        layout = FilterHelper.PNG_LAYOUTS.get(bpp)
+        if layout is None or row_bytes % bpp:
+            return None
+        depth, color_type = layout
+        width = row_bytes // bpp
+        rows = len(data)
+        if prev is not None:
+            data = np.vstack([np.frombuffer(b'\x00' + bytes(prev), dtype=np.uint8), data])
+
+        def chunk(kind, body):
+            return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(body, zlib.crc32(kind)))
+
+        png = b''.join([
+            b'\x89PNG\r\n\x1a\n',
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, len(data), depth, color_type, 0, 0, 0)),
+            chunk(b'IDAT', zlib.compress(data.tobytes(), 0)),
+            chunk(b'IEND', b'')
+        ])
+        try:
+            image = cv.imdecode(np.frombuffer(png, dtype=np.uint8), cv.IMREAD_UNCHANGED)
+        except cv.error:
+            return None
+        if image is None:
+            return None
+
+        # OpenCV hands back BGR(A) and 16 bit samples in native byte order.
+        if color_type == 2:
+            image = image[..., ::-1]
+        elif color_type == 6:
+            image = image[..., [2, 1, 0, 3]]
+        image = np.ascontiguousarray(image, dtype='>u2' if depth == 16 else np.uint8)
+        out = image.view(np.uint8).reshape(len(data), row_bytes)
+        return out[len(data) - rows:]
+
+    @staticmethod
+    def _png_runs(types, min_run=32):
+        """Splits the rows into (start, end, wavefront) runs of the same filter.
+
+        Average/Paeth rows next to each other are one run, when there's at least `min_run` of them
+        they're done together in the wavefront, fewer go a row at a time.
+        """
+        changes = np.flatnonzero(np.diff(types)) + 1
+        bounds = [0] + changes.tolist() + [len(types)]
+        runs = []
+        for start, end in zip(bounds, bounds[1:]):
+            if types[start] >= 3 and runs and types[runs[-1][0]] >= 3:
+                start = runs.pop()[0]
+            runs.append((start, end, types[start] >= 3 and end - start >= min_run))
+        return runs
+
+    @staticmethod
+    def _png_lanes(row, bpp):
+        """A row as (bpp, pixels) int16, one lane per byte of the pixel (padded to whole pixels)."""
+        pad = -len(row) % bpp
+        return np.pad(row, (0, pad)).reshape(-1, bpp).T.astype(np.int16)
+
+    @staticmethod
+    def _png_row(lanes, row_bytes):
+        return lanes.T.reshape(-1)[:row_bytes].astype(np.uint8)
+
+    @staticmethod
+    def _png_average_row(raw, above, bpp):
+        """One PNG(3) Average row, x[j] = raw[j] + (x[j - 1] + up[j]) // 2 along every lane.
+
+        The halving makes it nonlinear, so it's solved by iterating x = f(x) over the whole row:
+        once nothing changes every sample agrees with the one to its left, which is the one
+        exact solution. Every pass fixes at least one more sample, and since the left sample's
+        error is halved on the way most rows are exact after a few dozen passes.
+        """
+        r = FilterHelper._png_lanes(raw, bpp)
+        up = FilterHelper._png_lanes(above, bpp)
+        x = up.copy()
+        left = np.zeros_like(x)
+        while True:
+            left[:, 1:] = x[:, :-1]
+            new = (r + ((left + up) >> 1)) & 255
+            if np.array_equal(new, x):
+                return FilterHelper._png_row(x, len(raw))
+            x = new
+
+    @staticmethod
+    def _png_paeth_row(raw, above, bpp):
+        """One PNG(4) Paeth row, solved by iterating like _png_average_row.
+
+        Every pass picks the predictor of each sample from the current guess of its left neighbour,
+        the samples that take the up or up left one start a new segment and the ones that take
+        the left one are a running sum from there, so a whole run of left predictions is fixed in
+        one pass. It's done when the picks stop changing.
+        """
+        r = FilterHelper._png_lanes(raw, bpp)
+        b = FilterHelper._png_lanes(above, bpp)
+        lanes, pixels = r.shape
+        c = np.zeros_like(b)
+        c[:, 1:] = b[:, :-1]
+        pa = np.abs(b - c)
+        index = np.broadcast_to(np.arange(pixels), (lanes, pixels))
+        base = (np.arange(lanes) * pixels)[:, None]
+        x = b.copy()
+        left = np.zeros_like(x)
+        while True:
+            left[:, 1:] = x[:, :-1]
+            pb = np.abs(left - c)
+            pc = np.abs(left + b - 2 * c)
+            use_left = (pa <= pb) & (pa <= pc)
+            v = r + np.where(pb <= pc, b, c)
+            np.copyto(v, r, where=use_left)
+            # Where the segment of every sample starts, its value there has no left part.
+            start = np.where(use_left, 0, index)
+            np.maximum.accumulate(start, axis=1, out=start)
+            summed = np.cumsum(v, axis=1)
+            new = (summed - summed.reshape(-1)[base + start] + v.reshape(-1)[base + start]) & 255
+            if np.array_equal(new, x):
+                return FilterHelper._png_row(x, len(raw))
+            x = new
+
+    @staticmethod
+    def _png_wavefront(raw, types, above, bpp, out, max_cells=1 << 24):
+        """Undoes a run of rows where the filters depend on the left and above samples.
+
+        Pixel (k, j) only needs (k, j - 1), (k - 1, j) and (k - 1, j - 1), so every pixel on an
+        anti-diagonal can be done at once. The rows are skewed (row k shifted right by k pixels)
+        which lines each anti-diagonal up as one column of the array. Long runs are done in
+        blocks of rows to keep the skewed copy small.
+        """
+        rows, row_bytes = raw.shape
+        pixels = -(-row_bytes // bpp)
+        block = max(1, min(rows, max_cells // ((pixels + rows) * bpp)))
+        for b in range(0, rows, block):
+            e = min(rows, b + block)
+            FilterHelper._png_wavefront_block(raw[b:e], types[b:e], above, bpp, pixels, out[b:e])
+            above = out[e - 1]
+
+    @staticmethod
+    def _png_wavefront_block(raw, types, above, bpp, pixels, out):
+        rows, row_bytes = raw.shape
+        # skew[k, k + j + 1] is pixel j of row k (row 0 is the row above), column k of row k is the zero left edge.
+        skew = np.zeros((rows + 1, rows + pixels + 1, bpp), dtype=np.int16)
+        skew_raw = np.zeros(skew.shape, dtype=np.uint8)
+        skew[0, 1:pixels + 1].reshape(-1)[:row_bytes] = above
+        for k in range(rows):
+            skew_raw[k + 1, k + 2:k + pixels + 2].reshape(-1)[:row_bytes] = raw[k]
+
+        kinds = set(types.tolist())
+        # One (rows, 1) mask per filter so it broadcasts over the bytes of each pixel.
+        masks = [(types == t)[:, None] for t in range(5)]
+        for c in range(2, rows + pixels + 1):
+            lo = max(1, c - pixels)
+            hi = min(rows, c - 1)
+            left = skew[lo:hi + 1, c - 1]
+            up = skew[lo - 1:hi, c - 1]
+            if kinds == {3}:
+                pred = (left + up) >> 1
+            else:
+                up_left = skew[lo - 1:hi, c - 2]
+                pa = np.abs(up - up_left)
+                pb = np.abs(left - up_left)
+                pc = np.abs(left + up - 2 * up_left)
+                pred = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+                if kinds != {4}:
+                    m = [mask[lo - 1:hi] for mask in masks[1:]]
+                    pred = np.select(m, [left, up, (left + up) >> 1, pred], 0)
+            skew[lo:hi + 1, c] = (skew_raw[lo:hi + 1, c] + pred) & 255
+
+        for k in range(rows):
+            out[k] = skew[k + 1, k + 2:k + pixels + 2].reshape(-1)[:row_bytes]
 
     @staticmethod
     def lzw(data, early_change=1):
         """
-        Sources (this code is taken from these sources, I tried but this was faster):
+        Sources:
         * https://github.com/davidben/poppler/blob/master/poppler/Stream.cc
         * https://github.com/davidben/poppler
-        
+
         (Source: PDF reference 1.7 Chapter 3, section 3, subsection 3 [3.3.3], Table 3.7)
-        EarlyChange: 
+        EarlyChange:
 
         An indication of when to increase the code length.
         If the value of this entry is 0, code length increases are postponed as long as possible.
@@ -141,136 +285,125 @@ class FilterHelper:
         length one code earlier than necessary.
         Default value: 1.
         """
-        output = io.BytesIO()
-
-        # Keeps track of how many bits the buffer('buff') needs to generate the next code.
-        input_bits = 0
-        # One big number that represents the entire bit stream and is used to get the next code.
-        buff = 0
-
-        code = 0
-        prev_code = 0
-        # Length of the next table entry being inserted.
-        entry_size = 0
-        """The table is a dictionary that maps character codes above 258 to values under 256.
-
-        The table only keeps track of three numbers, the 'tail', 'head', and 'length'.
-        'tail' - must be a valid ascii value under 256.
-        'head' - can be either a valid ascii value under 256 or it can be another char code in the table.
-        'length' - the actual length of the LZW table entry.
-        Note: if lenght == 2: head <= 255 else: head >= 258.
-        (I initially tried creating table as a map of character codes to entry list's, but that became problematic.) 
-        """
-        table = {}
-        # This is the table's index.
-        index = 258
-
-        # Number of bits that equal a valid code (ranges from 9 to 12 bits).
-        bit_size = 9
-        # Size of the current code entry that will be written to the output.
-        seq_size = 0
-        # used to ignore Clear Table Marker.
-        is_clear_marker = True
-        eof = False
-        new_code = 0
-
-        k = 0
-
-        while k < len(data):
-            # Parse through the compressed bytes
-            while input_bits < bit_size:
-                # This loop essentially streams the bytes to bits. 
-                if k >= len(data):
-                    eof = True
-                    break
-                # grab the next compressed byte
-                c = data[k]
-                k += 1
-                # Adds the byte 'c' to the input buffer.  
-                buff = (buff << 8) | (c & 255)
-                # each byte is 8 bits
-                input_bits += 8
-
-            # This gets the last bits of size 'bit_size' and converts it to integer.
-            # This is the actual code that LZW uses in compression and decompression.
-            code = (buff >> (input_bits - bit_size)) & ((1 << bit_size) - 1)
-
-            # push the 'in_bits' back
-            input_bits -= bit_size
-
-            # End of Data Decompression
-            if code == 257 or eof:
-                break
-            # Clear Table Marker
+        # In chunks so the table's buffer stays small (and in cache) even for huge streams.
+        table = LZWTable(early_change)
+        data = memoryview(data)
+        return b''.join(table.decode(data[i:i + (1 << 16)]) for i in range(0, len(data), 1 << 16))
+
+class LZWTable:
+    """Table driven LZW decoder that can be fed the compressed data a chunk at a time.
+
+    Every new table entry is the previous code's string plus the first byte of the current
+    one, and both were just written next to each other in the output. So an entry is only a
+    (start, length) into the output buffer and decoding a code is one slice copy, there are
+    no head/tail chains to walk. Entries point into the output since the last clear code,
+    once the buffer grows past `compact_size` the strings still in the table are copied into
+    a fresh one so already returned output isn't kept around.
+    """
+    CLEAR = 256
+    EOD = 257
+    FIRST = 258
+    SIZE = 4096
+
+    def __init__(self, early_change=1, compact_size=1 << 20):
+        self.early_change = early_change
+        self.compact_size = compact_size
+        # Flat tables indexed by code, preallocated for every possible code.
+        self.starts = [0] * self.SIZE
+        self.lengths = [0] * self.SIZE
+        self.out = bytearray()
+        # How much of self.out was already returned.
+        self.emitted = 0
+        self.done = False
+        self.next_code = self.FIRST
+        self.width = 9
+        # The string of the last code, -1 right after a clear code.
+        self.prev_start = -1
+        self.prev_length = 0
+        # Bytes (and the bit offset into the first one) that didn't make a whole code yet.
+        self._pending = b''
+        self._bit = 0
+
+    def _compact(self):
+        """Copies the strings the table still points at into a fresh buffer."""
+        out = bytearray()
+        starts, lengths = self.starts, self.lengths
+        for code in range(self.FIRST, self.next_code):
+            s = starts[code]
+            starts[code] = len(out)
+            out += self.out[s:s + lengths[code]]
+        if self.prev_start >= 0:
+            s = self.prev_start
+            self.prev_start = len(out)
+            out += self.out[s:s + self.prev_length]
+        self.out = out
+        self.emitted = len(out)
+
+    def decode(self, chunk):
+        """Decodes every whole code in `chunk` (plus what was left over last time), returns the new output."""
+        if self.done:
+            return b''
+        data = self._pending + bytes(chunk)
+        bits = len(data) * 8
+        # Two bytes of padding so every code can be read with one 3 byte int.from_bytes.
+        padded = data + b'\x00\x00'
+        bit = self._bit
+
+        starts, lengths = self.starts, self.lengths
+        out = self.out
+        early = self.early_change
+        next_code, width = self.next_code, self.width
+        prev_start, prev_length = self.prev_start, self.prev_length
+        mask = (1 << width) - 1
+        from_bytes = int.from_bytes
+
+        while bit + width <= bits:
+            i = bit >> 3
+            code = (from_bytes(padded[i:i + 3], 'big') >> (24 - (bit & 7) - width)) & mask
+            bit += width
+
             if code == 256:
-                # This resets the table creation process, It Does Not mean deleting the whole table.
-                # It is more like a restart, 'Clear Table' is a little misleading.
-                index = 258
-                bit_size = 9
-                seq_size = 0
-                # We don't want to add clear table markers to the table.
-                is_clear_marker = True
+                # Clear Table Marker
+                next_code, width, mask = 258, 9, 511
+                prev_start, prev_length = -1, 0
                 continue
-            # If this is True then the 'table' has overflowed.
-            if index >= 4097:
-                raise Exception("Corrupt LZW Compression.")
+            if code == 257:
+                # End of Data
+                self.done = True
+                break
 
-            entry_size = seq_size + 1
-            # Code is in [0,..,255] then it is valid acsii value.
+            start = len(out)
             if code < 256:
-                # This is the first appearence of this code so it is directly written out. 
-                output.write(bytes([code]))
-                new_code = code
-                seq_size = 1
-
-            # This means that the 'code' is a valid entry in the table.
-            elif code < index:
-                # 's_size' keeps track of how long the "true" table entry is.
-                # This is needed because of the table's structure.(see the comment above 'table' to understand the structure)
-                seq_size = table[code]['length']
-                j = code
-                # 'sbuf' is the "true" table entry and is a list of valid codes to be written out.
-                sbuf = [0] * seq_size
-                # fill the 'sbuf'
-                for i in range(seq_size - 1, 0, -1):
-                    sbuf[i] = table[j]['tail']
-                    # j recurses throught the table
-                    j = table[j]['head']
-
-                # add the final head code
-                sbuf[0] = j
-                new_code = j
-                output.write(bytes(sbuf))
-
-            # This special/rare case means that the head of the last table entry is appended to the tail of this entry.
-            elif code == index:
-                output.write(bytes([new_code]))
-                seq_size += 1
+                out.append(code)
+                length = 1
+            elif code < next_code:
+                s = starts[code]
+                length = lengths[code]
+                out += out[s:s + length]
+            elif code == next_code and prev_start >= 0:
+                # The entry being defined by this very code, the previous string plus its own first byte.
+                length = prev_length + 1
+                out += out[prev_start:prev_start + prev_length]
+                out.append(out[prev_start])
             else:
                 raise Exception("Corrupt LZW Compression.")
 
-            if is_clear_marker:
-                is_clear_marker = False
-            else:
-                table[index] = {
-                    'length': entry_size,
-                    'head': prev_code,
-                    'tail': new_code
-                }
-
-                index += 1
-                
-                if index + early_change == 512:
-                    bit_size = 10
-                elif index + early_change == 1024:
-                    bit_size = 11
-                elif index + early_change == 2048:
-                    bit_size = 12
-            
-            prev_code = code
-
-        output.seek(0)
-        b_out =  output.read()
-        output.close()
-        return b_out
-    
\ No newline at end of file
+            if prev_start >= 0 and next_code < 4096:
+                starts[next_code] = prev_start
+                lengths[next_code] = prev_length + 1
+                next_code += 1
+                if next_code + early >= (1 << width) and width < 12:
+                    width += 1
+                    mask = (1 << width) - 1
+            prev_start, prev_length = start, length
+
+        self.next_code, self.width = next_code, width
+        self.prev_start, self.prev_length = prev_start, prev_length
+        self._pending = data[bit >> 3:]
+        self._bit = bit & 7
+
+        result = bytes(out[self.emitted:])
+        self.emitted = len(out)
+        if self.compact_size is not None and len(out) > self.compact_size:
+            self._compact()
+        return result
@@ -0,0 +1,269 @@
+from .filter_helper import FilterHelper, LZWTable
+import zlib, base64, re
+
+class FlateDecoder:
+    """FlateDecode, a zlib.decompressobj that never hands back more than `max_length` bytes at a time."""
+
+    def __init__(self, params, max_length=0):
+        # zlib.MAX_WBITS|32 should check header to see if it is gzip or zlib
+        self._d = zlib.decompressobj(zlib.MAX_WBITS|32)
+        self.max_length = max_length
+
+    def feed(self, chunk):
+        if self._d.eof:
+            return
+        out = self._d.decompress(chunk, self.max_length)
+        while out:
+            yield out
+            if not self._d.unconsumed_tail:
+                break
+            out = self._d.decompress(self._d.unconsumed_tail, self.max_length)
+
+    def flush(self):
+        if not self._d.eof:
+            out = self._d.flush()
+            if out:
+                yield out
+
+class LZWDecoder:
+    """LZWDecode, the table driven decoder keeps its state between chunks."""
+
+    def __init__(self, params, max_length=0):
+        self._table = LZWTable(params.get('EarlyChange', 1))
+
+    def feed(self, chunk):
+        out = self._table.decode(chunk)
+        if out:
+            yield out
+
+    def flush(self):
+        return ()
+
+class ASCIIHexDecoder:
+    """ASCIIHexDecode, two hex digits per byte, whitespace is ignored and '>' ends the data."""
+    JUNK_REGEX = re.compile(rb'[^0-9A-Fa-f]')
+
+    def __init__(self, params, max_length=0):
+        self._carry = b''
+        self._done = False
+
+    def feed(self, chunk):
+        if self._done:
+            return
+        chunk = bytes(chunk)
+        end = chunk.find(b'>')
+        if end >= 0:
+            chunk = chunk[:end]
+            self._done = True
+        digits = self._carry + self.JUNK_REGEX.sub(b'', chunk)
+        even = len(digits) & ~1
+        self._carry = digits[even:]
+        if even:
+            yield bytes.fromhex(digits[:even].decode('ascii'))
+
+    def flush(self):
+        if self._carry:
+            # An odd digit at the end is followed by an implied 0.
+            yield bytes.fromhex((self._carry + b'0').decode('ascii'))
+
+class ASCII85Decoder:
+    """ASCII85Decode, five characters per four bytes, 'z' is four zeros, '~>' ends the data and an optional '<~' starts it."""
+    JUNK_REGEX = re.compile(rb'[ \t\r\n\f\x00]')
+
+    def __init__(self, params, max_length=0):
+        self._carry = b''
+        self._done = False
+        # The first two characters (whitespace aside), held back until it's clear whether they are '<~'.
+        self._start = b''
+
+    def feed(self, chunk):
+        if self._done:
+            return
+        if self._start is not None:
+            self._start += self.JUNK_REGEX.sub(b'', chunk)
+            if len(self._start) < 2:
+                return
+            chunk = self._start[2:] if self._start.startswith(b'<~') else self._start
+            self._start = None
+        yield from self._decode(chunk)
+
+    def _decode(self, chunk):
+        chunk = bytes(chunk)
+        end = chunk.find(b'~')
+        if end >= 0:
+            chunk = chunk[:end]
+            self._done = True
+        group = self._carry + self.JUNK_REGEX.sub(b'', chunk).replace(b'z', b'!!!!!')
+        whole = len(group) - len(group) % 5
+        self._carry = group[whole:]
+        if whole:
+            yield base64.a85decode(group[:whole])
+
+    def flush(self):
+        if self._start:
+            # Less than two characters in all.
+            yield from self._decode(self._start)
+            self._start = None
+        if self._carry:
+            # A partial group is padded out and the padding bytes are dropped.
+            yield base64.a85decode(self._carry)
+
+class RunLengthDecoder:
+    """RunLengthDecode, a length byte n then n + 1 literal bytes (n < 128) or one byte repeated 257 - n times."""
+
+    def __init__(self, params, max_length=0):
+        self._carry = b''
+        self._done = False
+
+    def feed(self, chunk):
+        if self._done:
+            return
+        data = self._carry + bytes(chunk)
+        out = bytearray()
+        size = len(data)
+        i = 0
+        while i < size:
+            n = data[i]
+            if n == 128:
+                self._done = True
+                break
+            if n < 128:
+                if i + n + 2 > size:
+                    break
+                out += data[i + 1:i + n + 2]
+                i += n + 2
+            else:
+                if i + 2 > size:
+                    break
+                out += data[i + 1:i + 2] * (257 - n)
+                i += 2
+        self._carry = b'' if self._done else data[i:]
+        if out:
+            yield bytes(out)
+
+    def flush(self):
+        return ()
+
+class PredictorDecoder:
+    """Undoes the PNG/TIFF predictor from a Flate or LZW filter's DecodeParms one row at a time.
+
+    Whole rows are handed to FilterHelper in batches with the last decoded row carried over
+    so the "above" samples are right across chunk boundaries.
+    """
+
+    def __init__(self, params, max_length=0):
+        self.predictor = params.get('Predictor', 1)
+        # number of components per sample (valid numbers are 1 - 4)
+        self.colors = params.get('Colors', 1)
+        # number of samples per row
+        self.columns = params.get('Columns', 1)
+        # number of bits to represent each color component per sample
+        self.bpc = params.get('BitsPerComponent', 8)
+        # bytes per pixel!
+        self.bpp = (self.colors * self.bpc + 7) >> 3
+        self.row_bytes = (self.columns * self.colors * self.bpc + 7) >> 3
+        # PNG rows are prefaced with the predictor used on that row.
+        self.stride = self.row_bytes + (1 if self.predictor >= 10 else 0)
+        self._prev = bytes(self.row_bytes)
+        self._carry = bytearray()
+        # Average/Paeth rows cost about as much per batch as per row, so wait for a decent number of them.
+        self.batch = max(self.stride * 256, 1 << 22)
+
+    def _rows(self, data):
+        if self.predictor == 2:
+            return FilterHelper.tiff_prediction(self.bpc, self.colors, self.columns, self.row_bytes + self.bpp, self.bpp, data).tobytes()
+        rows = FilterHelper.png_prediction(self.columns, self.row_bytes + self.bpp, self.bpp, data, self._prev)
+        if len(rows):
+            self._prev = rows[-1].tobytes()
+        return rows.tobytes()
+
+    def feed(self, chunk):
+        self._carry += chunk
+        if len(self._carry) < self.batch:
+            return
+        whole = len(self._carry) - len(self._carry) % self.stride
+        if whole:
+            data = bytes(self._carry[:whole])
+            del self._carry[:whole]
+            yield self._rows(data)
+
+    def flush(self):
+        if self._carry:
+            yield self._rows(bytes(self._carry))
+            self._carry = bytearray()
+
+class FilterPipeline:
+    """Chains a stream's filters (and their DecodeParms) so the data can be decoded a chunk at a time.
+
+    (Source: PDF reference 1.7 Chapter 3, section 3 [3.3], Table 3.5)
+    Image filters (DCT, JPX, CCITT, JBIG2) end the pipeline, their input is passed through as is
+    so the ImageStream can deal with it.
+    """
+    DECODERS = {
+        'FlateDecode': FlateDecoder,
+        'Fl': FlateDecoder,
+        'LZWDecode': LZWDecoder,
+        'LZW': LZWDecoder,
+        'ASCIIHexDecode': ASCIIHexDecoder,
+        'AHx': ASCIIHexDecoder,
+        'ASCII85Decode': ASCII85Decoder,
+        'A85': ASCII85Decoder,
+        'RunLengthDecode': RunLengthDecoder,
+        'RL': RunLengthDecoder
+    }
+    IMAGE_FILTERS = {'DCTDecode', 'DCT', 'JPXDecode', 'CCITTFaxDecode', 'CCF', 'JBIG2Decode'}
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, filters=None, params=None, max_length=CHUNK_SIZE):
+        if filters is None:
+            filters = []
+        elif not isinstance(filters, list):
+            filters = [filters]
+        if not isinstance(params, list):
+            params = [params] * len(filters) if len(filters) == 1 else [None] * len(filters)
+
+        self.stages = []
+        # The first filter the pipeline can't run, usually an image filter, everything after it is left alone.
+        self.image_filter = None
+        self.image_params = None
+        for name, p in zip(filters, params):
+            if isinstance(p, tuple):
+                # The document resolves these before it makes the Stream, see PdfDoc._stream_info.
+                raise Exception(f"Indirect /DecodeParms {p[0]} {p[1]} R of {name} was never resolved.")
+            p = p if isinstance(p, dict) else {}
+            if name not in self.DECODERS:
+                self.image_filter = name
+                self.image_params = p
+                break
+            self.stages.append(self.DECODERS[name](p, max_length))
+            if p.get('Predictor', 1) > 1 and name in ('FlateDecode', 'Fl', 'LZWDecode', 'LZW'):
+                self.stages.append(PredictorDecoder(p, max_length))
+
+    @classmethod
+    def from_info(cls, info, max_length=CHUNK_SIZE):
+        return cls(info.get('Filter'), info.get('DecodeParms'), max_length)
+
+    def _push(self, stage, chunks):
+        for chunk in chunks:
+            yield from self.stages[stage].feed(chunk)
+        yield from self.stages[stage].flush()
+
+    def decode(self, data, chunk_size=CHUNK_SIZE):
+        """Yields the decoded data in chunks, `data` is read `chunk_size` bytes at a time (None for all at once)."""
+        data = memoryview(data)
+        if chunk_size is None:
+            chunks = iter([data])
+        else:
+            chunks = (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+
+        for stage in range(len(self.stages)):
+            chunks = self._push(stage, chunks)
+
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+
+    def decode_all(self, data):
+        if not self.stages:
+            return bytes(data)
+        return b''.join(self.decode(data, None))
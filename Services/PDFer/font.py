@@ -1,194 +1,250 @@
-from .pdf_scanner import PdfScanner
-from .pdf_parser import PDFParser
-from .static import glyph_dict
+from .cmap import ToUnicodeCMap
+from .static import glyph_dict, standard_encoding
 from pprint import pprint
+from array import array
+import codecs, sys
 
 class Font:
+    # Base encodings that python already has a codec for, see _base_table.
+    BASE_CODECS = {
+        'WinAnsiEncoding': 'cp1252',
+        'MacRomanEncoding': 'mac_roman',
+        'PDFDocEncoding': 'latin_1'
+    }
+    # Compiled base tables shared by every font, { encoding name: 256 character str }.
+    _base_tables = {}
 
-    def __init__(self, pdfdoc, font_object):
-        if font_object.pop('Type') != 'Font':
+    def __init__(self, pdfdoc, font_object, cmaps=None):
+        if font_object.get('Type') != 'Font':
             raise Exception('Incorrect format, object is not a page.')
         self._document = pdfdoc
         # Required
-        self.subtype = font_object.pop('Subtype')
-        self.base_font = font_object.pop('BaseFont')
+        self.subtype = font_object['Subtype']
+        self.base_font = font_object['BaseFont']
         # Optional
         self.first_char = font_object.get('FirstChar')
         self.last_char = font_object.get('LastChar')
         self.widths = font_object.get('Widths')
+        self.default_width = None
+        if self.subtype == 'Type0':
+            # Composite fonts keep their widths in the CIDFont, W = [c [w1 w2 ...] c_first c_last w ...].
+            self.widths, self.default_width = self._cid_font_widths(font_object.get('DescendantFonts'))
+        elif isinstance(self.widths, tuple):
+            self.widths = self._document.get_object(self.widths)
         self.descriptor = font_object.get('FontDescriptor')
         self.encoding = font_object.get('Encoding', 'standard')
         if isinstance(self.encoding, tuple):
             self.encoding = self._document.get_object(self.encoding)
-        # all of the keys will be hex strings and all the values will be readable characters.
-        self.cmap = self._to_unicode_map(font_object.get('ToUnicode'))
+        self.cmap = self._to_unicode_map(font_object.get('ToUnicode'), cmaps)
+        self._table = None
+        self._width_table = None
 
-    def _to_unicode_map(self, to_unicode):
+    @classmethod
+    def fromJSON(cls, pdfdoc, data):
+        """Rebuilds a font from its toJSON() (i.e. out of a saved DocIndex) without touching the file."""
+        font = cls.__new__(cls)
+        font._document = pdfdoc
+        font.subtype = data['subtype']
+        font.base_font = data['base_font']
+        font.first_char = data['first_char']
+        font.last_char = data['last_char']
+        font.widths = data['widths']
+        font.default_width = data.get('default_width')
+        font.descriptor = data['descriptor']
+        font.encoding = data['encoding']
+        font.cmap = ToUnicodeCMap.fromJSON(data['cmap'])
+        font._table = None
+        font._width_table = None
+        return font
+
+    def _cid_font_widths(self, descendants):
+        if isinstance(descendants, tuple):
+            descendants = self._document.get_object(descendants)
+        if not descendants:
+            return None, None
+        cid_font = descendants[0]
+        if isinstance(cid_font, tuple):
+            cid_font = self._document.get_object(cid_font)
+        widths = cid_font.get('W')
+        if isinstance(widths, tuple):
+            widths = self._document.get_object(widths)
+        return widths, cid_font.get('DW', 1000)
+
+    def _to_unicode_map(self, to_unicode, cmaps=None):
+        """The font's ToUnicodeCMap, fonts that share a ToUnicode stream share the compiled cmap through `cmaps`."""
         if to_unicode is None:
             return None
 
-        parser = PDFParser()
-        scanner = PdfScanner()
+        key = to_unicode[:2] if isinstance(to_unicode, tuple) else None
+        if cmaps is not None and key is not None:
+            cmap = cmaps.get(key)
+            if cmap is not None:
+                return cmap
 
         u_stream = self._document.get_object(to_unicode, search_stream=True)
-        # result (res) can have both 'bf_char' and 'bf_range'
-        # TODO: handle different 'bf_codespace_range'
-        res = parser.parse_to_unicode(scanner.tokenize(u_stream.decode(), convert_nums=False))
-        res_cmap = res['cmap']
-        # all of the keys will be hex strings and all the values will be readable characters.
-        char_map = {}
-        # byte-font characters (one to one) = [(key, value)]. 
-        bf_chars = res_cmap.get('bf_char', [])
-        
-        for entry in bf_chars:
-            key, val = entry
-            # Converting the values(type == str):
-            # format(val, '0>4') - pads the begining of the str w/ 0's to length 4 (can't remeber why? lol).
-            # int(val_str, 16) - val_str is at this point a hex string so convert to hexadecimal (base 16).
-            # chr(val_int) -  converts the hexadecimal to a character.
-            char_map[key] = chr(int(format(val, '0>4'), 16))
-
-        # byte-font range (many to many) or (one to one) = [(start, end, [values])]
-        bf_range = res_cmap.get('bf_range', [])
-        
-        for entry in bf_range:
-
-            u_start, u_end, val = entry
-            # 'start' and 'end' tell us the range type i.e. (many to many)
-            start = int(format(u_start, '0>4'), 16)
-            end = int(format(u_end, '0>4'), 16)
-
-            if (end - start) == 0:
-                # start = end, therefore range = 1 <==> (one to one)
-                char_map[u_start] = chr(int(format(val[0], '0>4'), 16))
-
-            elif len(val) == 1:
-                # start != end -> range > 1, and values = 1, therefore (many to one)? (i'll explain):
-                # its actually (many to many), in this case the value is expected to increment w/ the range
-                # Example: (1, 4, [a]) => if range = 1 to 4 and value = a then the cmap is:
-                # cmap = { 1: 'a', 2: 'b', 3: 'c', 4: 'd' }
-                val_num = int(format(val[0], '0>4'), 16)
-
-                # we need the range to be [start, end] inclusive, in python = `range(start, end+1)`
-                for i in range(start, (end + 1)):
-                    # in python all hex strings start with '0x', pdf's don't so we ignore it
-                    key = hex(i)[2:]
-                    char_map[key] = chr(val_num)
-                    # increment value
-                    val_num += 1
-
-            else:
-                # range > 1, and values > 1, therefore (many to many)
-                # we need the range to be [start, end] inclusive, in python = `range(start, end+1)`
-                for i in range(start, (end + 1)):
-                    # in python all hex strings start with '0x', pdf's don't so we ignore it
-                    key = hex(i)[2:]
-                    # map the range to a valid array range, EX. if start = 22 and end = 25 then:
-                    # i = 22, 23, 24, 25
-                    # index = 0, 1, 2, 3
-                    index = i - start
-                    char_map[key] = chr(int(format(val[index], '0>4'), 16))
-        
-        return char_map
-
-    def _remap(self, raw_text):
-        hx_arr = []
-        for x in raw_text:
-            try:
-                hx_arr.append(x.hex())
-            except Exception as e:
-                # x must be a string which means it's already a hex string.
-                hx_arr.append(x)
-
-        hex_string = ''.join(hx_arr)
-        text = []
-        for a, b in zip(hex_string[::2], hex_string[1::2]):
-            code = a+b
-            if code in self.cmap:
-                text.append(self.cmap[code])
-            else:
-                # user4369081 on stackoverflow
-                text.append(bytearray.fromhex(code).decode())
-
-        return text
-
-    def get_diff_table(self, font):
-        enc_dict = {}
-        #print(font.toJSON())
-        #diff_table = (font.toJSON())['encoding']['Differences']
+        cmap = ToUnicodeCMap.parse(u_stream.decompress())
+        if cmaps is not None and key is not None:
+            cmaps.put(key, cmap)
+        return cmap
+
+    @classmethod
+    def _base_table(cls, name):
+        """The 256 character decoding table of a base encoding (compiled once per process)."""
+        table = cls._base_tables.get(name)
+        if table is not None:
+            return table
+        codec = cls.BASE_CODECS.get(name)
+        if codec is not None:
+            # The few bytes cp1252 leaves undefined are read as latin-1.
+            table = ''.join(bytes([c]).decode(codec, 'ignore') or chr(c) for c in range(256))
+        elif name == 'StandardEncoding':
+            # (Source: PDF reference 1.7 Appendix D) it's ASCII plus the glyphs in static.standard_encoding.
+            chars = [chr(c) for c in range(256)]
+            for code, glyph in standard_encoding.items():
+                chars[code] = chr(int(glyph_dict[glyph], 16))
+            table = ''.join(chars)
+        else:
+            table = ''.join(chr(c) for c in range(256))
+        cls._base_tables[name] = table
+        return table
+
+    @staticmethod
+    def _glyph_char(name):
+        """The unicode character of a glyph name, None if it's unknown."""
+        if name in glyph_dict:
+            return chr(int(glyph_dict[name], 16))
+        # i.e. 'a.sc' or 'f_i' variants.
+        base = name.split('.')[0]
+        if base in glyph_dict:
+            return chr(int(glyph_dict[base], 16))
         try:
-            diff_table = (font.toJSON())['encoding']['Differences']
-            #Translate to dictionary
-            new_key = None
-            curr_key = 0
-
-            for enc in diff_table:
-                try: 
-                    int(enc)
-                    new_key = enc
-                except: 
-                    if new_key and enc != '.notdef':
-                        enc_dict.update({new_key: enc})
-                        curr_key = new_key
-                    elif enc != '.notdef':
-                        enc_dict.update({curr_key: enc})
-                    new_key = None
-                    curr_key += 1
-        except:
+            if base.startswith('uni') and len(base) == 7:
+                return chr(int(base[3:], 16))
+            if base.startswith('u') and 5 <= len(base) <= 7:
+                return chr(int(base[1:], 16))
+        except ValueError:
             pass
-        return enc_dict
+        return None
+
+    def _compile_table(self):
+        """Base encoding + Differences + glyph names squashed into one 256 character str.
+
+        (Source: PDF reference 1.7 Chapter 5, section 5, subsection 5 [5.5.5])
+        """
+        encoding = self.encoding
+        differences = []
+        if isinstance(encoding, dict):
+            differences = encoding.get('Differences', [])
+            if isinstance(differences, tuple):
+                differences = self._document.get_object(differences)
+            encoding = encoding.get('BaseEncoding')
+        if not isinstance(encoding, str) or encoding == 'standard':
+            # No /Encoding, TrueType fonts are (nearly always) WinAnsi, Type1 fonts use their built in StandardEncoding.
+            encoding = 'WinAnsiEncoding' if self.subtype == 'TrueType' else 'StandardEncoding'
+
+        table = self._base_table(encoding)
+        if not differences:
+            return table
 
-    def translate(self, raw_text, font):
-        enc_dict = self.get_diff_table(font)
+        # Differences = [code name name ... code name ...], each name after a code is the next code up.
+        chars = list(table)
+        code = 0
+        for entry in differences:
+            if isinstance(entry, (int, float)):
+                code = int(entry)
+                continue
+            if 0 <= code < 256 and entry != '.notdef':
+                char = self._glyph_char(str(entry))
+                if char is not None:
+                    chars[code] = char
+            code += 1
+        return ''.join(chars)
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = self._compile_table()
+        return self._table
+
+    def decode(self, raw):
+        """Decodes the raw bytes of a string, single byte fonts in one call through the compiled table."""
         if self.cmap is not None:
-            return ''.join(self._remap(raw_text))
-
-        #Identify hexcodes and replace with dictionary definition
-        hex_start = str(r'\x')
-        oct_start = str(r'\\')
-        for i, val in enumerate(raw_text):
-            if (hex_start in str(val) or oct_start in str(val)):
-                #If a dictionary exists, translate, otherwise remove the reference
-                if(enc_dict):
-                    raw_text[i] = self.read_enc_bytes(val, enc_dict)
+            return self.cmap.decode(raw, self.table)
+        return codecs.charmap_decode(raw, 'strict', self.table)[0]
+
+    def _compile_widths(self):
+        widths = self.widths if isinstance(self.widths, list) else []
+        if self.subtype == 'Type0':
+            # { cid: width }, the codes are the CIDs for Identity-H/V.
+            table = {}
+            i = 0
+            while i + 1 < len(widths):
+                first, nxt = widths[i], widths[i + 1]
+                if isinstance(nxt, list):
+                    for k, w in enumerate(nxt):
+                        table[int(first) + k] = w / 1000
+                    i += 2
+                elif i + 2 < len(widths):
+                    for cid in range(int(first), min(int(nxt), int(first) + 0xFFFF) + 1):
+                        table[cid] = widths[i + 2] / 1000
+                    i += 3
                 else:
-                    raw_text[i] = ''
+                    break
+            return table
+        # The standard 14 fonts don't need /Widths, half an em is close enough for placing text.
+        table = [0.0 if widths else 0.5] * 256
+        first = self.first_char or 0
+        for k, w in enumerate(widths):
+            if 0 <= first + k < 256 and isinstance(w, (int, float)):
+                table[first + k] = w / 1000
+        return table
 
-        if isinstance(self.encoding, dict):
-            f_encoding = self.encoding.get('BaseEncoding', 'standard').lower()
-        else:
-            f_encoding = self.encoding.lower()
-            
-        if f_encoding.startswith('mac'):
-            return ''.join([str(text, 'mac_roman') if isinstance(text, bytes) else text for text in raw_text])
-        
-        if f_encoding.startswith('winansi'):
-            return ''.join([str(text, 'cp1252') if isinstance(text, bytes) else text for text in raw_text])
-
-        if f_encoding.startswith('standard'):
-            return ''.join([str(text, 'latin_1') if isinstance(text, bytes) else text for text in raw_text])
-
-        return ''.join([str(text, 'utf-8') if isinstance(text, bytes) else text for text in raw_text])
-
-    def read_enc_bytes(self, text, enc_dict):
-        oct = False
-        hex = False
-        new_string = ''
-        #Scan text for hex or octal delimiter, construct new text with translated character
-        for b in text:
-            if (oct):
-                oct = False
-                if(len(text) > 2):
-                    char = chr(int(str(b)[2:5], 8))
-                    new_string += char
-            elif ((r'\\') in str(b)):
-                oct = True
-            elif ((r'\x') in str(b)):
-                char = chr(int(glyph_dict[enc_dict[int(str(b)[4:-1], 16)]], 16))
-                new_string += char
-            else:
-                new_string += str(b)[2:-1]
-        return (new_string)
+    def text_width(self, raw):
+        """(sum of the glyph widths in em, number of codes, number of word spaces) for the raw bytes of a string."""
+        if self._width_table is None:
+            self._width_table = self._compile_widths()
+        table = self._width_table
+        if self.subtype == 'Type0':
+            codes = array('H', raw[:len(raw) & ~1])
+            if sys.byteorder == 'little':
+                codes.byteswap()
+            default = (self.default_width or 1000) / 1000
+            return sum(table.get(c, default) for c in codes), len(codes), 0
+        # Word spacing only applies to the single byte code 32.
+        return sum(map(table.__getitem__, raw)), len(raw), raw.count(32)
+
+    @staticmethod
+    def raw_bytes(raw_text):
+        """Joins the strings parse_content found into the actual bytes.
+
+        Literal strings are lists of byte pieces where an octal escape is a b'\\' piece followed
+        by its digits, hex strings are str.
+        """
+        out = bytearray()
+        for item in raw_text:
+            if isinstance(item, str):
+                digits = ''.join(item.split())
+                out += bytes.fromhex(digits + '0' * (len(digits) & 1))
+                continue
+            if not isinstance(item, list):
+                out += item
+                continue
+            escape = False
+            for piece in item:
+                if escape:
+                    escape = False
+                    n = len(piece) - len(piece.lstrip(b'01234567'))
+                    if n:
+                        out.append(int(piece[:min(n, 3)], 8) & 255)
+                        piece = piece[min(n, 3):]
+                elif piece == b'\\':
+                    escape = True
+                    continue
+                out += piece
+        return bytes(out)
+
+    def translate(self, raw_text, font=None):
+        return self.decode(self.raw_bytes(raw_text))
 
     def toJSON(self):
         return {
@@ -199,6 +255,7 @@ class Font:
             'encoding': self.encoding,
             'descriptor': self.descriptor,
             'widths': self.widths,
-            'cmap': self.cmap
+            'default_width': self.default_width,
+            'cmap': self.cmap.toJSON() if self.cmap is not None else None
         }
     
\ No newline at end of file
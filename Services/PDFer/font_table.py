@@ -1,20 +1,17 @@
-from .pdf_scanner import PdfScanner
-from .pdf_parser import PDFParser
 from .font import Font
+from .object_cache import ObjectCache
+from .content_interpreter import ContentInterpreter
 
 class FontTable:
     """This is like a controller class for the fonts"""
 
-    def __init__(self, pdfdoc):
+    def __init__(self, pdfdoc, max_fonts=256):
         self._document = pdfdoc
         self.font_table = {}
-
-    def _decode_text(self, font_name, raw_text):
-        try:
-            font = self.font_table[font_name]
-            return font.translate(raw_text, self.get_font(font_name))
-        except KeyError:
-            raise Exception('Font does not exist?')
+        # Fonts by object reference for page_fonts(), the least recently used ones get dropped.
+        self._fonts = ObjectCache(max_entries=max_fonts)
+        # Compiled ToUnicode cmaps by stream reference, lots of fonts share the same one.
+        self._cmaps = ObjectCache(max_entries=max_fonts)
 
     def add_font(self, font):
         if font is None:
@@ -24,21 +21,49 @@ class FontTable:
         for k, v in font.items():
             if k in self.font_table:
                 continue
-            self.font_table[k] = Font(self._document, self._document.get_object(v))
-
-    def decode_content(self, content_stream):
-        parser = PDFParser()
-        scanner = PdfScanner()
-        # text_stream = { font_name: ['text', 'found', ... ] }
-        text_stream = parser.parse_content(scanner.b_tokenize(content_stream.decompress()))
-
-        text_arr = []
-        
-        for entry in text_stream:
-            font_name, raw_text = entry
-            text_arr.append(self._decode_text(font_name, raw_text))
-        
-        return text_arr
+            self.font_table[k] = Font(self._document, self._document.get_object(v), self._cmaps)
+
+    def page_fonts(self, font):
+        """{ font_name: Font } for one page's /Font resource.
+
+        Unlike add_font the names are only for this page (two pages can both have an /F1),
+        the Font objects are shared between pages through a bounded cache.
+        """
+        if font is None:
+            return {}
+        if isinstance(font, tuple):
+            font = self._document.get_object(font)
+        fonts = {}
+        for k, v in font.items():
+            if not isinstance(v, tuple):
+                fonts[k] = Font(self._document, v, self._cmaps)
+                continue
+            f = self._fonts.get(v[:2])
+            if f is None:
+                f = self._fonts.put(v[:2], Font(self._document, self._document.get_object(v), self._cmaps))
+            fonts[k] = f
+        return fonts
+
+    def decode_content(self, content_stream, fonts=None):
+        return self.decode_data(content_stream.decompress(), fonts)
+
+    def text_runs(self, data, fonts=None):
+        """Every TextRun (x, y, font, size, text, width) shown by decompressed content stream data."""
+        fonts = self.font_table if fonts is None else fonts
+        return list(ContentInterpreter(fonts).runs(data))
+
+    def decode_data(self, data, fonts=None):
+        """The text in decompressed content stream data one line at a time in reading order,
+        with `fonts` from page_fonts() or the font table."""
+        return ContentInterpreter.lines(self.text_runs(data, fonts))
+
+    def dump(self):
+        return {k: v.toJSON() for k, v in self.font_table.items()}
+
+    def load(self, fonts):
+        for k, v in fonts.items():
+            if k not in self.font_table:
+                self.font_table[k] = Font.fromJSON(self._document, v)
 
     def toJSON(self, font=None):
         if font and font in self.font_table:
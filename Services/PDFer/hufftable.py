@@ -1,35 +1,69 @@
-import heapq
-import os
-
-class HuffNode:
-    def __init__(self, char, code):
-        self.char = char
-        self.code = code
-
-class HuffTable:
-    def __init__(self, ht):
-        self.heap = []
-        self.compact_huff = ht
-
-    def generate_huff_tree(self):
-        '''
-        This method finds the huffman codes for each symbol, it does not construct the whole tree.
-        The leaves of the tree are constructed left to right, any node which has a character is the end of that branch.
-        Therefore the next character is coded in one node to the right (+1) of the previously coded character at it's coresponding row (append '0's)
-        '''
-        for r, row in enumerate(self.compact_huff, 1):
-            for char in row:
-                if not self.heap:
-                    self.heap.append(HuffNode(char, '0' * r))
-                    continue
-                prev_node = self.heap[-1]
-                if (len(prev_node.code) == r):
-                    code = bin(int(prev_node.code, 2) + 1)
-                    self.heap.append(HuffNode(char, code[2:]))
-                else:
-                    node_right = bin(int(prev_node.code, 2) + 1)
-                    row_extend = (r - len(prev_node.code))
-                    code = str(node_right) + ('0' * row_extend)
-                    self.heap.append(HuffNode(char, code[2:]))
-
-        return self.heap
+class HuffTable:
+    """A JPEG Huffman table compiled into lookup tables indexed by the next 16 bits of the scan.
+
+    (Source: ITU T.81 Annex C and Annex F, section 2, subsection 2 [F.2.2])
+    A DHT segment only lists how many codes there are of each length (1 - 16 bits) and their
+    symbols in code order, the codes themselves are canonical: each one is the previous code
+    + 1, shifted left whenever the length goes up. Every code of length L owns the 2^(16 - L)
+    entries that start with it, so decoding is one peek of 16 bits and one list index, there
+    is no tree to walk and no bit by bit matching.
+    """
+    BITS = 16
+
+    def __init__(self, counts, symbols):
+        # counts[i] is the number of codes that are i + 1 bits long.
+        self.counts = list(counts)
+        self.symbols = list(symbols)
+        # (length, code, symbol) in code order.
+        self.codes = self._canonical_codes(self.counts, self.symbols)
+        # Entries are length << 8 | symbol, None where no code starts with those bits (corrupt data).
+        self.lookup = [None] * (1 << self.BITS)
+        for length, code, symbol in self.codes:
+            shift = self.BITS - length
+            self.lookup[code << shift:(code + 1) << shift] = [length << 8 | symbol] * (1 << shift)
+        self._run_lookup = None
+
+    @staticmethod
+    def _canonical_codes(counts, symbols):
+        codes = []
+        code = 0
+        k = 0
+        for length, count in enumerate(counts, 1):
+            for _ in range(count):
+                if code >= 1 << length or k >= len(symbols):
+                    raise Exception('Invalid Huffman table.')
+                codes.append((length, code, symbols[k]))
+                code += 1
+                k += 1
+            code <<= 1
+        return codes
+
+    @property
+    def run_lookup(self):
+        """The AC table of sequential scans, the value bits after a code are decoded by the same peek.
+
+        Entries are (bits, run, value, size): the symbol is run << 4 | size. When the code and its
+        `size` value bits fit in the 16 peeked bits `bits` covers both, `value` is the coefficient
+        and `size` is 0. Otherwise `bits` is only the code and the caller reads `size` more bits.
+        End of block has a run of -1 and ZRL (16 zeros) is a run of 15 with a value of 0.
+        """
+        if self._run_lookup is not None:
+            return self._run_lookup
+        table = [None] * (1 << self.BITS)
+        for length, code, symbol in self.codes:
+            run, size = symbol >> 4, symbol & 15
+            shift = self.BITS - length
+            base = code << shift
+            if size == 0:
+                entry = (length, 15 if run == 15 else -1, 0, 0)
+                table[base:base + (1 << shift)] = [entry] * (1 << shift)
+            elif size <= shift:
+                rest = shift - size
+                for bits in range(1 << size):
+                    value = bits if bits >> (size - 1) else bits - (1 << size) + 1
+                    start = base | bits << rest
+                    table[start:start + (1 << rest)] = [(length + size, run, value, 0)] * (1 << rest)
+            else:
+                table[base:base + (1 << shift)] = [(length, run, 0, size)] * (1 << shift)
+        self._run_lookup = table
+        return table
@@ -1,8 +1,6 @@
-from scipy import ndimage
 import numpy as np
-import io
-from .hufftable import HuffTable 
-from .static import jpgIgnoreBytes
+import cv2 as cv
+from .jpeg_decoder import JpegDecoder
 
 class ImageStream:
 
@@ -127,22 +125,23 @@ class ImageStream:
         icc_stream = self._document.get_object(cspace_args[0], search_stream=True)
         return icc_stream.get_info('N')
 
-    def get_color_depth(self):
-        # Color space can be array or name or stream
-        if self.color_space is None:
+    def get_color_depth(self, color_space=None):
+        # Color space can be array or name or stream, `color_space` is for another one (i.e. the base of an Indexed space).
+        color_space = self.color_space if color_space is None else color_space
+        if color_space is None:
             # TODO: handle JPXDecode which is the only case color space is None
             return 1
 
         name = None
         cs_args = None
 
-        if isinstance(self.color_space, str):
-            name = self.color_space.lower()
+        if isinstance(color_space, str):
+            name = color_space.lower()
 
-        elif isinstance(self.color_space, list):
-            name = self.color_space[0].lower()
-            if len(self.color_space) > 1:
-                cs_args = self.color_space[1:]
+        elif isinstance(color_space, list):
+            name = color_space[0].lower()
+            if len(color_space) > 1:
+                cs_args = color_space[1:]
 
         if name.startswith('device'):
             return self._device_color_space(name, cs_args)
@@ -157,203 +156,144 @@ class ImageStream:
         width = self.stream.get_info('Width')
         return height, width, self.get_color_depth()
 
-    def filter_hexcodes(self, hexList, remove):
-        #Remove excess data from hexcodes
-        filteredSymbols = []
-        for symbol in hexList:
-            
-            if(symbol and symbol[0] == 'x'):
-                filteredSymbols.append(symbol[1:3])
-            elif not remove:
-                filteredSymbols.append(symbol)
-            elif remove == "replace":
-                filteredSymbols.append(0)
-        return filteredSymbols
-
-    def get_hufftable(self, unfilteredSymbols, symbolNum):
-        filteredSymbols = self.filter_hexcodes(unfilteredSymbols, False)
-        newHuff = []
-        symbolPosition = 0
-
-        for row in symbolNum:
-            symbolRow = []
-            for sym in range(row):
-                symbolRow.append(filteredSymbols[symbolPosition])
-                symbolPosition+=1
-            newHuff.append(symbolRow)
-
-        return newHuff
-
-    def zigzag_table(self, bytes):
-        #Generate 8x8 table from array of bytes in zigzag sequence
-        #base = 0 for 8 bit, base = 1 for 16 bit
-        table = np.zeros((8,8), dtype=object)
-        col = 0
-        row = 0
-        for i in range(64):
-            table[row][col] = str(bytes[i])
-            if((col+row) % 2 == 0):
-                #Even lines go up
-                if(row == 0):
-                    col +=1
-                elif(col == 7):
-                    row +=1
-                else:
-                    row -=1
-                    col +=1
-            else:
-                #Odd lines go down
-                if(row == 7):
-                    col +=1
-                elif(col == 0):
-                    row +=1
-                else:
-                    row +=1
-                    col -=1
-            
-        return table
-
-    def huffman_decode(self, bytes, huffman):
-        #Take group of bytes, translate using huffman tree
-        binary_concat = ''
-        check_bin = ''
-        translation = ''
-
-        for byte in bytes:
-            if(byte):
-                binary_string = bin(int(byte, 16))[2:]
-                binary_concat += binary_string
-
-        for bit in binary_concat:
-            check_bin += bit
-            for h in huffman:
-                for node in h:
-                    if (node.code == check_bin):
-                        translation += node.char
-                        check_bin = ''
-
-    def parse_jpeg(self, jpgFile):
-        byteList = str(jpgFile).split('\\')
-        prevByte = ''
-        ac_huffList = []
-        dc_huffList = []
-        ac_huffTable = []
-        dc_huffTable = []
-        DCTList = []
-        scan_markers = ()
-
-        #Scan data stream for two byte markers indicating data segment
-        for b, byte in enumerate(byteList):
-            if prevByte == 'xff':
-                #Headers
-                if byte == 'xc0':
-                    #SOF Baseline DCT
-                    print('Baseline DCT')
-                    precision = byteList[b+3]
-                    imHeight = byteList[b+4: b+6]
-                    imWidth = byteList[b+6: b+8]
-                    compNum = byteList[b+8]
-                    components = byteList[b+9: b+12]
-                elif byte == 'xc1':
-                    #SOF Extended sequential dct
-                    print('Extended DCT')
-                elif byte == 'xc2':
-                    #SOF Progressive DCT
-                    print('Progressive DCT')
-                elif byte == 'xc3':
-                    #SOF Lossless DCT
-                    print('Lossless DCT')
-                    
-                #SOF Markers, differential, huffman coding
-                elif byte == 'xc5':
-                    #Differential sequential dct
-                    print('Diff Seq DCT')
-                elif byte == 'xc6':
-                    print('Diff Progressive DCT')
-                    #Differential progressive dct
-                elif byte == 'xc7':
-                    #Differential lossless
-                    print('Diff Lossless DCT')
-
-                #Huffman  
-                elif byte == 'xc4':
-                    #From Marker, Length = 2 bytes, HT info = 1 byte, number of symbols = 16 bytes
-                    htInfo = byteList[b+3]
-                    symbolList = byteList[b+4: b+20]
-                    symbolNum = [int(s[1:3]) for s in symbolList]
-                    #Sum of symbol_num gives remaining number of bytes, since they are the number of entries per row in the HT
-                    unfilteredSymbols = byteList[b+20: b+20+sum(symbolNum)]
-                    #Generate huffman table from symbols and their encoded lengths
-                    newHuff = self.get_hufftable(unfilteredSymbols, symbolNum)
-                    if (int(htInfo[2]) == 0):
-                        dc_huffList.append(newHuff)
-                    else:
-                        ac_huffList.append(newHuff)
-
-                #Quantization table
-                elif byte == 'xdb':
-                    QTInfo = byteList[b+2]
-                    precision = (int(QTInfo[1])+1) * 64
-                    unfilteredQTBytes = byteList[b+3: b+3+precision]
-                    QTBytes = self.filter_hexcodes(unfilteredQTBytes, "replace")
-                    QTTable = self.zigzag_table(QTBytes)
-
-                elif byte == 'xda':
-                    #SOS
-                    componentInfo = []
-                    length = int(byteList[b+1][1:] + byteList[b+2][1:], 16)
-                    compNum = int(byteList[b+3][1:])
-                    #Components are 2 bytes each, number of components specified by previous byte
-                    for comp in range(compNum):
-                        pos = b+4+(comp*2)
-                        componentInfo.append(byteList[pos: pos+2])
-
-                    prevHex = ''
-                    marks = byteList[b:]
-                    for m, mark in enumerate(marks):
-                        if prevHex[:3] == 'xff':
-                            if mark[:3] not in jpgIgnoreBytes:
-                                #If xff is followed by a byte not in jpgIgnoreBytes, it is the end of the scan
-                                eofMarker = m
-                                break
-                        prevHex = mark
-                    scan_markers = (b, eofMarker)
-                    components.append(byteList[b+length+1: eofMarker-1])
-
-                elif byte == 'xdd':
-                    #DRI
-                    print("Restart Interval")
-
-            prevByte = byte
-
-        #Construct each huffman table
-        for a in ac_huffList:
-            ac_huffTable.append(HuffTable(a).generate_huff_tree())
-        for d in dc_huffList:
-            dc_huffTable.append(HuffTable(d).generate_huff_tree())
-
-        #Filter bad characters out of hexcode for binary conversion
-        filteredBytes = self.filter_hexcodes(byteList[scan_markers[0]: scan_markers[1]], True)
-        #Huffman decoding
-        self.huffman_decode(filteredBytes, dc_huffTable)
+    # Image filters whose data is already a file format, they are written out as is.
+    PASSTHROUGH = {'dctdecode': '.jpg', 'dct': '.jpg', 'jpxdecode': '.jp2'}
 
-    def get_image(self):
-        # This might only work because the bit depth is 8.
-        # Pdf images can have differing bit depths to save space but
-        # OpenCV only accepts uinsigned 8 bit integers (AKA 'uint8')
-        # Coincidentally if the PDF's bit depth is 8 then it works like a charm
-        # *HAVE NOT FOUND OR TESTED ON DIFFERENT BIT DEPTHS*
-        shape = self.get_shape()
-        img_filter = self.stream.filter.lower()
-
-        if img_filter.startswith('dct'):
-            #JPEG
-            jpg_file = io.BytesIO(self.stream.decompress())
-            #In house JPEG decompression run with: self.parse_jpeg(self.stream.decompress())
-            return ndimage.imread(jpg_file)
-        elif img_filter.startswith('flate') and self.stream.is_prediction_filter():
-            # Prediction PNG/TIFF
-            return np.array(self.stream.unpredict(), dtype=np.uint8).reshape(shape)
-
-        return np.frombuffer(self.stream.decompress(), dtype=np.uint8).reshape(shape)
+    def _color_model(self):
+        name = None
+        if isinstance(self.color_space, str):
+            name = self.color_space.lower()
+        elif isinstance(self.color_space, list) and self.color_space:
+            name = str(self.color_space[0]).lower()
+        if name in ('indexed', 'i'):
+            return 'indexed'
+        return {1: 'gray', 3: 'rgb', 4: 'cmyk'}.get(self.get_color_depth(), 'other')
+
+    def _palette(self):
+        """The color table of an Indexed color space as a (entries, base depth) uint8 array."""
+        base, hival, lookup = self.color_space[1:4]
+        if isinstance(base, tuple):
+            base = self._document.get_object(base)
+        depth = self.get_color_depth(base) if base is not None else 3
+        if isinstance(lookup, tuple):
+            lookup = self._document.get_object(lookup, search_stream=True)
+            lookup = lookup.decompress() if hasattr(lookup, 'decompress') else lookup
+        if isinstance(lookup, str):
+            try:
+                lookup = bytes.fromhex(lookup)
+            except ValueError:
+                lookup = lookup.encode('latin-1', 'replace')
+        entries = int(hival) + 1
+        table = np.zeros(entries * depth, dtype=np.uint8)
+        lookup = np.frombuffer(bytes(lookup or b''), dtype=np.uint8)[:entries * depth]
+        table[:len(lookup)] = lookup
+        return table.reshape(entries, depth)
+
+    def prepare(self):
+        """Reads everything get_image/write need out of the document (shape, filter, color table).
+
+        After this the image never touches the document again, only its own stream data, so it
+        can be decoded on another thread.
+        """
+        self.shape = self.get_shape()
+        self.bits = self.stream.get_info('BitsPerComponent') or 8
+        self.model = self._color_model()
+        self.palette = self._palette() if self.model == 'indexed' else None
+        # Filters in front of the image filter (i.e. [/ASCII85Decode /DCTDecode]) are run by decompress().
+        pipeline = self.stream.pipeline()
+        self.filter = (pipeline.image_filter or '').lower()
+        # Nothing in front of the image filter, the stream data is the image file as is.
+        self.unfiltered = not pipeline.stages
+        # DCTDecode /ColorTransform, None leaves it to the JPEG data.
+        self.color_transform = (pipeline.image_params or {}).get('ColorTransform')
+        return self
+
+    def _samples(self, data):
+        """Unpacks the samples into a (height, width, depth) uint8 array.
+
+        1, 2 and 4 bit samples are scaled up to 0 - 255 (unless they are palette indices) and
+        16 bit samples keep their high byte.
+        """
+        height, width, depth = self.shape
+        bits = self.bits
+        row_bytes = (width * depth * bits + 7) >> 3
+        data = np.frombuffer(data, dtype=np.uint8)
+        if len(data) < height * row_bytes:
+            # Short images are padded with black rather than failing.
+            data = np.concatenate([data, np.zeros(height * row_bytes - len(data), dtype=np.uint8)])
+        rows = data[:height * row_bytes].reshape(height, row_bytes)
+
+        if bits == 8:
+            return rows.reshape(height, width, depth)
+        if bits == 16:
+            return rows.reshape(height, width * depth, 2)[..., 0].reshape(height, width, depth)
+
+        shifts = np.arange(bits - 1, -1, -1, dtype=np.uint8)
+        packed = np.unpackbits(rows, axis=1)[:, :width * depth * bits].reshape(height, width * depth, bits)
+        samples = (packed << shifts).sum(axis=2, dtype=np.uint8).reshape(height, width, depth)
+        if self.model == 'indexed':
+            return samples
+        return samples * np.uint8(255 // ((1 << bits) - 1))
 
+    def get_image(self):
+        """The image as a (height, width, depth) uint8 array in the PDF's color order (palettes are applied)."""
+        if not hasattr(self, 'shape'):
+            self.prepare()
+
+        if self.filter in ('dctdecode', 'dct'):
+            return JpegDecoder(self.stream.decompress()).decode(self.color_transform)
+        if self.filter == 'jpxdecode':
+            # JPEG 2000, OpenCV has the decoder (it hands back BGR).
+            pixels = cv.imdecode(np.frombuffer(self.stream.decompress(), dtype=np.uint8), cv.IMREAD_UNCHANGED)
+            if pixels is None:
+                raise Exception("Couldn't decode the JPXDecode image.")
+            if pixels.ndim == 2:
+                return pixels[..., None]
+            return pixels[..., 2::-1] if pixels.shape[2] == 3 else pixels
+        if self.filter:
+            raise Exception(f"Can't decode {self.stream.image_filter} images.")
+
+        # Prediction PNG/TIFF is undone in the pipeline too.
+        samples = self._samples(self.stream.decompress())
+        if self.palette is not None:
+            return self.palette[np.minimum(samples[..., 0], len(self.palette) - 1)]
+        return samples
+
+    def write(self, fname):
+        """Writes the image to `fname` + an extension that fits it, returns the full file name.
+
+        JPEG and JPEG 2000 data is written straight to disk without decoding (or copying) it,
+        everything else is decoded and saved as a PNG.
+        """
+        if not hasattr(self, 'shape'):
+            self.prepare()
+
+        if self.filter in self.PASSTHROUGH:
+            fname += self.PASSTHROUGH[self.filter]
+            with open(fname, 'wb') as f:
+                if self.unfiltered:
+                    # A view of the document's bytes, written as is.
+                    f.write(self.stream.data)
+                else:
+                    for chunk in self.stream.iter_decompress():
+                        f.write(chunk)
+            return fname
+
+        pixels = self.get_image()
+        model = 'rgb' if self.palette is not None and pixels.shape[2] == 3 else self.model
+        if model == 'rgb':
+            pixels = pixels[..., ::-1]
+        elif model == 'cmyk' or pixels.shape[2] == 4:
+            # Red = 255 * (1 - C) * (1 - K), Green = 255 * (1 - M) * (1 - K), Blue = 255 * (1 - Y) * (1 - K)
+            cmyk = pixels.astype(np.float32) / 255
+            pixels = (255 * (1 - cmyk[..., 2::-1]) * (1 - cmyk[..., 3:4])).astype(np.uint8)
+        elif pixels.shape[2] not in (1, 3):
+            pixels = pixels[..., :1]
+
+        fname += '.png'
+        ok, png = cv.imencode('.png', np.ascontiguousarray(pixels))
+        if not ok:
+            raise Exception(f"Couldn't encode {fname}.")
+        with open(fname, 'wb') as f:
+            f.write(png.tobytes())
+        return fname
@@ -0,0 +1,566 @@
+from .hufftable import HuffTable
+from array import array
+import numpy as np
+import cv2 as cv
+import re
+
+class JpegComponent:
+
+    def __init__(self, cid, h, v, tq):
+        self.id = cid
+        # Sampling factors and the quantization table id.
+        self.h = h
+        self.v = v
+        self.tq = tq
+        self.dc_table = None
+        self.ac_table = None
+        # Size of the component (in samples) and of its block grid, the grid is padded out to whole MCUs.
+        self.width = self.height = 0
+        self.grid_w = self.grid_h = 0
+        # Every block's 64 coefficients (zigzag order) one after the other, row by row. An int array
+        # rather than a list, NumPy reads it without a copy (and most coefficients are never set).
+        self.blocks = None
+
+class JpegDecoder:
+    """Baseline, extended (8/12 bit) and progressive Huffman JPEG decoder.
+
+    (Source: ITU T.81, Annex F [sequential] and Annex G [progressive])
+    The entropy decoding is the only part that goes coefficient by coefficient: codes are found
+    with one 16 bit peek into the HuffTable lookups and AC coefficients are run length decoded
+    straight into a flat list of coefficients per component. Everything after that runs over all
+    blocks of a component at once in NumPy: dequantization, un-zigzagging and the 8x8 IDCT are one
+    (blocks x 64) x (64 x 64) matrix product, then the chroma is upsampled and the whole image goes
+    through the color conversion.
+
+    libjpeg (through OpenCV) is still a lot faster at the entropy decoding, so decode() hands the
+    image to it whenever its output is the same, this decoder is the fallback for what it gets
+    wrong or can't do (see _libjpeg_transform).
+    """
+    # The natural (row major) position of the k-th coefficient in zigzag order.
+    ZIGZAG = [
+        0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+        12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+        35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+        58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63
+    ]
+    # A marker that isn't a stuffed 0xFF (FF 00) or a restart (FF D0 - FF D7) ends the entropy coded data.
+    SCAN_END = re.compile(rb'\xff(?![\x00\xd0-\xd7])')
+    RESTART = re.compile(rb'\xff[\xd0-\xd7]')
+    # Lets the bit reader peek 3 bytes past the last code.
+    PAD = b'\x00' * 4
+    # Baseline, extended sequential and progressive DCT, all Huffman coded.
+    FRAMES = (0xC0, 0xC1, 0xC2)
+    # Lossless, hierarchical and arithmetic coded frames.
+    UNSUPPORTED = (0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+    _kernel = None
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.width = 0
+        self.height = 0
+        self.precision = 8
+        self.progressive = False
+        self.components = []
+        # { table id: [64 values in zigzag order] }
+        self.quant = {}
+        self.dc_tables = {}
+        self.ac_tables = {}
+        # MCUs between restart markers, 0 when there are none.
+        self.restart_interval = 0
+        # The transform flag of an Adobe APP14 segment (0 none, 1 YCbCr, 2 YCCK).
+        self.adobe_transform = None
+        # True when there is a JFIF APP0 segment.
+        self.jfif = False
+        self.mcus_x = self.mcus_y = 0
+        self.scans = 0
+        # Where _read carries on from, in front of the first scan after a headers_only read.
+        self._pos = 0
+        # Restart intervals that ended early or had a code no table knows, what's left of them stays gray.
+        self.corrupt = 0
+
+    def decode(self, color_transform=None, libjpeg=True):
+        """Decodes the image into a (height, width, components) uint8 array.
+
+        Gray stays one component, YCbCr comes out RGB and YCCK comes out CMYK. CMYK is left the way
+        it was stored (Adobe's inverted CMYK too, in a PDF that's what /Decode is for). `color_transform`
+        is the DCTDecode /ColorTransform of a PDF, an Adobe marker in the data overrides it.
+        With libjpeg=False the image is always decoded here.
+        """
+        # The headers decide whether libjpeg can have it, the scans are only read when it can't.
+        self._read(headers_only=True)
+        if libjpeg:
+            pixels = self._libjpeg(color_transform)
+            if pixels is not None:
+                return pixels
+        self._read()
+        return self._output(color_transform)
+
+    def _libjpeg_transform(self):
+        """The color transform libjpeg picks for 3 components (jdapimin.c default_decompress_parms),
+        it goes by the markers and component ids and never knows about a PDF's /ColorTransform."""
+        if self.jfif:
+            return 1
+        if self.adobe_transform is not None:
+            return 0 if self.adobe_transform == 0 else 1
+        return 0 if [c.id for c in self.components] == [82, 71, 66] else 1
+
+    def _libjpeg(self, color_transform):
+        """The image decoded by libjpeg, None when its output wouldn't match this decoder's.
+
+        That's 8 bit gray, or 3 components that both would (or wouldn't) convert from YCbCr. CMYK
+        and YCCK are left to this decoder since libjpeg turns them into BGR. Needs the headers read.
+        """
+        if self.precision != 8 or len(self.components) not in (1, 3):
+            return None
+        if len(self.components) == 3 and self._transform(color_transform) != self._libjpeg_transform():
+            return None
+
+        try:
+            pixels = cv.imdecode(np.frombuffer(self.data, dtype=np.uint8), cv.IMREAD_UNCHANGED)
+        except cv.error:
+            return None
+        if pixels is None or pixels.shape[:2] != (self.height, self.width):
+            return None
+        if pixels.ndim == 2:
+            return pixels[..., None]
+        # OpenCV hands back BGR.
+        return cv.cvtColor(pixels, cv.COLOR_BGR2RGB)
+
+    def _read(self, headers_only=False):
+        """Reads the markers and decodes every scan.
+
+        With headers_only it stops in front of the first scan, the next call carries on from there.
+        """
+        data = self.data
+        pos = self._pos
+        if not pos:
+            if data[:2] != b'\xff\xd8':
+                raise Exception('Not a JPEG (missing the SOI marker).')
+            pos = 2
+        size = len(data)
+        while pos < size - 1:
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            pos += 2
+            if marker == 0xFF:
+                # Fill bytes in front of a marker.
+                pos -= 1
+                continue
+            if marker == 0xD9:
+                break
+            if marker in (0x00, 0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+                continue
+            if marker == 0xDA and headers_only:
+                self._pos = pos - 2
+                return
+            length = int.from_bytes(data[pos:pos + 2], 'big')
+            segment = data[pos + 2:pos + length]
+            pos += length
+
+            if marker in self.FRAMES:
+                self._frame(marker, segment)
+            elif marker in self.UNSUPPORTED:
+                raise Exception(f"Unsupported JPEG frame type (SOF{marker - 0xC0}).")
+            elif marker == 0xC4:
+                self._huffman_tables(segment)
+            elif marker == 0xDB:
+                self._quant_tables(segment)
+            elif marker == 0xDD:
+                self.restart_interval = int.from_bytes(segment[:2], 'big')
+            elif marker == 0xEE and segment[:5] == b'Adobe' and len(segment) >= 12:
+                self.adobe_transform = segment[11]
+            elif marker == 0xE0 and segment[:5] == b'JFIF\x00':
+                self.jfif = True
+            elif marker == 0xDA:
+                pos = self._scan(segment, pos)
+        if not self.scans:
+            raise Exception('JPEG has no image data.')
+
+    def _frame(self, marker, segment):
+        if self.components:
+            raise Exception('JPEG has more than one frame.')
+        self.progressive = marker == 0xC2
+        self.precision = segment[0]
+        self.height = int.from_bytes(segment[1:3], 'big')
+        self.width = int.from_bytes(segment[3:5], 'big')
+        for i in range(segment[5]):
+            cid, hv, tq = segment[6 + 3 * i:9 + 3 * i]
+            self.components.append(JpegComponent(cid, max(hv >> 4, 1), max(hv & 15, 1), tq))
+        if not (self.width and self.height and self.components):
+            # A height of 0 means it comes later in a DNL marker, nobody writes those.
+            raise Exception('Invalid JPEG frame header.')
+
+        hmax = max(c.h for c in self.components)
+        vmax = max(c.v for c in self.components)
+        self.mcus_x = -(-self.width // (8 * hmax))
+        self.mcus_y = -(-self.height // (8 * vmax))
+        for c in self.components:
+            c.width = -(-self.width * c.h // hmax)
+            c.height = -(-self.height * c.v // vmax)
+            c.grid_w = self.mcus_x * c.h
+            c.grid_h = self.mcus_y * c.v
+
+    def _huffman_tables(self, segment):
+        pos = 0
+        while pos + 17 <= len(segment):
+            table_class, table_id = segment[pos] >> 4, segment[pos] & 15
+            counts = segment[pos + 1:pos + 17]
+            symbols = segment[pos + 17:pos + 17 + sum(counts)]
+            pos += 17 + sum(counts)
+            (self.ac_tables if table_class else self.dc_tables)[table_id] = HuffTable(counts, symbols)
+
+    def _quant_tables(self, segment):
+        pos = 0
+        while pos < len(segment):
+            precision, table_id = segment[pos] >> 4, segment[pos] & 15
+            pos += 1
+            if precision:
+                self.quant[table_id] = [int.from_bytes(segment[pos + 2 * i:pos + 2 * i + 2], 'big') for i in range(64)]
+                pos += 128
+            else:
+                self.quant[table_id] = list(segment[pos:pos + 64])
+                pos += 64
+
+    def _scan(self, segment, start):
+        """Decodes the scan that starts at `start`, returns where its entropy coded data ends."""
+        if not self.components:
+            raise Exception('JPEG scan before the frame header.')
+        if self.components[0].blocks is None:
+            # Only allocated once there is something to decode, a headers_only read doesn't need them.
+            for c in self.components:
+                c.blocks = array('i', bytes(4 * c.grid_w * c.grid_h * 64))
+        count = segment[0]
+        comps = []
+        for i in range(count):
+            cid, tables = segment[1 + 2 * i], segment[2 + 2 * i]
+            comp = next((c for c in self.components if c.id == cid), None)
+            if comp is None:
+                raise Exception(f"JPEG scan has an unknown component {cid}.")
+            comps.append(comp)
+            try:
+                if not self.progressive or segment[1 + 2 * count] == 0:
+                    comp.dc_table = self.dc_tables[tables >> 4]
+                if not self.progressive or segment[1 + 2 * count] > 0:
+                    comp.ac_table = self.ac_tables[tables & 15]
+            except KeyError:
+                raise Exception('JPEG scan uses a Huffman table that was never defined.')
+        ss, se, approx = segment[1 + 2 * count:4 + 2 * count]
+        ah, al = approx >> 4, approx & 15
+
+        mo = self.SCAN_END.search(self.data, start)
+        end = mo.start() if mo else len(self.data)
+        pieces = self.RESTART.split(self.data[start:end]) if self.restart_interval else [self.data[start:end]]
+        which, offsets, unit = self._order(comps)
+
+        if not self.progressive:
+            decode = self._decode_sequential
+        elif ss == 0:
+            decode = self._decode_dc_refine if ah else self._decode_dc_first
+        else:
+            decode = self._decode_ac_refine if ah else self._decode_ac_first
+
+        for p, piece in enumerate(pieces):
+            first = p * unit
+            if first >= len(offsets):
+                break
+            data = np.frombuffer(piece.replace(b'\xff\x00', b'\xff') + self.PAD, dtype=np.uint8).astype(np.int32)
+            # The 24 bits starting at every byte, one list index instead of three.
+            words = (data[:-2] << 16 | data[1:-1] << 8 | data[2:]).tolist()
+            try:
+                decode(comps, words, which, offsets, first, min(first + unit, len(offsets)), ss, se, al)
+            except (TypeError, IndexError, OverflowError):
+                # No code matches the next bits (TypeError on the None entry), the data ran out or garbage
+                # added up to something that isn't a coefficient.
+                self.corrupt += 1
+        self.scans += 1
+        return end
+
+    def _order(self, comps):
+        """([scan component per block], [block offset per block], blocks per restart interval) in decoding order.
+
+        A scan with one component goes through its blocks row by row (only the ones that cover the
+        image), otherwise it goes MCU by MCU and each component has h x v blocks in every MCU.
+        """
+        if len(comps) == 1:
+            c = comps[0]
+            rows = -(-c.height // 8)
+            cols = -(-c.width // 8)
+            offsets = ((np.arange(rows)[:, None] * c.grid_w + np.arange(cols)) * 64).ravel()
+            return [0] * len(offsets), offsets.tolist(), self.restart_interval or len(offsets)
+
+        mcus = self.mcus_x * self.mcus_y
+        which = []
+        offsets = []
+        for i, c in enumerate(comps):
+            rows = np.arange(self.mcus_y)[:, None, None, None] * c.v + np.arange(c.v)[:, None]
+            cols = np.arange(self.mcus_x)[:, None, None] * c.h + np.arange(c.h)
+            offsets.append(((rows * c.grid_w + cols) * 64).reshape(mcus, c.v * c.h))
+            which.append(np.full((mcus, c.v * c.h), i))
+        unit = (self.restart_interval or mcus) * sum(c.h * c.v for c in comps)
+        return np.concatenate(which, axis=1).ravel().tolist(), np.concatenate(offsets, axis=1).ravel().tolist(), unit
+
+    # The decoders below all read the bit stream the same way: `pos` is a bit position into the
+    # unstuffed data and words[pos >> 3] holds the 24 bits from there on (rounded down to a byte),
+    # that's enough for a 16 bit peek or a 16 bit value.
+
+    @staticmethod
+    def _decode_sequential(comps, words, which, offsets, first, last, ss, se, al):
+        dcs = [c.dc_table.lookup for c in comps]
+        acs = [c.ac_table.run_lookup for c in comps]
+        blocks = [c.blocks for c in comps]
+        preds = [0] * len(comps)
+        pos = 0
+        for j in range(first, last):
+            c = which[j]
+            blk = blocks[c]
+            off = offsets[j]
+            e = dcs[c][(words[pos >> 3] >> (8 - (pos & 7))) & 0xFFFF]
+            pos += e >> 8
+            s = e & 255
+            if s:
+                v = (words[pos >> 3] >> (24 - (pos & 7) - s)) & ((1 << s) - 1)
+                pos += s
+                if not v >> (s - 1):
+                    v -= (1 << s) - 1
+                preds[c] += v
+            blk[off] = preds[c]
+
+            ac = acs[c]
+            k = 1
+            while k < 64:
+                bits, run, v, s = ac[(words[pos >> 3] >> (8 - (pos & 7))) & 0xFFFF]
+                pos += bits
+                if run < 0:
+                    break
+                if s:
+                    v = (words[pos >> 3] >> (24 - (pos & 7) - s)) & ((1 << s) - 1)
+                    pos += s
+                    if not v >> (s - 1):
+                        v -= (1 << s) - 1
+                k += run
+                if k > 63:
+                    break
+                blk[off + k] = v
+                k += 1
+
+    @staticmethod
+    def _decode_dc_first(comps, words, which, offsets, first, last, ss, se, al):
+        dcs = [c.dc_table.lookup for c in comps]
+        blocks = [c.blocks for c in comps]
+        preds = [0] * len(comps)
+        pos = 0
+        for j in range(first, last):
+            c = which[j]
+            e = dcs[c][(words[pos >> 3] >> (8 - (pos & 7))) & 0xFFFF]
+            pos += e >> 8
+            s = e & 255
+            if s:
+                v = (words[pos >> 3] >> (24 - (pos & 7) - s)) & ((1 << s) - 1)
+                pos += s
+                if not v >> (s - 1):
+                    v -= (1 << s) - 1
+                preds[c] += v
+            blocks[c][offsets[j]] = preds[c] << al
+
+    @staticmethod
+    def _decode_dc_refine(comps, words, which, offsets, first, last, ss, se, al):
+        blocks = [c.blocks for c in comps]
+        bit = 1 << al
+        pos = 0
+        for j in range(first, last):
+            if words[pos >> 3] >> (23 - (pos & 7)) & 1:
+                blocks[which[j]][offsets[j]] |= bit
+            pos += 1
+
+    @staticmethod
+    def _decode_ac_first(comps, words, which, offsets, first, last, ss, se, al):
+        look = comps[0].ac_table.lookup
+        blk = comps[0].blocks
+        eobrun = 0
+        pos = 0
+        for j in range(first, last):
+            if eobrun:
+                eobrun -= 1
+                continue
+            off = offsets[j]
+            k = ss
+            while k <= se:
+                e = look[(words[pos >> 3] >> (8 - (pos & 7))) & 0xFFFF]
+                pos += e >> 8
+                run = e >> 4 & 15
+                s = e & 15
+                if s:
+                    k += run
+                    if k > 63:
+                        break
+                    v = (words[pos >> 3] >> (24 - (pos & 7) - s)) & ((1 << s) - 1)
+                    pos += s
+                    if not v >> (s - 1):
+                        v -= (1 << s) - 1
+                    blk[off + k] = v << al
+                    k += 1
+                elif run == 15:
+                    k += 16
+                else:
+                    # EOBn, this block and the next 2^run - 1 + (run bits) blocks are done.
+                    eobrun = (1 << run) - 1
+                    if run:
+                        eobrun += (words[pos >> 3] >> (24 - (pos & 7) - run)) & ((1 << run) - 1)
+                        pos += run
+                    break
+
+    @staticmethod
+    def _decode_ac_refine(comps, words, which, offsets, first, last, ss, se, al):
+        """Successive approximation refinement of AC coefficients (T.81 G.1.2.3).
+
+        Coefficients that are already non zero get one correction bit each, new ones (always +-1 at
+        this bit) are placed after `run` zero coefficients, counting only the ones still zero.
+        """
+        look = comps[0].ac_table.lookup
+        blk = comps[0].blocks
+        p1 = 1 << al
+        m1 = -1 << al
+        eobrun = 0
+        pos = 0
+        for j in range(first, last):
+            off = offsets[j]
+            k = ss
+            if eobrun <= 0:
+                while k <= se:
+                    e = look[(words[pos >> 3] >> (8 - (pos & 7))) & 0xFFFF]
+                    pos += e >> 8
+                    run = e >> 4 & 15
+                    s = e & 15
+                    if s:
+                        s = p1 if words[pos >> 3] >> (23 - (pos & 7)) & 1 else m1
+                        pos += 1
+                    elif run != 15:
+                        eobrun = 1 << run
+                        if run:
+                            eobrun += (words[pos >> 3] >> (24 - (pos & 7) - run)) & ((1 << run) - 1)
+                            pos += run
+                        break
+                    while k <= se:
+                        z = off + k
+                        coef = blk[z]
+                        if coef:
+                            if words[pos >> 3] >> (23 - (pos & 7)) & 1 and not coef & p1:
+                                blk[z] = coef + (p1 if coef >= 0 else m1)
+                            pos += 1
+                        else:
+                            if not run:
+                                break
+                            run -= 1
+                        k += 1
+                    if s and k <= se:
+                        blk[off + k] = s
+                    k += 1
+            if eobrun > 0:
+                # The rest of the block only has correction bits, most of the time there's nothing there at all.
+                tail = blk[off + k:off + se + 1]
+                if tail.count(0) != len(tail):
+                    for z, coef in enumerate(tail, off + k):
+                        if coef:
+                            if words[pos >> 3] >> (23 - (pos & 7)) & 1 and not coef & p1:
+                                blk[z] = coef + (p1 if coef >= 0 else m1)
+                            pos += 1
+                eobrun -= 1
+
+    @classmethod
+    def _idct_kernel(cls):
+        """The 64 x 64 matrix that takes a block's zigzag coefficients to its 8 x 8 samples.
+
+        The 2D IDCT is D^T F D with D[u, x] = C(u) / 2 cos((2x + 1) u pi / 16), flattened that's
+        F @ kron(D, D) and the rows are put in zigzag order so the coefficients never get reordered.
+        """
+        if cls._kernel is None:
+            u = np.arange(8)[:, None]
+            x = np.arange(8)[None, :]
+            d = np.cos((2 * x + 1) * u * np.pi / 16) / 2
+            d[0] /= np.sqrt(2)
+            cls._kernel = np.kron(d, d)[cls.ZIGZAG].astype(np.float32)
+        return cls._kernel
+
+    @staticmethod
+    def _triangle(plane, axis):
+        """Doubles `plane` along `axis` like libjpeg's fancy upsampling, each new sample is 3/4 of the
+        nearest input sample and 1/4 of the next nearest one."""
+        shape = list(plane.shape)
+        shape[axis] *= 2
+        out = np.empty(shape, dtype=plane.dtype)
+        # Both work along the first axis (views, out gets filled in place).
+        o = np.moveaxis(out, axis, 0)
+        p = np.moveaxis(plane, axis, 0)
+        quarter = p * 0.25
+        o[0::2] = o[1::2] = p * 0.75
+        o[2::2] += quarter[:-1]
+        o[0] += quarter[0]
+        o[1:-1:2] += quarter[1:]
+        o[-1] += quarter[-1]
+        return out
+
+    def _upsample(self, plane, c, hmax, vmax):
+        fy, ry = divmod(vmax, c.v)
+        fx, rx = divmod(hmax, c.h)
+        if ry or rx:
+            # Odd sampling factors (i.e. 3:2), nearest neighbour.
+            rows = np.arange(self.height) * c.v // vmax
+            cols = np.arange(self.width) * c.h // hmax
+            return plane[rows][:, cols]
+        if fy == 2:
+            plane = self._triangle(plane, 0)
+        elif fy > 1:
+            plane = np.repeat(plane, fy, axis=0)
+        if fx == 2:
+            plane = self._triangle(plane, 1)
+        elif fx > 1:
+            plane = np.repeat(plane, fx, axis=1)
+        return plane[:self.height, :self.width]
+
+    def _transform(self, color_transform):
+        if self.adobe_transform is not None:
+            return self.adobe_transform
+        if color_transform is not None:
+            return int(color_transform)
+        if len(self.components) == 3:
+            # Without a marker 3 components are YCbCr, unless their ids spell out R G B.
+            return 0 if [c.id for c in self.components] == [82, 71, 66] else 1
+        return 0
+
+    def _output(self, color_transform=None):
+        kernel = self._idct_kernel()
+        hmax = max(c.h for c in self.components)
+        vmax = max(c.v for c in self.components)
+        scale = 1 << (self.precision - 8) if self.precision > 8 else 1
+        planes = []
+        for c in self.components:
+            quant = self.quant.get(c.tq)
+            if quant is None:
+                raise Exception('JPEG uses a quantization table that was never defined.')
+            # Dequantization folded into the kernel, one matrix product for every block of the component.
+            samples = np.frombuffer(c.blocks, dtype=np.int32).reshape(-1, 64).astype(np.float32) @ (kernel * np.array(quant, dtype=np.float32)[:, None])
+            plane = samples.reshape(c.grid_h, c.grid_w, 8, 8).transpose(0, 2, 1, 3).reshape(c.grid_h * 8, c.grid_w * 8)
+            plane = plane[:c.height, :c.width]
+            if scale > 1:
+                plane = plane / scale
+            # Samples are whole numbers before they are upsampled, like every other decoder does it.
+            plane = np.clip(np.rint(plane + 128, out=plane), 0, 255, out=plane)
+            planes.append(self._upsample(plane, c, hmax, vmax))
+
+        transform = self._transform(color_transform)
+        pixels = np.empty((self.height, self.width, len(planes)), dtype=np.float32)
+        for i, plane in enumerate(planes):
+            pixels[..., i] = plane
+        if len(planes) >= 3 and transform:
+            y, cb, cr = planes[0], planes[1] - 128, planes[2] - 128
+            pixels[..., 0] = y + 1.402 * cr
+            pixels[..., 1] = y - 0.344136 * cb - 0.714136 * cr
+            pixels[..., 2] = y + 1.772 * cb
+            if len(planes) == 4:
+                # YCCK, the YCbCr part is CMY inverted.
+                pixels[..., :3] = 255 - pixels[..., :3]
+        np.clip(pixels, 0, 255, out=pixels)
+        pixels += 0.5
+        return pixels.astype(np.uint8)
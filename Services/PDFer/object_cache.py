@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+class ObjectCache:
+    """A bounded LRU cache for parsed PDF objects.
+
+    The cache can be bounded by number of entries, total size or both. The size of an entry
+    comes from `sizeof(value)` which defaults to 1 so that without one the two bounds are the same.
+    """
+
+    def __init__(self, max_entries=None, max_size=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._sizeof = sizeof or (lambda value: 1)
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        try:
+            value, size = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            # Would evict everything else and still not fit.
+            return value
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.size += size
+        self._evict()
+        return value
+
+    def pop(self, key, default=None):
+        if key not in self._entries:
+            return default
+        value, size = self._entries.pop(key)
+        self.size -= size
+        return value
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries) or
+            (self.max_size is not None and self.size > self.max_size)
+        ):
+            _, (value, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size': self.size,
+            'max_entries': self.max_entries,
+            'max_size': self.max_size
+        }
@@ -0,0 +1,209 @@
+from .pdf_scanner import PdfLexer
+import re
+
+class ObjectParser:
+    """Parses indirect objects straight from PdfLexer's integer tokens, a faster PDFParser.parse_indirect_object.
+
+    (Source: PDF reference 1.7 Chapter 3, section 2 [3.2])
+    Every token kind maps to an action in ACTIONS and the scalar kinds (numbers, names, strings)
+    to a converter in a table, so the loop is one list index per token and no string compares.
+    Arrays and dictionaries are a stack of open item lists instead of recursive calls, a dictionary
+    is collected as [key, value, key, value, ...] and zipped when it closes, so nesting is only
+    limited by memory. An `R` keyword folds the two numbers in front of it into a reference.
+
+    The values are the ones PDFParser gives: names without the slash, references as
+    (obj_number, gen_number, 'R'), literal strings as str, hex strings as their hex digits and
+    stream data as bytes. Unlike PDFParser the escapes of literal strings and names (#xx) are
+    undone and nested arrays work.
+    """
+    # What to do with each PdfLexer kind.
+    NUMBER, VALUE, OPEN, CLOSE, KEYWORD, SKIP, INVALID = range(7)
+    ACTIONS = [INVALID] * len(PdfLexer.KINDS)
+    for kind in (PdfLexer.WHITESPACE, PdfLexer.COMMENT):
+        ACTIONS[kind] = SKIP
+    # Numbers are most of the tokens (/Widths, /W, matrices) so they are converted right in the loop.
+    ACTIONS[PdfLexer.NUMBER] = NUMBER
+    for kind in (PdfLexer.NAME, PdfLexer.STRING, PdfLexer.HEXSTRING, PdfLexer.STREAM_DATA):
+        ACTIONS[kind] = VALUE
+    for kind in (PdfLexer.DICT_OPEN, PdfLexer.ARRAY_OPEN):
+        ACTIONS[kind] = OPEN
+    for kind in (PdfLexer.DICT_CLOSE, PdfLexer.ARRAY_CLOSE):
+        ACTIONS[kind] = CLOSE
+    ACTIONS[PdfLexer.KEYWORD] = KEYWORD
+    del kind
+
+    CONSTANTS = {b'true': True, b'false': False, b'null': None}
+    NAME_ESCAPE = re.compile(rb'#([0-9A-Fa-f]{2})')
+
+    def __init__(self):
+        self.lexer = PdfLexer()
+        # Converters of the VALUE kinds, (data, start, end) -> value.
+        self.values = [None] * len(PdfLexer.KINDS)
+        self.values[PdfLexer.NUMBER] = self._number
+        self.values[PdfLexer.NAME] = self._name
+        self.values[PdfLexer.STRING] = self._string
+        self.values[PdfLexer.HEXSTRING] = self._hex_string
+        self.values[PdfLexer.STREAM_DATA] = self._stream_data
+
+    @staticmethod
+    def _number(data, start, end):
+        value = data[start:end]
+        return float(value) if b'.' in value else int(value)
+
+    @classmethod
+    def _name(cls, data, start, end):
+        name = data[start + 1:end]
+        if b'#' in name:
+            # #xx is a byte written in hex (PDF 1.2+).
+            name = cls.NAME_ESCAPE.sub(lambda mo: bytes([int(mo.group(1), 16)]), name)
+        return name.decode('latin-1')
+
+    @staticmethod
+    def _string(data, start, end):
+        return PdfLexer.string_value(data, start, end).decode('latin-1')
+
+    @staticmethod
+    def _hex_string(data, start, end):
+        return ''.join(data[start + 1:end - 1].decode('latin-1').split())
+
+    @staticmethod
+    def _stream_data(data, start, end):
+        return data[start:end]
+
+    def parse_indirect_object(self, data):
+        """{ obj_number, gen_number, values } of the `N G obj ... endobj` in data (bytes or a memoryview)."""
+        data = bytes(data)
+        tokens = self.lexer.tokens(data)
+        header = []
+        for kind, start, end in tokens:
+            if self.ACTIONS[kind] == self.SKIP:
+                continue
+            header.append((kind, start, end))
+            if len(header) == 3:
+                break
+        if len(header) < 3 or header[0][0] != PdfLexer.NUMBER or header[1][0] != PdfLexer.NUMBER \
+                or data[header[2][1]:header[2][2]] != b'obj':
+            raise Exception('Not an indirect object, expected "N G obj".')
+
+        return {
+            'obj_number': self._number(data, *header[0][1:]),
+            'gen_number': self._number(data, *header[1][1:]),
+            'values': self.parse_tokens(data, tokens, stop=b'endobj')
+        }
+
+    def parse_trailer(self, data):
+        """The dictionary after the first `trailer` keyword in data, keys lowercased like PDFParser.trailer."""
+        data = bytes(data)
+        tokens = self.lexer.tokens(data)
+        for kind, start, end in tokens:
+            if kind == PdfLexer.KEYWORD and data[start:end] == b'trailer':
+                break
+        else:
+            raise Exception('No trailer found.')
+        values = self.parse_tokens(data, tokens, stop=b'startxref')
+        if not values or not isinstance(values[0], dict):
+            raise Exception('Trailer is not a dictionary.')
+        return {k.lower(): v for k, v in values[0].items()}
+
+    def parse_xref_table(self, data):
+        """(xref, trailer) of a classic cross-reference table and the trailer after it, like PDFParser.parse.
+
+        (Source: PDF reference 1.7 Chapter 3, section 4, subsection 3 [3.4.3])
+        After the `xref` keyword come subsections, a "first_obj_number count" line and then
+        `count` entries of "byte_offset gen_number n|f".
+        """
+        data = bytes(data)
+        tokens = self.lexer.tokens(data)
+        kind, start, end = next(tokens, (None, 0, 0))
+        if kind != PdfLexer.KEYWORD or data[start:end] != b'xref':
+            raise Exception('Not an xref table, expected "xref".')
+
+        # Every number and n/f flag up to the trailer, in order.
+        fields = []
+        for kind, start, end in tokens:
+            if kind == PdfLexer.NUMBER:
+                fields.append(int(data[start:end]))
+            elif kind == PdfLexer.KEYWORD:
+                word = data[start:end]
+                if word == b'trailer':
+                    break
+                fields.append(word == b'n')
+            elif kind != PdfLexer.COMMENT:
+                raise Exception(f"Unexpected {data[start:end].decode('latin-1')} in the xref table at byte {start}.")
+        else:
+            raise Exception('Xref table has no trailer.')
+
+        table = {}
+        i = 0
+        while i + 1 < len(fields):
+            first, count = fields[i], fields[i + 1]
+            i += 2
+            if len(fields) < i + 3 * count:
+                raise Exception(f"Xref subsection {first} {count} is cut short.")
+            for obj_number in range(first, first + count):
+                table[obj_number] = {'byte_offset': fields[i], 'gen_number': fields[i + 1], 'in_use': fields[i + 2] is True}
+                i += 3
+
+        values = self.parse_tokens(data, tokens, stop=b'startxref')
+        if not values or not isinstance(values[0], dict):
+            raise Exception('Trailer is not a dictionary.')
+        return table, {k.lower(): v for k, v in values[0].items()}
+
+    def parse_tokens(self, data, tokens, stop=None):
+        """The list of objects in `tokens` ((kind, start, end) of `data`, i.e. PdfLexer.tokens() or zip(*PdfLexer.lex())).
+
+        Parsing ends at the `stop` keyword (outside of any array/dictionary) or when the tokens run out.
+        """
+        actions = self.ACTIONS
+        values = self.values
+        constants = self.CONSTANTS
+        NUMBER, VALUE, OPEN, CLOSE, KEYWORD, SKIP = self.NUMBER, self.VALUE, self.OPEN, self.CLOSE, self.KEYWORD, self.SKIP
+        dict_open = PdfLexer.DICT_OPEN
+        dict_close = PdfLexer.DICT_CLOSE
+
+        top = []
+        items = top
+        # The item lists of the enclosing arrays/dictionaries and the kind that opened `items`.
+        stack = []
+        opened = []
+        for kind, start, end in tokens:
+            action = actions[kind]
+            if action == NUMBER:
+                value = data[start:end]
+                items.append(float(value) if b'.' in value else int(value))
+            elif action == VALUE:
+                items.append(values[kind](data, start, end))
+            elif action == OPEN:
+                stack.append(items)
+                opened.append(kind)
+                items = []
+            elif action == CLOSE:
+                if not opened or (opened[-1] == dict_open) != (kind == dict_close):
+                    raise Exception(f"Unbalanced {data[start:end].decode('latin-1')} at byte {start}.")
+                if opened.pop() == dict_open:
+                    if len(items) & 1:
+                        # A key without a value.
+                        items.append(None)
+                    value = dict(zip(items[::2], items[1::2]))
+                else:
+                    value = items
+                items = stack.pop()
+                items.append(value)
+            elif action == KEYWORD:
+                word = data[start:end]
+                if word in constants:
+                    items.append(constants[word])
+                elif word == b'R' and len(items) >= 2 and type(items[-1]) is int and type(items[-2]) is int:
+                    gen_number = items.pop()
+                    items[-1] = (items[-1], gen_number, 'R')
+                elif word == stop and not opened:
+                    break
+                elif word != b'stream' and word != b'endstream':
+                    # The data in between is its own STREAM_DATA token.
+                    raise Exception(f"Unexpected keyword {word.decode('latin-1')} at byte {start}.")
+            elif action != SKIP:
+                raise Exception(f"Unexpected {data[start:end].decode('latin-1')} at byte {start}.")
+
+        if opened:
+            raise Exception('Unterminated ' + ('dictionary.' if opened[-1] == dict_open else 'array.'))
+        return top
@@ -0,0 +1,39 @@
+from array import array
+
+class ObjectStream:
+    """A compressed object stream (/Type /ObjStm).
+
+    The stream is inflated once when this is created, after that every object inside of it
+    is just a slice of the decoded data using the offset table from the stream's header.
+    `table` is the `table` of an earlier ObjectStream for the same stream, passing it back in
+    skips parsing the header again.
+    """
+
+    def __init__(self, stream, table=None):
+        if stream.get_info('Type') != 'ObjStm':
+            raise Exception('Incorrect format, object is not an object stream.')
+        self.data = memoryview(stream.decompress())
+        if table is None:
+            first = stream.get_info('First')
+            count = stream.get_info('N')
+            # The header is N pairs of integers: "obj_number byte_offset ..." offsets are relative to First.
+            header = [int(x) for x in bytes(self.data[:first]).split()[:2 * count]]
+            numbers = array('q', header[0::2])
+            offsets = array('q', [first + off for off in header[1::2]])
+            offsets.append(len(self.data))
+            table = (numbers, offsets, {n: i for i, n in enumerate(numbers)})
+        self.numbers, self.offsets, self._index = table
+
+    @property
+    def table(self):
+        """The parsed offset table, (numbers, offsets, index by obj_number)."""
+        return self.numbers, self.offsets, self._index
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def get_object(self, obj_number, index=None):
+        """Returns a memoryview of the object's bytes, the index from the xref is checked first."""
+        if index is None or index >= len(self.numbers) or self.numbers[index] != obj_number:
+            index = self._index[obj_number]
+        return self.data[self.offsets[index]:self.offsets[index + 1]]
@@ -1,18 +1,26 @@
 
 class Page:
 
-    def __init__(self, pdfdoc, page_object):
-        if page_object.pop('Type') != 'Page':
+    def __init__(self, pdfdoc, page_object, inherited=None):
+        # page_object is shared with the document's object cache so it is only read from.
+        if page_object.get('Type') != 'Page':
             raise Exception('Incorrect format, object is not a page.')
         self._document = pdfdoc
-        # Required
-        self._resources = page_object.pop('Resources')
+        # Resources, MediaBox, CropBox and Rotate can come from the page tree (see Catalog.INHERITABLE).
+        inherited = inherited or {}
+        # Required (inheritable)
+        self._resources = page_object.get('Resources', inherited.get('Resources', {}))
         # Optional
-        self._contents = page_object.pop('Contents') if 'Contents' in page_object else None
+        self._contents = page_object.get('Contents')
         # Leftovers
         self._page_info = {}
         for k, v in page_object.items():
+            if k in ['Type', 'Resources', 'Contents']:
+                continue
             self._page_info[k.lower()] = v
+        for k, v in inherited.items():
+            if k != 'Resources' and k not in page_object:
+                self._page_info[k.lower()] = v
 
     def resources(self):
         if isinstance(self._resources, tuple):
@@ -27,6 +35,20 @@ class Page:
             return self._document.get_object(self._contents, search_stream=True)
         return self._contents
 
+    def content_streams(self, cache=True):
+        """Every content stream of the page, /Contents can be one stream or an array of them."""
+        contents = self._contents
+        if isinstance(contents, tuple):
+            # An indirect array of streams.
+            contents = self._document.get_object(contents, search_stream=True, cache=cache)
+            if not isinstance(contents, list):
+                return [contents]
+        if not contents:
+            return []
+        if not isinstance(contents, list):
+            contents = [contents]
+        return [self._document.get_object(c, search_stream=True, cache=cache) for c in contents]
+
     def get_info(self, key):
         return self._page_info.get(key.lower())
 
@@ -2,22 +2,93 @@ from .pdf_doc import PdfDoc
 from .catalog import Catalog
 from .font_table import FontTable
 from .image_stream import ImageStream
+from .doc_index import DocIndex
+from .byte_source import ByteSource
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pprint import pprint
 import cv2 as cv
+import os
+from os.path import join
+
+# The PdfBase of a text extraction worker process, see PdfBase.extract_text.
+_worker_base = None
+
+def _init_text_worker(file_name, index):
+    global _worker_base
+    _worker_base = PdfBase(file_name, index=DocIndex.loads(index))
+    _worker_base.create_catalog()
+
+def _text_worker(page_number):
+    return next(_worker_base.iter_text([page_number]))
 
 class PdfBase:
 
-    def __init__(self, file_name):
-        self.document = PdfDoc(file_name)
+    def __init__(self, file_name, index_store=None, content_hash=False, index=None, first_page=False):
+        # Optional DocIndex store (DirectoryStore, RedisStore, ...) to skip reparsing on reopen.
+        # Indexes are keyed by path and mtime, documents that aren't local files (see ByteSource) don't get one.
+        self.index_store = index_store if ByteSource.is_local(file_name) else None
+        self.content_hash = content_hash
+        # A DocIndex can also be handed over directly (i.e. from another process that already parsed the file).
+        self._index = index
+        if self._index is None and index_store:
+            self._index = DocIndex.load(index_store, file_name, content_hash)
+        # With first_page a linearized document serves page 1 before the main xref and the page tree are read.
+        self.document = PdfDoc(file_name, index=self._index, first_page=first_page)
         self.catalog = Catalog(self.document)
         self.fonts = FontTable(self.document)
         self.total_pages = 0
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self.index_store is not None and not self.document.closed and self._index_outdated():
+            self.save_index()
+        self.document.close()
+
     def create_catalog(self):
-        root = self.document.get_trailer('root')
-        self.catalog.setup(root)
+        if self._index is not None and self._index.catalog:
+            self.catalog.restore(self._index.catalog, self._index.pages)
+            self.fonts.load(self._index.fonts)
+        elif self.document.partial:
+            # Linearized, the hint dictionary has the first page and the page count.
+            self.catalog.first_page = (self.document.linearized['O'], 0, 'R')
+            self.catalog.setup(self.document.get_trailer('root'))
+            self.total_pages = self.document.linearized.get('N') or len(self.catalog.pages)
+            return
+        else:
+            root = self.document.get_trailer('root')
+            self.catalog.setup(root)
         self.total_pages = len(self.catalog.pages)
 
+    def _index_outdated(self):
+        if self._index is None:
+            return True
+        return (self.catalog.pages is not None and not self._index.catalog) or len(self.fonts.font_table) > len(self._index.fonts)
+
+    def save_index(self):
+        self._index = self.build_index()
+        self._index.save(self.index_store, self.document.fname, self.content_hash)
+
+    def build_index(self):
+        doc = self.document
+        doc.load_xref()
+        # Walks the whole page tree (once), the index keeps every page reference.
+        catalog = self.catalog.toJSON() if self.catalog.pages is not None else {}
+        return DocIndex(
+            doc._start,
+            doc.xref.starts,
+            doc.xref.ends,
+            catalog.get('pages', []),
+            doc.get_trailer(),
+            doc.xref.compressed,
+            catalog,
+            self.fonts.dump()
+        )
+
     def _get_page(self, page_number):
         return self.catalog.get_page(page_number)
 
@@ -29,11 +100,61 @@ class PdfBase:
         resources = self._get_page(page_number).resources()
         self.fonts.add_font(resources.get('Font'))
 
+    def _page_data(self, page, cache=True):
+        # Content arrays are one stream split up, they are decoded as if they were joined.
+        return b'\n'.join(s.decompress() for s in page.content_streams(cache=cache))
+
     def get_page_text(self, page_number):
-        #TODO: make this a separate process/thread
         self.add_fonts(page_number)
-        content_stream = self._get_page(page_number).content()
-        return self.fonts.decode_content(content_stream)
+        return self.fonts.decode_data(self._page_data(self._get_page(page_number)))
+
+    def get_text_runs(self, page_number):
+        """The positioned TextRuns of a page, see ContentInterpreter."""
+        self.add_fonts(page_number)
+        return self.fonts.text_runs(self._page_data(self._get_page(page_number)))
+
+    def iter_text(self, pages=None):
+        """Yields (page_number, text) one page at a time for `pages` (default is every page).
+
+        Content streams are read around the object caches and dropped as soon as their page
+        is decoded, fonts come from the font table's bounded cache, so memory stays flat no
+        matter how many pages the document has.
+        """
+        if self.catalog.pages is None:
+            self.create_catalog()
+        pages = range(1, self.total_pages + 1) if pages is None else pages
+
+        for page_number in pages:
+            if page_number > self.total_pages:
+                raise Exception(f"Page not found there are only {self.total_pages} pages.")
+            page = self._get_page(page_number)
+            fonts = self.fonts.page_fonts(page.resources().get('Font'))
+            data = self._page_data(page, cache=False)
+            text = self.fonts.decode_data(data, fonts)
+            del data
+            yield page_number, text
+
+    def extract_text(self, pages=None, workers=None, chunksize=None):
+        """Returns [(page_number, text), ...] in page order for `pages` (default is every page).
+
+        The pages are split over a pool of `workers` processes (default is one per cpu), each one
+        opens its own PdfDoc from this document's index so the xref and page map are never parsed
+        again. Pages are sent `chunksize` at a time to keep the IPC overhead down.
+        """
+        if self.catalog.pages is None:
+            self.create_catalog()
+        pages = list(range(1, self.total_pages + 1)) if pages is None else list(pages)
+        workers = workers or os.cpu_count() or 1
+        workers = min(workers, len(pages))
+
+        if workers <= 1 or not ByteSource.is_local(self.document.source):
+            # The workers reopen the document by name, only a local file can be opened that way.
+            return list(self.iter_text(pages))
+
+        chunksize = chunksize or max(1, len(pages) // (workers * 4))
+        index = self.build_index().dumps()
+        with ProcessPoolExecutor(workers, initializer=_init_text_worker, initargs=(self.document.fname, index)) as pool:
+            return list(pool.map(_text_worker, pages, chunksize=chunksize))
 
     def get_page_xobjects(self, page_number):
         res = self._get_page(page_number).resources()
@@ -56,6 +177,86 @@ class PdfBase:
                 images[k] = ImageStream(self.document, x_stream)
         return images
 
+    def _page_image_streams(self, page, page_number, seen):
+        """Yields (ref, stream) for the image XObjects of a page (and of the forms it draws) that aren't in `seen` yet."""
+        resources = [page.resources()]
+        while resources:
+            res = resources.pop()
+            if isinstance(res, tuple):
+                res = self.document.get_object(res)
+            x_object = res.get('XObject') if isinstance(res, dict) else None
+            if isinstance(x_object, tuple):
+                x_object = self.document.get_object(x_object)
+            if not isinstance(x_object, dict):
+                continue
+            for ref in x_object.values():
+                if not isinstance(ref, tuple):
+                    continue
+                key = ref[:2]
+                if key in seen:
+                    if seen[key][-1] != page_number:
+                        seen[key].append(page_number)
+                    continue
+                seen[key] = [page_number]
+                # Not cached, every image is only looked at once.
+                x_stream = self.document.get_object(ref, search_stream=True, cache=False)
+                if not hasattr(x_stream, 'get_info'):
+                    continue
+                subtype = x_stream.get_info('Subtype')
+                if subtype == 'Image':
+                    yield ref, x_stream
+                elif subtype == 'Form' and x_stream.get_info('Resources') is not None:
+                    resources.append(x_stream.get_info('Resources'))
+
+    @staticmethod
+    def _write_image(image, fname):
+        try:
+            return image.write(fname), None
+        except Exception as e:
+            return None, str(e)
+
+    def export_images(self, out_dir, workers=None, pages=None):
+        """Writes every image XObject of `pages` (default is every page) into out_dir, returns what was written.
+
+        Each page is visited once and an image shared between pages is only written once (by
+        object number). JPEG/JPEG 2000 data is copied straight to disk, Flate/raw images are
+        decoded with NumPy and saved as PNGs on a pool of `workers` threads, zlib, NumPy and the
+        file writes all let go of the GIL. Returns [{ 'object', 'pages', 'filter', 'file', 'error' }]
+        sorted by object number.
+        """
+        if self.catalog.pages is None:
+            self.create_catalog()
+        pages = range(1, self.total_pages + 1) if pages is None else pages
+        workers = workers or os.cpu_count() or 1
+        os.makedirs(out_dir, exist_ok=True)
+
+        # { ref[:2]: [page_number, ...] }
+        seen = {}
+        results = {}
+        pending = {}
+        with ThreadPoolExecutor(workers) as pool:
+            for page_number in pages:
+                page = self._get_page(page_number)
+                for ref, x_stream in self._page_image_streams(page, page_number, seen):
+                    image = ImageStream(self.document, x_stream).prepare()
+                    key = ref[:2]
+                    results[key] = {'object': key[0], 'filter': x_stream.get_info('Filter'), 'file': None, 'error': None}
+                    fname = join(out_dir, f"img{key[0]}-{key[1]}")
+                    pending[pool.submit(self._write_image, image, fname)] = key
+                    if len(pending) >= workers * 4:
+                        # Only a few images decoded ahead of the disk.
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            done_key = pending.pop(future)
+                            results[done_key]['file'], results[done_key]['error'] = future.result()
+            for future in list(pending):
+                key = pending.pop(future)
+                results[key]['file'], results[key]['error'] = future.result()
+
+        for key, result in results.items():
+            result['pages'] = seen[key]
+        return [results[k] for k in sorted(results)]
+
     def get_json(self, flag=None, args=None):
         if flag == 'catalog':
             return self.catalog.toJSON()
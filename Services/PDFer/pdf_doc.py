@@ -1,99 +1,453 @@
-from .pdf_scanner import PdfScanner
-from .pdf_parser import PDFParser
+from .object_parser import ObjectParser
 from .xref import XRef
 from .stream import Stream
+from .object_cache import ObjectCache
+from .object_stream import ObjectStream
+from .recovery import XRefRecovery
+from .byte_source import ByteSource
 from pprint import pprint
-from os.path import abspath
 import re
 
 class PdfDoc:
     """Should be parent class that provides fast access to the Pdf objects.
     This access can be via the file or come from redis.
     """
-    def __init__(self, fname):
-        #TODO: use redis to check for existing record
-        self.scanner = PdfScanner()
-        self.parser = PDFParser()
-        self.fname = abspath(fname)
-        self._start = self._find_xref_start()
-        t_xref, self._trailer = self._parse_file_tail()
-        self.xref = XRef(self._start, self.fname, t_xref)
+    LINEARIZED_REGEX = re.compile(br'\d+\s+\d+\s+obj\s*<<(?:(?!>>).)*?/Linearized.*?endobj', re.S)
+    def __init__(self, fname, cache_entries=2048, stream_cache_bytes=32 * 1024 * 1024, index=None, first_page=False):
+        # Objects, xref tables and trailers are all parsed from the PdfLexer's tokens.
+        self.object_parser = ObjectParser()
+        # `fname` is a path or anything else ByteSource.open takes (bytes, a BytesIO, a zip member, an http url).
+        self.source = ByteSource.open(fname)
+        self.fname = self.source.name
+        # Parsed objects are cached by (obj_number, gen_number). Streams get their own cache
+        # bounded by bytes so a few big images can't push out all of the small dictionaries.
+        self.objects = ObjectCache(max_entries=cache_entries)
+        self.streams = ObjectCache(max_entries=cache_entries, max_size=stream_cache_bytes, sizeof=lambda s: len(s.data))
+        # Decoded object streams by stream_obj_number. The decoded data is bounded by the same byte
+        # budget as the streams on purpose: a file with hundreds of MB of object streams would
+        # otherwise keep all of it alive, so an evicted one is inflated again when it is next needed.
+        # Their offset tables are small (two ints per object, like xref.compressed) and are kept
+        # for the life of the document so that re-inflating never parses the header twice.
+        self._object_streams = ObjectCache(max_size=stream_cache_bytes, sizeof=lambda o: len(o.data))
+        self._object_stream_tables = {}
+        # True when the xref had to be rebuilt by scanning the file.
+        self.recovered = False
+        # The linearization parameter dictionary ({ 'L', 'H', 'O', 'E', 'N', 'T' }) when first_page found one.
+        self.linearized = None
+        # True while only the first page section of a linearized file is loaded, see load_xref.
+        self.partial = False
+        # Byte offsets of the xref sections that were read, newest first.
+        self.sections = []
+        self.xref = None
+        if index is not None:
+            # A saved DocIndex (see doc_index.py) skips all of the xref and trailer parsing.
+            self._start = index.xref_start
+            self._trailer = index.trailer
+            self.xref = XRef.from_index(index, self.source)
+            return
+        if first_page and self._load_first_page():
+            return
+        self.load_xref()
+
+    def load_xref(self):
+        """Reads the whole chain of xref sections (a no-op once it has been read)."""
+        if self.xref is not None and not self.partial:
+            return
+        self.partial = False
+        try:
+            self._start = self._find_xref_start()
+            t_xref, self._trailer = self._parse_file_tail()
+            self.xref = XRef(self._start, self.source, t_xref, self.sections + self._superseded)
+            self._check_root()
+        except Exception:
+            self._trailer = self._recover()
+            self.recovered = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    @property
+    def closed(self):
+        return self.source.closed
+
+    def close(self):
+        """Releases the source (the file map and handle), objects fetched from the document are no longer valid."""
+        if self.source.closed:
+            return
+        self.objects.clear()
+        self.streams.clear()
+        self._object_streams.clear()
+        self._object_stream_tables.clear()
+        self.source.close()
 
     def _find_xref_start(self):
         """This finds the starting byte address of the cross reference table in a PDF. 
         """
-        location = None
-        with open(self.fname, 'rb') as f:
-            # TODO replace the arbitrary -200 with a guarenteed length.
-            f.seek(-200, 2)
-            arch = f.read().splitlines()
-        count = 0
-        for x in arch[::-1]:
-            if count == 1:
-                location = int(x, 10)
-                break
-            else:
-                count += 1
-        return location
+        pos = self.source.rfind(b'startxref')
+        if pos < 0:
+            raise Exception('No startxref found.')
 
-    def _parse_file_tail(self):
+        m = re.match(br'startxref\s+(\d+)', self.source[pos:pos + 64])
+        if m is None or int(m.group(1)) >= len(self.source):
+            raise Exception('Invalid startxref.')
 
-        end_regex = re.compile(br'^%%EOF.*?', re.S)
-        
-        with open(self.fname, 'rb') as f:
-            f.seek(self._start, 0)
-            lines = f.read().splitlines()
-            ref_lines = []
+        return int(m.group(1))
+
+    def _check_root(self):
+        """Makes sure the xref actually points at the catalog, bad offsets usually show up here first."""
+        root = self._trailer.get('root')
+        if not isinstance(root, tuple):
+            raise Exception('Trailer has no root.')
+
+        header = re.match(br'\s*(\d+)\s+(\d+)\s+obj', self._raw_object(root))
+        if header is None or int(header.group(1)) != root[0]:
+            raise Exception(f"Xref offset of the root object {root[0]} is wrong.")
+
+    def _recover(self):
+        """Rebuilds the xref and trailer from every object header and trailer in the file."""
+        self.objects.clear()
+        self.streams.clear()
+        self._object_streams.clear()
+        self._object_stream_tables.clear()
+
+        scanner = XRefRecovery(self.source.buffer())
+        xref = scanner.scan()
+        self._start = len(self.source)
+        self.xref = XRef(self._start, self.source, xref)
+
+        trailer = {}
+        for pos in scanner.trailers:
+            try:
+                trailer.update(self.object_parser.parse_trailer(self.source[pos:pos + 4096]))
+            except Exception:
+                continue
+
+        object_streams = []
+        for n in scanner.objects_containing(b'/ObjStm'):
+            try:
+                objstm = self._object_stream(n)
+            except Exception:
+                continue
+            object_streams.append((n, objstm))
+            for index, k in enumerate(objstm.numbers):
+                if k not in self.xref:
+                    self.xref.compressed[k] = (n, index)
+
+        # PDF 1.5+ files keep the trailer in the xref stream dictionary.
+        for n in scanner.objects_containing(b'/XRef'):
+            try:
+                x_stream = self.get_object(n, search_stream=True)
+            except Exception:
+                continue
+            if isinstance(x_stream, Stream) and x_stream.get_info('Type') == 'XRef':
+                for k, v in x_stream.get_info().items():
+                    if k in ['Root', 'Info', 'ID', 'Encrypt']:
+                        trailer[k.lower()] = v
 
-            for l in lines:
+        if 'root' not in trailer or trailer['root'] not in self.xref:
+            for n in scanner.objects_containing(b'/Catalog'):
+                try:
+                    obj = self.get_object(n)
+                except Exception:
+                    continue
+                if isinstance(obj, dict) and obj.get('Type') == 'Catalog':
+                    trailer['root'] = (n, xref[n]['gen_number'] if n in xref else 0, 'R')
 
-                ref_lines.append(l)
-                if re.match(end_regex, l):
+        if 'root' not in trailer or trailer['root'] not in self.xref:
+            # PDF 1.5+ writers usually pack the catalog into an object stream, the raw scan can't see it there.
+            for n, objstm in object_streams:
+                if b'/Catalog' not in bytes(objstm.data):
+                    continue
+                for k in objstm.numbers:
+                    if self.xref.compressed.get(k, (None,))[0] != n:
+                        continue
+                    try:
+                        obj = self.get_object(k)
+                    except Exception:
+                        continue
+                    if isinstance(obj, dict) and obj.get('Type') == 'Catalog':
+                        trailer['root'] = (k, 0, 'R')
+                        break
+                if 'root' in trailer and trailer['root'] in self.xref:
                     break
 
-            ref_table = b'\n'.join(ref_lines)
+        if 'root' not in trailer or trailer['root'] not in self.xref:
+            raise Exception('Damaged file, no document catalog found.')
 
-        xref, trailer = self.parser.parse(self.scanner.tokenize(str(ref_table, 'utf-8')))
-            
+        trailer['size'] = max([len(self.xref.starts)] + [k + 1 for k in self.xref.compressed])
+        return trailer
 
-        if 'prev' in trailer:
-            self._start = trailer['prev']
-            x_2, t_2 = self._parse_file_tail()
-            xref.update(x_2)
-            trailer.update(t_2)
+    def _parse_file_tail(self):
+        """Walks the chain of xref sections from the newest one back through /Prev.
 
+        (Source: PDF reference 1.7 Chapter 3, section 4, subsection 5 [3.4.5])
+        Every incremental update appends a section that only lists the objects it changed, so the
+        first (newest) entry found for an object wins and the older sections only fill in the rest.
+        The trailer keys work the same way.
+        """
+        xref = {}
+        trailer = {}
+        self.sections = []
+        # Older revisions of an object are still in the file, they're where the object in front of them ends.
+        self._superseded = []
+        start = self._start
+        while start is not None:
+            if start in self.sections:
+                raise Exception(f"Xref /Prev chain loops back to byte {start}.")
+            x_section, t_section = self._parse_section(start)
+            self.sections.append(start)
+            for k, v in x_section.items():
+                if k not in xref:
+                    xref[k] = v
+                elif v.get('in_use', True) and 'byte_offset' in v:
+                    self._superseded.append(v['byte_offset'])
+            for k, v in t_section.items():
+                trailer.setdefault(k, v)
+            start = t_section.get('prev')
         return xref, trailer
 
+    def _parse_section(self, start):
+        """The (xref, trailer) of the one section at `start`, a classic table or a PDF 1.5+ xref stream."""
+        if start >= len(self.source):
+            raise Exception(f"Xref section at byte {start} is past the end of the file.")
+
+        if not bytes(self.source[start:start + 32]).lstrip().startswith(b'xref'):
+            return self._parse_xref_stream(start)
+
+        xref, trailer = self._parse_xref_table(start)
+        if 'xrefstm' in trailer:
+            # Hybrid file, the compressed objects are only listed in the hidden xref stream.
+            x_s, t_s = self._parse_xref_stream(trailer['xrefstm'])
+            xref.update(x_s)
+        return xref, trailer
+
+    def _parse_xref_table(self, start):
+        # The table and its trailer run up to the section's startxref (or %%EOF when that's missing).
+        end = self.source.find(b'startxref', start)
+        if end < 0:
+            end = self.source.find(b'%%EOF', start)
+        ref_table = bytes(self.source[start:end if end >= 0 else len(self.source)])
+
+        return self.object_parser.parse_xref_table(ref_table)
+
+    def _object_bytes(self, start, window=4096):
+        """The bytes of the (stream) object at `start`, only as far as its direct /Length says it goes.
+
+        Objects without a usable /Length get the rest of the file.
+        """
+        while True:
+            head = self.source[start:start + window]
+            m = Stream.START_REGEX.search(head)
+            if m is not None or start + window >= len(self.source):
+                break
+            window *= 4
+        if m is None:
+            return self.source[start:]
+        try:
+            length = self._indirect_values(bytes(head[:m.start()]) + b'endobj').get('Length')
+        except Exception:
+            length = None
+        if not isinstance(length, int):
+            return self.source[start:]
+        # Room for the end of line, endstream and endobj after the data.
+        return self.source[start:start + m.end() + length + 64]
+
+    def _parse_xref_stream(self, start):
+        stream = self._stream_object(self._object_bytes(start))
+        if not isinstance(stream, Stream) or stream.get_info('Type') != 'XRef':
+            raise Exception(f"Object at byte {start} is not an xref stream.")
+
+        # The stream dictionary doubles as the trailer.
+        skip = ['Type', 'W', 'Index', 'Length', 'Filter', 'DecodeParms']
+        trailer = {k.lower(): v for k, v in stream.get_info().items() if k not in skip}
+        return XRef.decode_stream(stream), trailer
+
+    def _linearization(self):
+        """The linearization parameter dictionary and the byte where the first page xref section starts.
+
+        (Source: PDF reference 1.7 Appendix F, section 2, subsection 2 [F.2.2])
+        It has to be the first object in the file (within the first 1024 bytes). When /L isn't the
+        length of the file anymore it was updated after it was linearized and the hints are useless.
+        """
+        m = self.LINEARIZED_REGEX.search(bytes(self.source[0:1024]))
+        if m is None:
+            return None, None
+        try:
+            info = self._indirect_values(m.group(0))
+        except Exception:
+            return None, None
+        if not isinstance(info, dict) or info.get('L') != len(self.source) or not isinstance(info.get('O'), int):
+            return None, None
+        start = m.end()
+        head = bytes(self.source[start:start + 64])
+        return info, start + len(head) - len(head.lstrip())
+
+    def _load_first_page(self):
+        """Loads only the first page section of a linearized file, the rest of the xref is read when it's needed.
+
+        Everything page 1 needs (the catalog, the page object /O, its resources and contents) is
+        listed in the first section and sits in front of byte /E, so on a slow source that whole
+        range is fetched up front in one read.
+        """
+        info, start = self._linearization()
+        if info is None:
+            return False
+        try:
+            t_xref, trailer = self._parse_section(start)
+        except Exception:
+            return False
+        if not isinstance(trailer.get('root'), tuple):
+            return False
+        end = info.get('E') if isinstance(info.get('E'), int) else len(self.source)
+        self.source.prefetch(0, end)
+        self.linearized = info
+        self.partial = True
+        self._start = start
+        self._trailer = trailer
+        self.sections = [start]
+        self.xref = XRef(start, self.source, t_xref, [end])
+        return True
+
     def _indirect_values(self, data):
-        indirect = self.parser.parse_indirect_object(self.scanner.tokenize(str(data, 'utf-8', 'ignore')))
+        indirect = self.object_parser.parse_indirect_object(data)
         if len(indirect['values']) == 1:
             return indirect['values'][0]
         return indirect['values']
 
-    def get_object(self, obj_number, search_stream=False):
-        data = self.xref.get_object(obj_number)
+    @staticmethod
+    def _cache_key(obj_number):
+        if isinstance(obj_number, tuple):
+            return obj_number[0], obj_number[1]
+        return obj_number, 0
 
+    def get_object(self, obj_number, search_stream=False, cache=True):
+        """Returns the parsed object, which is shared with every other caller so don't modify it.
+
+        With cache=False an object that isn't cached yet is read without being kept (i.e. a page's content stream).
+        """
+        key = self._cache_key(obj_number)
+        if search_stream and key in self.streams:
+            return self.streams.get(key)
+        if key in self.objects:
+            obj = self.objects.get(key)
+            if not search_stream or not self._unread_stream(obj):
+                return obj
+            # A plain read of a stream object cached [info, data], read it again as a Stream.
+            obj = self._read_object(obj_number, search_stream)
+            if isinstance(obj, Stream) and cache:
+                self.streams.misses += 1
+                return self.streams.put(key, obj)
+            return obj
+        if not cache:
+            return self._read_object(obj_number, search_stream)
+        # Count the miss on the cache that will end up holding the object.
         if not search_stream:
+            self.objects.misses += 1
+            return self.objects.put(key, self._read_object(obj_number, search_stream))
+
+        obj = self._read_object(obj_number, search_stream)
+        if isinstance(obj, Stream):
+            self.streams.misses += 1
+            return self.streams.put(key, obj)
+        self.objects.misses += 1
+        return self.objects.put(key, obj)
+
+    @staticmethod
+    def _unread_stream(obj):
+        """True for what a plain (search_stream=False) read gives for a stream object, [info, data]."""
+        return isinstance(obj, list) and len(obj) == 2 and isinstance(obj[0], dict) and isinstance(obj[1], (bytes, memoryview))
+
+    def cache_info(self):
+        return {
+            'objects': self.objects.info(),
+            'streams': self.streams.info(),
+            'object_streams': self._object_streams.info()
+        }
+
+    def _object_stream(self, stream_number):
+        objstm = self._object_streams.get(stream_number)
+        if objstm is None:
+            objstm = ObjectStream(self.get_object(stream_number, search_stream=True), self._object_stream_tables.get(stream_number))
+            self._object_stream_tables[stream_number] = objstm.table
+            self._object_streams.put(stream_number, objstm)
+        return objstm
+
+    def _raw_object(self, obj_number):
+        if isinstance(obj_number, tuple):
+            obj_number = obj_number[0]
+
+        if self.partial and obj_number not in self.xref:
+            # Not part of the first page of a linearized file.
+            self.load_xref()
+
+        if obj_number in self.xref.compressed:
+            stream_number, index = self.xref.compressed[obj_number]
+            data = self._object_stream(stream_number).get_object(obj_number, index)
+            # Objects in an object stream don't have the "obj ... endobj" wrapper.
+            return bytes(f"{obj_number} 0 obj\n", 'latin-1') + data + b'\nendobj'
+
+        return self.xref.get_object(obj_number)
+
+    def _stream_length(self, length):
+        if isinstance(length, tuple):
+            try:
+                return self.get_object(length)
+            except Exception:
+                # i.e. still reading the xref stream so there is no xref to look it up in yet.
+                return None
+        return length
+
+    def _stream_object(self, data):
+        m = Stream.START_REGEX.search(data)
+        if m is None:
             return self._indirect_values(data)
-        
-        stream_regex = re.compile(br'(.*stream[\r\n]+)(.*?)(endstream.*)', re.S)
-        
-        m = re.match(stream_regex, data)
+
+        info = self._indirect_values(bytes(data[:m.start()]) + b'endobj')
+        if isinstance(info, dict):
+            # The body is a view into the mapped file, a 50 MB image is one slice not a copy.
+            body = Stream.slice_body(data, m.end(), self._stream_length(info.get('Length')))
+            if body is not None:
+                return Stream(self._stream_info(info), body)
+
+        m = Stream.FALLBACK_REGEX.match(data)
         
         if m:
             match = m.groups()
             # Currently info comes back as [{info_object}, b'\n'] where b'\n' is the empty stream from the parser.
             info = self._indirect_values(match[0] + match[2])
-            return Stream(info[0], match[1])
+            # The end of line in front of endstream isn't part of the data.
+            return Stream(self._stream_info(info[0]), re.sub(br'(?:\r\n|\n|\r)$', b'', match[1]))
 
         return self._indirect_values(data)
 
+    def _stream_info(self, info):
+        """Resolves an indirect /Filter or /DecodeParms (or the entries of their arrays), the filter pipeline can't."""
+        for key in ('Filter', 'DecodeParms'):
+            value = info.get(key)
+            if isinstance(value, tuple):
+                value = info[key] = self.get_object(value)
+            if isinstance(value, list):
+                info[key] = [self.get_object(v) if isinstance(v, tuple) else v for v in value]
+        return info
+
+    def _read_object(self, obj_number, search_stream=False):
+        data = self._raw_object(obj_number)
+
+        if not search_stream:
+            return self._indirect_values(data)
+
+        return self._stream_object(data)
+
     def get_trailer(self, key=None):
         if key:
             return self._trailer.get(key.lower())
         return self._trailer
 
     def toJSON(self):
+        self.load_xref()
         return {
             'file': self.fname,
             'trailer': self._trailer,
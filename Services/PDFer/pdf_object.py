@@ -1,31 +1,46 @@
 from .pdf_scanner import PdfScanner
 from .pdf_parser import PDFParser
+from .xref import object_bounds
+from .stream import Stream
+from .filter_pipeline import FilterPipeline
 from pprint import pprint
-from scipy import ndimage
 from os.path import abspath
 import numpy as np
 import cv2 as cv
-import zlib, re, io, math
+import re, math, mmap
 
 class PDFObject:
 
     def __init__(self, fname, start):
         self.fname = fname
         self.xref_start = start
+        self._file = open(self.fname, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.source = memoryview(self._map)
         self.scanner = PdfScanner()
         self.parser = PDFParser()
         self.xref_table, self.trailer = self._parse_xref()
-        self.sorted_addresses = sorted([v['byte_offset'] for k, v in self.xref_table.items()])
+        self.starts, self.ends = object_bounds(self.xref_table, [self.xref_start], len(self.source))
         self.fonts = {}
         self.translation_table = {}
         self.catalog = {}
 
-    def _end(self, start):
-        s_index = self.sorted_addresses.index(start)
-        if s_index == len(self.sorted_addresses) - 1:
-            return self.xref_start
-        else:
-            return self.sorted_addresses[s_index + 1]
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is None:
+            return
+        self.source.release()
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+        self._file.close()
+        self._map = None
 
     def get_root_num(self):
         return self.trailer['root'][0]
@@ -42,27 +57,30 @@ class PDFObject:
         data = self.get_raw_object(obj_number, more=True)
 
         if not search_stream:
-            return self.parser.parse_indirect_object(self.scanner.tokenize(str(data, 'utf-8')))
-        
-        stream_regex = re.compile(br'(.*stream[\r\n]+)(.*?)(endstream.*)', re.S)
+            return self.parser.parse_indirect_object(self.scanner.tokenize(data))
         
-        m = re.match(stream_regex, data)
+        m = Stream.START_REGEX.search(data)
+        if m:
+            info = self.parser.parse_indirect_object(self.scanner.tokenize(bytes(data[:m.start()]) + b'endobj'))
+            length = info['values'][0].get('Length') if info['values'] and isinstance(info['values'][0], dict) else None
+            if isinstance(length, tuple):
+                length = self.get_indirect_object(length[0])['values'][0]
+            body = Stream.slice_body(data, m.end(), length)
+            if body is not None:
+                return info, self._raw_stream(info['values'], body, decode_stream)
+
+        m = Stream.FALLBACK_REGEX.match(data)
         
         if m:
             match = m.groups()
-            info = self.parser.parse_indirect_object(self.scanner.tokenize(str(match[0] + match[2], 'utf-8')))
+            info = self.parser.parse_indirect_object(self.scanner.tokenize(match[0] + match[2]))
             stream = self._raw_stream(info['values'], match[1], decode_stream)
             return info, stream
 
-        return self.parser.parse_indirect_object(self.scanner.tokenize(str(data, 'utf-8')))
+        return self.parser.parse_indirect_object(self.scanner.tokenize(data))
 
     def get_raw_object(self, obj_number, more=False):
-        start = self.xref_table[obj_number]['byte_offset']
-        end = self._end(start)
-
-        with open(self.fname, 'rb') as f:
-            f.seek(start)
-            data = f.read(end - start)
+        data = self.source[self.starts[obj_number]:self.ends[obj_number]]
 
         if more:
             return data
@@ -234,117 +252,12 @@ class PDFObject:
         return
 
     def _jpeg_to_image(self, jpg_stream):
-        jpg_file = io.BytesIO(jpg_stream['data'])
-        return ndimage.imread(jpg_file)
-
-    def _paeth_predictor(self, left, above, upper_left):
-        # Source: https://www.w3.org/TR/PNG-Filters.html
-        initial_estimate = left + above - upper_left
-
-        distance_left = abs(initial_estimate - left)
-        distance_above = abs(initial_estimate - above)
-        distance_upper_left = abs(initial_estimate - upper_left)
-        
-        if distance_left <= distance_above and distance_left <= distance_upper_left:
-            return left
-        elif distance_above <= distance_upper_left:
-            return above
-        else:
-            return upper_left
-
-    def _png_prediction(self, columns, row_size, bpp, data):
-        """ Sources:
-        * https://github.com/davidben/poppler/blob/master/poppler/Stream.cc
-        * https://github.com/davidben/poppler
-        * https://www.w3.org/TR/PNG-Filters.html
-        """
-        k = 0
-        # initialize the prediction line to all zeros
-        predline = [0] * row_size
-        final = []
-        while k < len(data):
-            # Each row is prefaced with a 'prediction'
-            curr_pred = data[k]
-            # "Cut off" the prediction byte
-            k += 1
-            # initialize an empty up_left_buffer (only used for paeth prediction)
-            up_left_buffer = [0] * (bpp + 1)
-            # iterate through the row/line
-            for i in range(bpp, row_size):
-                # just in case
-                try:
-                    raw = data[k]
-                    k += 1
-                except Exception as e:
-                    break
-
-                # This conditional is evalulated per line/row(AKA: curr_pred shouldn't change in this for loop)
-                if curr_pred == 1:
-                    # PNG(1) Sub
-                    predline[i] = predline[i - bpp] + raw
-                elif curr_pred == 2:
-                    # PNG(2) Up
-                    predline[i] += raw
-                elif curr_pred == 3:
-                    # PNG(3) Average
-                    predline[i] = ((predline[i - bpp] + predline[i]) >> 1) + raw
-                elif curr_pred == 4:
-                    # PNG(4) Paeth
-                    # slide the up_left_buffer one over to the right
-                    for j in range(bpp, 0, -1):
-                        up_left_buffer[j] = up_left_buffer[j - 1]
-                    # set the start of the up_left_buffer to the current
-                    up_left_buffer[0] = predline[i]
-
-                    predline[i] = self._paeth_predictor(predline[i - bpp], predline[i], up_left_buffer[bpp]) + raw
-                else:
-                    # PNG(0) No prediction
-                    predline[i] = raw
-            # Each row/line is buffered by the previous line's pixel which eqauls bpp
-            final.append(predline[bpp:row_size])
-
-        return np.array(final, dtype=np.uint8).reshape(len(final), columns, bpp)
-        
-    def _filtered_to_image(self, shape, params, data):
-        """helpful docs = https://www.w3.org/TR/PNG-Filters.html
-        Prediction Values & meanings:
-        (1)  -> No prediction (defualt)
-        (2)  -> TIFF predictor
-        (10) -> PNG(0) No prediction on all rows 
-        (11) -> PNG(1) Sub on all rows = predicts the same as the sample to the left
-        (12) -> PNG(2) Up on all rows = predicts the same as the sample above
-        (13) -> PNG(3) Average on all rows = predicts the avg of sample to the left and above
-        (14) -> PNG(4) Paeth on all rows = nonlinear function of the sample above, left, and upper left.
-        (15) -> PNG optimum (any of the above for each row)
-        """
-        prediction = params.get('Predictor')
-
-        if prediction is None or prediction == 1:
-            return np.frombuffer(data, dtype=np.uint8).reshape(shape)
-
-        colors = params.get('Colors', 1)
-        columns = params.get('Columns') or shape[1]
-
-        bpc = params.get('BitsPerComponent', 8)
-        n = columns * colors
-        # bytes per pixel!
-        bpp = (colors * bpc + 7) >> 3
-        # total bytes in the prediction row/line
-        row_size = ((n * bpc + 7) >> 3) + bpp
-        p_index = row_size
-
-        #TIFF
-        if prediction == 2:
-            return np.frombuffer(data, dtype=np.uint8).reshape(shape)
-
-        return self._png_prediction(columns, row_size, bpp, data)
+        return cv.imdecode(np.frombuffer(jpg_stream['data'], dtype=np.uint8), cv.IMREAD_UNCHANGED)
 
     def _convert_to_image(self, image_stream, shape):
         if isinstance(image_stream, dict):
             if image_stream['compression'] == 'dct':
                 return self._jpeg_to_image(image_stream)
-            elif image_stream['compression'] == 'filtered':
-                return self._filtered_to_image(shape, image_stream['args'], image_stream['data'])
         
         return np.frombuffer(image_stream, dtype=np.uint8).reshape(shape)
 
@@ -383,18 +296,16 @@ class PDFObject:
 
     def _parse_xref(self):
         end_regex = re.compile(br'^%%EOF.*?', re.S)
-        with open(self.fname, 'rb') as f:
-            f.seek(self.xref_start, 0)
-            lines = f.read().splitlines()
-            ref_lines = []
-            for l in lines:
-                ref_lines.append(l)
-                if re.match(end_regex, l):
-                    break
+        lines = bytes(self.source[self.xref_start:]).splitlines()
+        ref_lines = []
+        for l in lines:
+            ref_lines.append(l)
+            if re.match(end_regex, l):
+                break
 
-            ref_table = b'\n'.join(ref_lines)
+        ref_table = b'\n'.join(ref_lines)
 
-        xref, trailer = self.parser.parse(self.scanner.tokenize(str(ref_table, 'utf-8')))
+        xref, trailer = self.parser.parse(self.scanner.tokenize(ref_table))
         if 'prev' in trailer:
             self.xref_start = trailer['prev']
             x_2, t_2 = self._parse_xref()
@@ -407,7 +318,7 @@ class PDFObject:
         decomp_typ = None
         params = None
         for item in stream_info:
-            if 'Filter' in item:
+            if isinstance(item, dict) and 'Filter' in item:
                 decomp_typ = item['Filter']
                 params = item.get('DecodeParms')
                 break
@@ -421,29 +332,20 @@ class PDFObject:
         return self._decompress_stream(stream_data, decomp_typ, params)
 
     def _decompress_stream(self, data, d_type, d_params):
-        if isinstance(d_type, list):
-            # There can be a compression pipeline
-            return None
-
-        decomp = d_type.lower()
+        # There can be a compression pipeline, the predictor (if any) gets undone in it too.
+        pipeline = FilterPipeline(d_type, d_params)
+        data = pipeline.decode_all(data)
 
-        if decomp == 'flatedecode':
-            if d_params:
-                return {
-                    'compression': 'filtered',
-                    'args': d_params,
-                    'data': zlib.decompress(data)
-                }
-            return zlib.decompress(data)
-
-        if decomp == 'dctdecode':
+        if pipeline.image_filter in ('DCTDecode', 'DCT'):
             # For JPEGs only, DCT = Discrete Cosine Transform 
             return {
                 'compression': 'dct',
-                'args': d_params,
+                'args': pipeline.image_params,
                 'data': data
             }
 
+        return data
+
     def _parse_content(self, obj_number):
         """
         Acrobat Versions 4.0 and 5.0 (PDF Versions 1.3 and 1.4, respectively)
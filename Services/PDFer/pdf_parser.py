@@ -11,6 +11,11 @@ class PDFParser(RecursiveParser):
         trailer = self.trailer()
         return ref_table, trailer
 
+    def parse_trailer(self, tokens):
+        self.tokens = tokens
+        self.advance()
+        return self.trailer()
+
     def parse_indirect_object(self, tokens):
         self.tokens = tokens
         self.advance()
@@ -208,7 +213,12 @@ class PDFParser(RecursiveParser):
             if self._skip_space():
                 continue
 
-            arr.append(self._any_object())
+            val = self._any_object()
+            if isinstance(val, tuple) and len(val) == 2:
+                # Two plain numbers in a row come back as a pair, i.e. [0 0 612 792] or /W [1 2 1].
+                arr.extend(val)
+            else:
+                arr.append(val)
 
         self.match('SQUARE', ']')
         return arr
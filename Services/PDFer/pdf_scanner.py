@@ -1,63 +1,76 @@
 import re, collections
+from array import array
 
 Token = collections.namedtuple('Token', ['kind', 'value', 'line', 'column'])
 
 class PdfScanner:
+    """The old str token scanner, superseded by PdfLexer.
 
-    def __init__(self):
-        self.keywords = {
-            'BT',
-            'ET',
-            'obj',
-            'PDF',
-            'EOF',
-            'xref',
-            'true',
-            'null',
-            'Type',
-            'false',
-            'stream',
-            'endobj',
-            'Filter',
-            'Length',
-            'trailer',
-            'endcmap',
-            'Subtype',
-            'begincmap',
-            'startxref',
-            'endstream',
-            'endbfchar',
-            'beginbfchar',
-            'endbfrange',
-            'beginbfrange',
-            'endcodespacerange',
-            'begincodespacerange'
-        }
-        self.patterns = [
-            ('NUMBER', r'\d+(\.\d+)?'),
-            ('OPR', r'[/+\-*]'),
-            ('COLON', r':'),
-            ('ASSIGN', r'='),
-            ('PERCENT', r'%'),
-            ('QUOTE', r'[\'"]'),
-            ('ARROW', r'[<>]'),
-            ('PAREN', r'[()]'),
-            ('CURLY', r'[{}]'),
-            ('SQUARE', r'[\[\]]'),
-            ('COMMA', r','),
-            ('ID', r'[A-Za-z]+'),
-            ('NEWLINE', r'\r\n?|\n'),
-            ('WHTSPC', r'[ \t]+'),
-            ('MISMATCH', r'.'),
-        ]
-        self.regex = '|'.join(f"(?P<{name}>{regex})" for name, regex in self.patterns)
+    PdfDoc, the object/xref/trailer parsing, CMaps and content streams all go through PdfLexer now.
+    This is only kept for the legacy PDFObject reader and as the baseline of the lexer benchmarks,
+    new code shouldn't use it.
+    """
+    keywords = {
+        'BT',
+        'ET',
+        'obj',
+        'PDF',
+        'EOF',
+        'xref',
+        'true',
+        'null',
+        'Type',
+        'false',
+        'stream',
+        'endobj',
+        'Filter',
+        'Length',
+        'trailer',
+        'endcmap',
+        'Subtype',
+        'begincmap',
+        'startxref',
+        'endstream',
+        'endbfchar',
+        'beginbfchar',
+        'endbfrange',
+        'beginbfrange',
+        'endcodespacerange',
+        'begincodespacerange'
+    }
+    patterns = [
+        ('NUMBER', r'\d+(\.\d+)?'),
+        ('OPR', r'[/+\-*]'),
+        ('COLON', r':'),
+        ('ASSIGN', r'='),
+        ('PERCENT', r'%'),
+        ('QUOTE', r'[\'"]'),
+        ('ARROW', r'[<>]'),
+        ('PAREN', r'[()]'),
+        ('CURLY', r'[{}]'),
+        ('SQUARE', r'[\[\]]'),
+        ('COMMA', r','),
+        ('ID', r'[A-Za-z]+'),
+        ('NEWLINE', r'\r\n?|\n'),
+        ('WHTSPC', r'[ \t]+'),
+        ('MISMATCH', r'.'),
+    ]
+    # Compiled once for every scanner, not on every call.
+    regex = re.compile('|'.join(f"(?P<{name}>{regex})" for name, regex in patterns))
+    b_regex = re.compile(bytes('|'.join(f"(?P<{name}>{regex})" for name, regex in patterns), 'utf-8'), re.S)
+    b_keywords = {bytes(k, 'utf-8') for k in keywords}
 
     def tokenize(self, data, convert_nums=True):
+        """Tokenizes a str, or bytes directly (values are decoded as latin-1 which never loses a byte)."""
+        is_bytes = not isinstance(data, str)
+        regex = self.b_regex if is_bytes else self.regex
         line_num = 1
         line_start = 0
-        for mo in re.finditer(self.regex, data):
+        for mo in regex.finditer(data):
             name = mo.lastgroup
             value = mo.group(name)
+            if is_bytes:
+                value = value.decode('latin-1')
             column = mo.start() - line_start
             if name == 'NEWLINE':
                 line_start = mo.end()
@@ -66,23 +79,160 @@ class PdfScanner:
                 name = value
             elif name == 'NUMBER' and convert_nums:
                 value = float(value) if '.' in value else int(value)
-            
+
             yield Token(name, value, line_num, column)
 
     def b_tokenize(self, data):
         line_num = 1
         line_start = 0
-        regs = re.compile(bytes(self.regex, 'utf-8'), re.S)
-        b_keywords = [bytes(k, 'utf-8') for k in self.keywords]
-        for mo in re.finditer(regs, data):
+        for mo in self.b_regex.finditer(data):
             name = mo.lastgroup
             value = mo.group(name)
             column = mo.start() - line_start
             if name == 'NEWLINE':
                 line_start = mo.end()
                 line_num += 1
-            elif name == 'ID' and value in b_keywords:
+            elif name == 'ID' and value in self.b_keywords:
                 name = str(value, 'utf-8')
             elif name in ['ARROW','PAREN','SQUARE']:
                 value = str(value, 'utf-8')
             yield Token(name, value, line_num, column)
+
+class PdfLexer:
+    """Bytes native lexer that follows the PDF syntax (PDF reference 1.7 Chapter 3, section 1).
+
+    Tokens are compact `(kind, start, end)` integers, the value of a token is `data[start:end]`
+    so nothing gets decoded or copied until somebody actually needs it.
+    """
+    WHITESPACE = 0
+    COMMENT = 1
+    NUMBER = 2
+    NAME = 3
+    STRING = 4
+    HEXSTRING = 5
+    DICT_OPEN = 6
+    DICT_CLOSE = 7
+    ARRAY_OPEN = 8
+    ARRAY_CLOSE = 9
+    KEYWORD = 10
+    BRACE_OPEN = 11
+    BRACE_CLOSE = 12
+    STREAM_DATA = 13
+    MISMATCH = 14
+    KINDS = [
+        'WHITESPACE', 'COMMENT', 'NUMBER', 'NAME', 'STRING', 'HEXSTRING', 'DICT_OPEN', 'DICT_CLOSE',
+        'ARRAY_OPEN', 'ARRAY_CLOSE', 'KEYWORD', 'BRACE_OPEN', 'BRACE_CLOSE', 'STREAM_DATA', 'MISMATCH'
+    ]
+
+    _ws = rb'[ \t\r\n\f\x00]'
+    _regular = rb'[^ \t\r\n\f\x00/<>\[\]()%{}]'
+    # Group numbers line up with the kind codes above so `mo.lastindex - 1` is the kind.
+    _patterns = [
+        _ws + rb'+',
+        rb'%[^\r\n]*',
+        rb'[+-]?(?:\d+\.?\d*|\.\d+)(?!' + _regular + rb')',
+        rb'/' + _regular + rb'*',
+        # Literal strings with up to one level of nested parens, deeper ones are finished by _string_end.
+        rb'\((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*\)|\(',
+        rb'<[0-9A-Fa-f \t\r\n\f\x00]*>',
+        rb'<<',
+        rb'>>',
+        rb'\[',
+        rb'\]',
+        _regular + rb'+',
+        rb'\{',
+        rb'\}',
+        rb'(?!)',
+        rb'.',
+    ]
+    REGEX = re.compile(b'|'.join(b'(' + p + b')' for p in _patterns), re.S)
+    # Same tokens but whitespace is eaten in front of every token instead of being one (and trailing whitespace isn't a mismatch).
+    SKIP_REGEX = re.compile(_ws + b'*(?:' + b'|'.join(b'(' + p + b')' for p in [rb'(?!)'] + _patterns[1:-1] + [rb'[^ \t\r\n\f\x00]']) + b')', re.S)
+    STREAM_EOL = re.compile(rb'stream(?:\r\n|\n|\r)?')
+
+    # Escapes in literal strings, an octal code, a backslash before a line break (the string goes on) or one character.
+    ESCAPE_REGEX = re.compile(rb'\\(?:([0-7]{1,3})|(\r\n|[\r\n])|(.))', re.S)
+    ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+    @classmethod
+    def _unescape(cls, mo):
+        if mo.group(1):
+            return bytes([int(mo.group(1), 8) & 255])
+        if mo.group(2):
+            return b''
+        return cls.ESCAPES.get(mo.group(3), mo.group(3))
+
+    @classmethod
+    def string_value(cls, data, start, end):
+        """The bytes of the STRING or HEXSTRING token `data[start:end]` with the escapes/hex digits undone."""
+        raw = bytes(data[start + 1:end - 1])
+        if data[start] == 60:
+            # '<' hex string, whitespace is ignored and an odd last digit is followed by a 0.
+            digits = b''.join(raw.split())
+            return bytes.fromhex((digits + b'0' * (len(digits) & 1)).decode('ascii'))
+        if b'\\' not in raw:
+            return raw
+        return cls.ESCAPE_REGEX.sub(cls._unescape, raw)
+
+    def _string_end(self, data, pos):
+        """Finds the end of a literal string that starts at `pos`, strings can have balanced or escaped parens."""
+        depth = 0
+        size = len(data)
+        i = pos
+        while i < size:
+            c = data[i]
+            if c == 92:
+                # '\\' escapes the next byte
+                i += 2
+                continue
+            if c == 40:
+                depth += 1
+            elif c == 41:
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return size
+
+    def tokens(self, data, skip_space=True, pos=0, end=None):
+        """Yields (kind, start, end) for every token in data."""
+        regex = self.SKIP_REGEX if skip_space else self.REGEX
+        end = len(data) if end is None else end
+        while pos < end:
+            restart = None
+            for mo in regex.finditer(data, pos, end):
+                kind = mo.lastindex - 1
+                start, stop = mo.span(mo.lastindex)
+                if kind == 4 and stop - start == 1:
+                    # Deeply nested string, find the end by hand and start matching again after it.
+                    restart = self._string_end(data, start)
+                    yield kind, start, restart
+                    break
+                yield kind, start, stop
+                if kind == 10 and stop - start == 6 and data[start:stop] == b'stream':
+                    # Everything up to endstream is raw data and never tokenized.
+                    body = self.STREAM_EOL.match(data, start, end).end()
+                    restart = self._find(data, b'endstream', body, end)
+                    yield 13, body, restart
+                    break
+            if restart is None:
+                return
+            pos = restart
+
+    @staticmethod
+    def _find(data, sub, start, end):
+        i = data.find(sub, start, end) if hasattr(data, 'find') else bytes(data[start:end]).find(sub)
+        if i < 0:
+            return end
+        return i if hasattr(data, 'find') else i + start
+
+    def lex(self, data, skip_space=True):
+        """Returns three parallel arrays (kinds, starts, ends) for all of the tokens in data."""
+        kinds = array('B')
+        starts = array('q')
+        ends = array('q')
+        for kind, start, end in self.tokens(data, skip_space):
+            kinds.append(kind)
+            starts.append(start)
+            ends.append(end)
+        return kinds, starts, ends
@@ -1,37 +1,38 @@
-from .pdf_scanner import PdfScanner
+from .pdf_scanner import PdfLexer
 from .pdf_object import PDFObject
 from .pdf_base import PdfBase
+from .doc_index import DirectoryStore
+from .byte_source import ByteSource
+from .text_index import TextIndex
+from .batch import BatchRunner, find_pdfs
 from pprint import pprint
 from time import time
+from os.path import join
 import cv2 as cv
+import json, sys
 
 class PDFer:
     """The PDFer is a general PDF parsing tool."""
 
     def __init__(self):
-        self.scan = PdfScanner()
+        self.lexer = PdfLexer()
         self.fname = None
 
     def read_section(self, start, end):
         """This reads a section of bytes from a file and then returns a array of bytes split by 
         the newline character. 
         """
-        with open(self.fname, 'rb') as f:
-            f.seek(start, 0)
-            if end == 0:
-                sect = f.read()
-            else:
-                sect = f.read(abs(end - start))
-        return sect.splitlines()
+        with ByteSource.open(self.fname) as source:
+            sect = source[start:] if end == 0 else source[start:start + abs(end - start)]
+            return bytes(sect).splitlines()
 
     def _pdf_startxref(self):
         """This finds the starting byte address of the cross reference table in a PDF. 
         """
         location = None
-        with open(self.fname, 'rb') as f:
+        with ByteSource.open(self.fname) as source:
             # TODO replace the arbitrary -200 with a guarenteed length.
-            f.seek(-200, 2)
-            arch = f.read().splitlines()
+            arch = bytes(source[-200:]).splitlines()
         count = 0
         for x in arch[::-1]:
             if count == 1:
@@ -41,8 +42,24 @@ class PDFer:
                 count += 1
         return location
 
+    def _index_store(self, args):
+        if args.cache_dir:
+            return DirectoryStore(args.cache_dir if isinstance(args.cache_dir, str) else None)
+        return None
+
+    def _stream_text(self, args):
+        """Writes {"page": n, "text": [...]} per line as soon as each page is decoded."""
+        with PdfBase(self.fname, index_store=self._index_store(args)) as base:
+            try:
+                for page_number, text in base.iter_text():
+                    sys.stdout.write(json.dumps({'page': page_number, 'text': text}) + '\n')
+                    sys.stdout.flush()
+            except BrokenPipeError:
+                # i.e. piped into head
+                pass
+
     def _start_base(self, args):
-        base = PdfBase(self.fname)
+        base = PdfBase(self.fname, index_store=self._index_store(args))
         base.create_catalog()
         print('\nTEXT:\n')
         pprint(base.get_page_text(3))
@@ -55,16 +72,69 @@ class PDFer:
         #cv.imshow(iname, istream.get_image())
         #cv.waitKey(0)
         #cv.destroyAllWindows()
-
+        base.close()
+
+
+    def _start_index(self, args):
+        index = TextIndex(args.index_path or join(args.index, '.pdfer-index'))
+        start = time()
+        stats = index.update(args.index)
+        print(f"Indexed in {time() - start:.2f}s:")
+        pprint(stats)
+        pprint(index.stats())
+        if args.search:
+            start = time()
+            hits = index.search(args.search)
+            print(f"\n{len(hits)} pages match {args.search!r} ({(time() - start) * 1000:.1f}ms):\n")
+            for fname, page_number in hits:
+                print(f"{fname}: page {page_number}")
+
+    def _start_batch(self, args):
+        """Writes one JSON line per document to stdout, the summary goes to stderr."""
+        runner = BatchRunner(workers=args.workers, timeout=args.timeout, order=args.order)
+        try:
+            for record in runner.run(find_pdfs(args.batch)):
+                sys.stdout.write(json.dumps(record) + '\n')
+                sys.stdout.flush()
+        except BrokenPipeError:
+            # i.e. piped into head
+            return
+        sys.stderr.write(json.dumps(runner.stats) + '\n')
 
     def start(self, args):
         """This can effectively parse and access objects in a PDF."""
+        if args.bench is not None:
+            # Only imported here, the benchmarks bring in http.server and the synthetic PDF generator.
+            from .benchmark import PdfBenchmark
+            results = PdfBenchmark().run(args.bench)
+            pprint(results)
+            if args.bench_out:
+                with open(args.bench_out, 'w') as f:
+                    json.dump(results, f, indent=2)
+            if args.bench_compare:
+                with open(args.bench_compare) as f:
+                    print('\nCOMPARED TO:', args.bench_compare, '(change = new / old)\n')
+                    pprint(PdfBenchmark.compare(json.load(f), results))
+            return
+
+        if args.index:
+            self._start_index(args)
+            return
+
+        if args.batch:
+            self._start_batch(args)
+            return
+
         if not args.file:
             print('Error! Must provide a file.')
             return
 
         self.fname = args.file
 
+        if args.jsonl:
+            self._stream_text(args)
+            return
+
         if args.base:
             self._start_base(args)
             return
@@ -82,7 +152,8 @@ class PDFer:
 
             if args.tokens or args.all:
                 print("TOKENS:\n")
-                pprint([t for t in self.scan.tokenize(pdf.get_raw_object(args.object_number))])
+                data = bytes(pdf.get_raw_object(args.object_number, more=True))
+                pprint([(PdfLexer.KINDS[kind], data[start:end]) for kind, start, end in self.lexer.tokens(data)])
                 print()
 
             if args.raw or args.all:
@@ -92,7 +163,7 @@ class PDFer:
                 elif args.raw == 1:
                     pprint(pdf._parse_content(args.object_number))
                 else:
-                    print(pdf.get_raw_object(args.object_number, more=True))
+                    print(bytes(pdf.get_raw_object(args.object_number, more=True)))
                 print()
             
             if args.parsed or args.all:
@@ -0,0 +1,66 @@
+from bisect import bisect_right
+import re
+
+class XRefRecovery:
+    """Rebuilds the cross-reference table of a damaged PDF by scanning the whole file.
+
+    Every "N G obj" header and "trailer" keyword is found in one pass with literal searches,
+    which the regex engine runs at memory speed, the few bytes in front of each hit are then
+    checked for the object and generation numbers.
+    """
+    OBJ_REGEX = re.compile(rb'obj')
+    # Object and generation numbers right before an "obj", matched on a small window that ends at the keyword.
+    HEADER_REGEX = re.compile(rb'(?:^|[^0-9])([0-9]{1,10})[ \t\r\n\f\x00]+([0-9]{1,5})[ \t\r\n\f\x00]*$')
+    DELIMITERS = b' \t\r\n\f\x00/<[(%'
+
+    def __init__(self, source):
+        # Anything with .find() and slicing, a mmap is best.
+        self.source = source
+        self.headers = []
+        self.trailers = []
+
+    def _find_all(self, keyword):
+        found = []
+        i = self.source.find(keyword)
+        while i >= 0:
+            found.append(i)
+            i = self.source.find(keyword, i + len(keyword))
+        return found
+
+    def scan(self):
+        """Returns the rebuilt xref table, later definitions of an object win like an incremental update."""
+        size = len(self.source)
+        xref = {}
+        self.headers = []
+        for mo in self.OBJ_REGEX.finditer(self.source):
+            pos = mo.start()
+            end = mo.end()
+            if end < size and self.source[end:end + 1] not in self.DELIMITERS:
+                # i.e. "objects"
+                continue
+            if pos >= 3 and self.source[pos - 3:pos] == b'end':
+                continue
+            window = bytes(self.source[max(0, pos - 24):pos])
+            m = self.HEADER_REGEX.search(window)
+            if m is None:
+                continue
+            start = pos - len(window) + m.start(1)
+            obj_number, gen_number = int(m.group(1)), int(m.group(2))
+            xref[obj_number] = { 'byte_offset': start, 'gen_number': gen_number, 'in_use': True }
+            self.headers.append((start, obj_number))
+
+        self.trailers = self._find_all(b'trailer')
+        return xref
+
+    def enclosing_object(self, position):
+        """The number of the object whose header comes right before `position`."""
+        i = bisect_right(self.headers, (position, float('inf')))
+        return self.headers[i - 1][1] if i else None
+
+    def objects_containing(self, keyword):
+        found = []
+        for pos in self._find_all(keyword):
+            n = self.enclosing_object(pos)
+            if n is not None and n not in found:
+                found.append(n)
+        return found
@@ -1,32 +1,53 @@
-from .filter_helper import FilterHelper
-import zlib
+from .filter_pipeline import FilterPipeline
+import re
 
 class Stream:
+    # The stream keyword and its end of line, the data starts right after it.
+    START_REGEX = re.compile(br'(?<![A-Za-z])stream(?:\r\n|\n|\r)')
+    END_REGEX = re.compile(br'[\r\n \t\f\x00]*endstream')
+    # Only used when /Length is missing or wrong, it has to backtrack across the whole payload.
+    FALLBACK_REGEX = re.compile(br'(.*stream[\r\n]+)(.*?)(endstream.*)', re.S)
 
     def __init__(self, info, data):
         self.data = data
         #Watch out for FFilters and FDecodeParms
         self.filter = info.get('Filter')
-        self.filter_params = info.get('DecodeParms', {})
+        self.filter_params = info.get('DecodeParms') or {}
+        if isinstance(self.filter_params, list):
+            # One entry per filter, the one that matters for predictors/images is the last non null one.
+            self.filter_params = next((p for p in reversed(self.filter_params) if isinstance(p, dict)), {})
         self._info = info
 
+    @classmethod
+    def slice_body(cls, data, start, length):
+        """Returns data[start:start + length] (a view if data is a memoryview) if endstream really follows it."""
+        if not isinstance(length, int) or length < 0:
+            return None
+        end = start + length
+        if end > len(data) or cls.END_REGEX.match(data, end) is None:
+            return None
+        return data[start:end]
+
     def get_info(self, key=None):
         if key:
             return self._info.get(key)
         return self._info
 
+    def pipeline(self, max_length=FilterPipeline.CHUNK_SIZE):
+        return FilterPipeline.from_info(self._info, max_length)
+
+    @property
+    def image_filter(self):
+        """The image filter (DCTDecode, JPXDecode, ...) left on the data after decompress(), if any."""
+        return self.pipeline().image_filter
+
     def decompress(self):
-        if isinstance(self.filter, list):
-            # There can be a compression pipeline
-            return None
+        """Runs every filter (and predictor) up to the first image filter."""
+        return self.pipeline().decode_all(self.data)
 
-        if self.filter == 'FlateDecode':
-            # zlib.MAX_WBITS|32 should check header to see if it is gzip or zlib
-            return zlib.decompress(self.data, zlib.MAX_WBITS|32)
-        elif self.filter == 'LZWDecode':
-            return FilterHelper.lzw(self.data)
-        else:
-            return self.data
+    def iter_decompress(self, chunk_size=FilterPipeline.CHUNK_SIZE):
+        """Same as decompress() but yields chunks so the whole decoded stream is never held at once."""
+        return self.pipeline(chunk_size).decode(self.data, chunk_size)
 
     def decode(self, decoding='utf-8'):
         #Watch out for FFilters and FDecodeParms
@@ -50,32 +71,11 @@ class Stream:
         (13) -> PNG(3) Average on all rows = predicts the avg of sample to the left and above
         (14) -> PNG(4) Paeth on all rows = nonlinear function of the sample above, left, and upper left.
         (15) -> PNG optimum (any of the above for each row)
-        """
-        # selects the predictor algorithm
-        prediction = self.filter_params.get('Predictor')
-
-        if prediction is None or prediction == 1:
-            return self.decompress()
 
-        # number of components per sample (valid numbers are 1 - 4)
-        colors = self.filter_params.get('Colors', 1)
-        # number of samples per row
-        columns = self.filter_params.get('Columns', 1)
-        # number of bits to represent each color component per sample
-        bpc = self.filter_params.get('BitsPerComponent', 8)
-
-        # bytes per pixel!
-        bpp = (colors * bpc + 7) >> 3
-        # total bytes in the prediction row/line
-        row_size = ((columns * colors * bpc + 7) >> 3) + bpp
-        # data needs to be decompressed
-        data = self.decompress()
-        if prediction == 2:
-            return FilterHelper.tiff_prediction(bpc, columns, colors, row_size, bpp, data)
-
-        return FilterHelper.png_prediction(columns, row_size, bpp, data)
+        The predictor is a stage of the filter pipeline now so this is the same as decompress().
+        """
+        return self.decompress()
 
     def is_prediction_filter(self):
         prediction = self.filter_params.get('Predictor')
         return prediction is not None and prediction > 1
-        
\ No newline at end of file
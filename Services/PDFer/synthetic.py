@@ -0,0 +1,478 @@
+import zlib, struct
+import numpy as np
+import cv2 as cv
+
+class SyntheticPdf:
+    """Builds small but valid PDF files for benchmarking the PDFer.
+
+    Every object is written in order so the output is deterministic, the same arguments
+    always produce the exact same bytes.
+    """
+
+    def __init__(self, pages=1, objects=0, xref_stream=False, object_streams=0, fanout=0, images=0, image_size=256,
+                 fonts=1, updates=0, linearized=False, page_fonts=False):
+        self.pages = max(1, pages)
+        # Fonts shared by every page, F1 is plain Helvetica and the rest are TrueType fonts with their
+        # codes shifted around so the text only comes out right through their ToUnicode CMaps.
+        self.fonts = max(1, fonts)
+        # Every page gets its own /Font resources with the names rotated by the page number (/F1 of page 2 is
+        # font 2, ...) so a font can only be found by name through the page's own resources. No fanout only.
+        self.page_fonts = page_fonts
+        # Incremental updates appended after the original file, update u rewrites the contents of
+        # pages u, u + (updates + 1), ... the pages that are a multiple of updates + 1 are never touched.
+        self.updates = updates
+        # Image XObjects in the shared page resources, even ones are JPEGs (DCT) and odd ones Flate with PNG predictors.
+        self.images = images
+        self.image_size = image_size
+        # Max kids per page tree node, 0 puts every page straight under the root /Pages. With a fanout
+        # the /Resources and /MediaBox are only on the root so the pages have to inherit them.
+        self.fanout = fanout
+        # Total number of indirect objects, anything above what the pages need is filler.
+        self.objects = objects
+        # PDF 1.5 style cross-reference stream instead of a classic xref table.
+        self.xref_stream = xref_stream or object_streams > 0
+        # Max number of objects packed into each object stream (0 means no object streams).
+        self.object_streams = object_streams
+        # Linearized layout (classic xref tables only): the linearization dictionary and a first page xref
+        # section up front, then everything page 1 needs, then the rest of the objects and the main xref.
+        self.linearized = linearized
+        self._objects = []
+        self._streams = set()
+        # { page_number: content stream obj_number }
+        self._contents = {}
+
+    def _add(self, body, stream=False):
+        self._objects.append(body)
+        if stream:
+            self._streams.add(len(self._objects))
+        return len(self._objects)
+
+    def _set(self, obj_number, body):
+        self._objects[obj_number - 1] = body
+
+    def _stream(self, info, data, compress=True):
+        if compress:
+            data = zlib.compress(data)
+            info = f"{info} /Filter /FlateDecode"
+        return b'<< ' + bytes(f"{info} /Length {len(data)}", 'latin-1') + b' >>\nstream\n' + data + b'\nendstream'
+
+    def revision(self, page_number):
+        """The update that last rewrote the page's contents, 0 for the original."""
+        return page_number % (self.updates + 1)
+
+    def _lines(self, page_number, revision):
+        if revision:
+            return [f"Page {page_number} line {i} of revision {revision}." for i in range(4)]
+        return [f"Page {page_number} line {i} of the synthetic document." for i in range(4)]
+
+    def page_text(self, page_number):
+        """The lines of text the page shows (in its newest revision)."""
+        return self._lines(page_number, self.revision(page_number))
+
+    @staticmethod
+    def _shift(font):
+        # How far the codes of font F<font> are rotated through the printable range (32 - 126).
+        return font - 1
+
+    def _page_font(self, page_number, name):
+        """The font behind /F<name> on the page."""
+        if not self.page_fonts:
+            return name
+        return (name - 1 + page_number - 1) % self.fonts + 1
+
+    def _encode(self, text, font):
+        shift = self._shift(font)
+        raw = bytes(32 + (ord(c) - 32 + shift) % 95 for c in text)
+        return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+    def _content(self, page_number, revision=0):
+        lines = [b'BT', b'72 720 Td']
+        for i, text in enumerate(self._lines(page_number, revision)):
+            font = i % self.fonts + 1
+            lines.append(bytes(f"/F{font} 12 Tf", 'latin-1'))
+            lines.append(b'(' + self._encode(text, self._page_font(page_number, font)) + b') Tj')
+            lines.append(b'0 -14 Td')
+        lines.append(b'ET')
+        return b'\n'.join(lines)
+
+    def _to_unicode(self, shift):
+        """The CMap that undoes the code rotation of _encode."""
+        ranges = [(32 + shift, 126, 32)]
+        if shift:
+            ranges.append((32, 31 + shift, 127 - shift))
+        lines = [
+            b'/CIDInit /ProcSet findresource begin', b'12 dict begin', b'begincmap',
+            b'/CMapName /Synthetic-UCS def', b'/CMapType 2 def',
+            b'1 begincodespacerange', b'<00> <FF>', b'endcodespacerange',
+            bytes(f"{len(ranges)} beginbfrange", 'latin-1')
+        ]
+        for first, last, unicode in ranges:
+            lines.append(bytes(f"<{first:02X}> <{last:02X}> <{unicode:04X}>", 'latin-1'))
+        lines += [b'endbfrange', b'endcmap', b'CMapName currentdict /CMap defineresource pop', b'end', b'end']
+        return self._add(self._stream('', b'\n'.join(lines)), stream=True)
+
+    def _fonts(self):
+        fonts = [self._add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')]
+        for font in range(2, self.fonts + 1):
+            to_unicode = self._to_unicode(self._shift(font))
+            widths = ' '.join(['500'] * 95)
+            fonts.append(self._add(bytes(
+                f"<< /Type /Font /Subtype /TrueType /BaseFont /Synthetic{font} /FirstChar 32 /LastChar 126 "
+                f"/Widths [{widths}] /ToUnicode {to_unicode} 0 R >>",
+                'latin-1'
+            )))
+        self._font_numbers = fonts
+        return ' '.join(f"/F{i} {n} 0 R" for i, n in enumerate(fonts, 1))
+
+    def image_pixels(self, i):
+        """The (size, size, 3) RGB pixels of image i, a smooth gradient that's a bit different for every image."""
+        n = self.image_size
+        y, x = np.mgrid[0:n, 0:n]
+        return np.stack([(x * 255 // n + i * 7) & 255, (y * 255 // n) & 255, ((x + y) * 127 // n + i * 13) & 255], axis=2).astype(np.uint8)
+
+    def _image(self, i):
+        n = self.image_size
+        pixels = self.image_pixels(i)
+        info = f"/Type /XObject /Subtype /Image /Width {n} /Height {n} /ColorSpace /DeviceRGB /BitsPerComponent 8"
+        if i % 2 == 0:
+            ok, jpg = cv.imencode('.jpg', np.ascontiguousarray(pixels[..., ::-1]))
+            data = jpg.tobytes()
+            return self._add(b'<< ' + bytes(f"{info} /Filter /DCTDecode /Length {len(data)}", 'latin-1') + b' >>\nstream\n' + data + b'\nendstream', stream=True)
+        rows = pixels.reshape(n, n * 3)
+        data = zlib.compress(self.png_filter(rows, 3, np.arange(n) % 5))
+        info += f" /Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors 3 /Columns {n} >> /Length {len(data)}"
+        return self._add(b'<< ' + bytes(info, 'latin-1') + b' >>\nstream\n' + data + b'\nendstream', stream=True)
+
+    def build(self):
+        self._objects = []
+        self._streams = set()
+        self._contents = {}
+        catalog = self._add(None)
+        pages = self._add(None)
+        fonts = self._fonts()
+        if self.images:
+            x_objects = ' '.join(f"/Im{i} {self._image(i)} 0 R" for i in range(self.images))
+            resources = self._add(bytes(f"<< /Font << {fonts} >> /XObject << {x_objects} >> >>", 'latin-1'))
+        else:
+            resources = self._add(bytes(f"<< /Font << {fonts} >> >>", 'latin-1'))
+        # The catalog, fonts, images and resources, page 1 is added to these once it exists.
+        first_page = [catalog] + list(range(pages + 1, resources + 1))
+
+        kids = []
+        if not self.fanout:
+            for p in range(1, self.pages + 1):
+                page_resources = resources
+                if self.page_fonts:
+                    names = ' '.join(f"/F{i} {self._font_numbers[self._page_font(p, i) - 1]} 0 R" for i in range(1, self.fonts + 1))
+                    page_resources = self._add(bytes(f"<< /Font << {names} >> >>", 'latin-1'))
+                content = self._contents[p] = self._add(self._stream('', self._content(p)), stream=True)
+                page = self._add(bytes(
+                    f"<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 612 792] /Resources {page_resources} 0 R /Contents {content} 0 R >>",
+                    'latin-1'
+                ))
+                kids.append(f"{page} 0 R")
+            self._set(catalog, bytes(f"<< /Type /Catalog /Pages {pages} 0 R >>", 'latin-1'))
+            self._set(pages, bytes(f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>", 'latin-1'))
+        else:
+            self._page_tree(catalog, pages, resources)
+
+        while len(self._objects) < self.objects:
+            n = len(self._objects) + 1
+            self._add(bytes(f"<< /Filler {n} /Name /Obj{n} /Array [{n} {n * 2} {n * 3}] >>", 'latin-1'))
+
+        if self.linearized:
+            # Every page object is added right after its contents.
+            page = self._contents[1] + 1
+            return self._serialize_linearized(catalog, first_page + [self._contents[1], page], page)
+
+        out = self._serialize(catalog)
+        for u in range(1, self.updates + 1):
+            out = self._update(out, u, catalog)
+        return out
+
+    def _page_tree(self, catalog, pages, resources):
+        """A balanced page tree with at most `fanout` kids per node."""
+        level = []
+        for p in range(1, self.pages + 1):
+            content = self._contents[p] = self._add(self._stream('', self._content(p)), stream=True)
+            level.append((self._add(None), content))
+        leaves = dict(level)
+
+        # { node: (kids, count) } for the intermediate /Pages nodes and { obj_number: parent }.
+        nodes = {}
+        parents = {}
+        level = [(page, 1) for page, _ in level]
+        while len(level) > self.fanout:
+            upper = []
+            for c in range(0, len(level), self.fanout):
+                chunk = level[c:c + self.fanout]
+                node = self._add(None)
+                nodes[node] = ([k for k, _ in chunk], sum(n for _, n in chunk))
+                for k, _ in chunk:
+                    parents[k] = node
+                upper.append((node, nodes[node][1]))
+            level = upper
+        for k, _ in level:
+            parents[k] = pages
+
+        for page, content in leaves.items():
+            self._set(page, bytes(f"<< /Type /Page /Parent {parents[page]} 0 R /Contents {content} 0 R >>", 'latin-1'))
+        for node, (kids, count) in nodes.items():
+            kids = ' '.join(f"{k} 0 R" for k in kids)
+            self._set(node, bytes(f"<< /Type /Pages /Parent {parents[node]} 0 R /Kids [{kids}] /Count {count} >>", 'latin-1'))
+        kids = ' '.join(f"{k} 0 R" for k, _ in level)
+        self._set(catalog, bytes(f"<< /Type /Catalog /Pages {pages} 0 R >>", 'latin-1'))
+        self._set(pages, bytes(
+            f"<< /Type /Pages /Kids [{kids}] /Count {self.pages} /MediaBox [0 0 612 792] /Resources {resources} 0 R >>",
+            'latin-1'
+        ))
+
+    def _serialize(self, root):
+        out = bytearray(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n' if self.xref_stream else b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        # { obj_number: (type, field_2, field_3) } same as the xref stream entries.
+        entries = {}
+        packed = []
+        for i, body in enumerate(self._objects, 1):
+            if self.object_streams and i not in self._streams:
+                packed.append((i, body))
+                continue
+            entries[i] = (1, len(out), 0)
+            out += bytes(f"{i} 0 obj\n", 'latin-1') + body + b'\nendobj\n'
+
+        next_number = len(self._objects) + 1
+        for c in range(0, len(packed), self.object_streams or 1):
+            chunk = packed[c:c + self.object_streams]
+            header = []
+            bodies = bytearray()
+            for index, (n, body) in enumerate(chunk):
+                entries[n] = (2, next_number, index)
+                header.append(f"{n} {len(bodies)}")
+                bodies += body + b'\n'
+            header = bytes(' '.join(header) + '\n', 'latin-1')
+            entries[next_number] = (1, len(out), 0)
+            body = self._stream(f"/Type /ObjStm /N {len(chunk)} /First {len(header)}", header + bytes(bodies))
+            out += bytes(f"{next_number} 0 obj\n", 'latin-1') + body + b'\nendobj\n'
+            next_number += 1
+
+        if self.xref_stream:
+            return self._xref_stream(out, entries, next_number, root)
+
+        self._last_xref = len(out)
+        self._size = len(entries) + 1
+        out += bytes(f"xref\n0 {len(entries) + 1}\n", 'latin-1')
+        out += b'0000000000 65535 f \n'
+        for n in range(1, len(entries) + 1):
+            out += bytes(f"{entries[n][1]:010d} 00000 n \n", 'latin-1')
+        out += bytes(f"trailer\n<< /Size {len(entries) + 1} /Root {root} 0 R >>\nstartxref\n{self._last_xref}\n%%EOF\n", 'latin-1')
+        return bytes(out)
+
+    def _serialize_linearized(self, root, first_page, page):
+        """Writes the objects in the order of a linearized file.
+
+        (Source: PDF reference 1.7 Appendix F, section 2 [F.2])
+        The linearization dictionary, the first page xref section (its trailer has the /Root and a
+        /Prev to the main xref) and the `first_page` objects come first, /E is where they end.
+        The hint stream is only a stand-in, its tables aren't filled in. Every offset is written
+        10 digits wide so the second pass can fill them in without moving anything.
+        """
+        lin = self._add(None)
+        hint = self._add(self._stream('', bytes(32)), stream=True)
+        first = sorted(set(first_page) | {hint})
+        rest = [n for n in range(1, len(self._objects) + 1) if n not in first and n != lin]
+        size = len(self._objects) + 1
+
+        def layout(offsets, values):
+            out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+            offsets[lin] = len(out)
+            out += bytes(
+                f"{lin} 0 obj\n<< /Linearized 1 /L {values['L']:010d} /H [{values['H']:010d} {values['H_length']:010d}] "
+                f"/O {page} /E {values['E']:010d} /N {self.pages} /T {values['T']:010d} >>\nendobj\n",
+                'latin-1'
+            )
+            first_xref = len(out)
+            out += b'xref\n'
+            for start, count in self._subsections(sorted(first + [lin])):
+                out += bytes(f"{start} {count}\n", 'latin-1')
+                for n in range(start, start + count):
+                    out += bytes(f"{offsets.get(n, 0):010d} 00000 n \n", 'latin-1')
+            out += bytes(f"trailer\n<< /Size {size} /Root {root} 0 R /Prev {values['main']:010d} >>\nstartxref\n0\n%%EOF\n", 'latin-1')
+            for n in first:
+                offsets[n] = len(out)
+                out += bytes(f"{n} 0 obj\n", 'latin-1') + self._objects[n - 1] + b'\nendobj\n'
+            values['E'] = len(out)
+            values['H'] = offsets[hint]
+            values['H_length'] = len(self._objects[hint - 1]) + len(f"{hint} 0 obj\n\nendobj\n")
+            for n in rest:
+                offsets[n] = len(out)
+                out += bytes(f"{n} 0 obj\n", 'latin-1') + self._objects[n - 1] + b'\nendobj\n'
+
+            values['main'] = len(out)
+            out += b'xref\n'
+            for start, count in self._subsections([0] + rest):
+                out += bytes(f"{start} {count}\n", 'latin-1')
+                if start == 0:
+                    values['T'] = len(out)
+                for n in range(start, start + count):
+                    out += b'0000000000 65535 f \n' if n == 0 else bytes(f"{offsets[n]:010d} 00000 n \n", 'latin-1')
+            out += bytes(f"trailer\n<< /Size {size} >>\nstartxref\n{first_xref}\n%%EOF\n", 'latin-1')
+            values['L'] = len(out)
+            return out
+
+        offsets = {}
+        values = {'L': 0, 'H': 0, 'H_length': 0, 'E': 0, 'T': 0, 'main': 0}
+        layout(offsets, values)
+        return bytes(layout(offsets, values))
+
+    @staticmethod
+    def _subsections(numbers):
+        """[(first, count)] for the runs of consecutive object numbers in `numbers` (sorted)."""
+        runs = []
+        for n in numbers:
+            if runs and runs[-1][0] + runs[-1][1] == n:
+                runs[-1][1] += 1
+            else:
+                runs.append([n, 1])
+        return runs
+
+    def _xref_stream(self, out, entries, xref_number, root, prev=None):
+        """Appends a cross-reference stream for `entries`, an update section (with `prev`) only lists the objects it has."""
+        xref_start = len(out)
+        entries[xref_number] = (1, xref_start, 0)
+        size = max(xref_number + 1, getattr(self, '_size', 0))
+        numbers = range(size) if prev is None else sorted(entries)
+        # W [1 4 2] rows run through the PNG Up predictor like most writers do.
+        rows = []
+        last = bytes(7)
+        for n in numbers:
+            row = struct.pack('>BIH', *entries.get(n, (0, 0, 65535)))
+            rows.append(b'\x02' + bytes((a - b) & 255 for a, b in zip(row, last)))
+            last = row
+        info = f"/Type /XRef /Size {size} /W [1 4 2] /Root {root} 0 R /DecodeParms << /Columns 7 /Predictor 12 >>"
+        if prev is not None:
+            index = ' '.join(f"{first} {count}" for first, count in self._subsections(numbers))
+            info += f" /Index [{index}] /Prev {prev}"
+        out += bytes(f"{xref_number} 0 obj\n", 'latin-1') + self._stream(info, b''.join(rows)) + b'\nendobj\n'
+        out += bytes(f"startxref\n{xref_start}\n%%EOF\n", 'latin-1')
+        self._last_xref = xref_start
+        self._size = size
+        return bytes(out)
+
+    def _update(self, out, revision, root):
+        """Appends incremental update `revision`, new contents for its pages and an xref section pointing back at the last one."""
+        out = bytearray(out)
+        entries = {}
+        for p in range(revision, self.pages + 1, self.updates + 1):
+            n = self._contents[p]
+            entries[n] = (1, len(out), 0)
+            out += bytes(f"{n} 0 obj\n", 'latin-1') + self._stream('', self._content(p, revision)) + b'\nendobj\n'
+
+        if self.xref_stream:
+            return self._xref_stream(out, entries, self._size, root, self._last_xref)
+
+        xref_start = len(out)
+        out += b'xref\n'
+        for first, count in self._subsections(sorted(entries)):
+            out += bytes(f"{first} {count}\n", 'latin-1')
+            for n in range(first, first + count):
+                out += bytes(f"{entries[n][1]:010d} 00000 n \n", 'latin-1')
+        out += bytes(f"trailer\n<< /Size {self._size} /Root {root} 0 R /Prev {self._last_xref} >>\nstartxref\n{xref_start}\n%%EOF\n", 'latin-1')
+        self._last_xref = xref_start
+        return bytes(out)
+
+    @staticmethod
+    def png_filter(pixels, bpp, types):
+        """PNG filters each row of `pixels` (rows, row_bytes uint8) with the filter in `types`, like a PDF writer would."""
+        x = pixels.astype(np.int16)
+        left = np.zeros_like(x)
+        left[:, bpp:] = x[:, :-bpp]
+        up = np.zeros_like(x)
+        up[1:] = x[:-1]
+        up_left = np.zeros_like(x)
+        up_left[:, bpp:] = up[:, :-bpp]
+
+        pa = np.abs(up - up_left)
+        pb = np.abs(left - up_left)
+        pc = np.abs(left + up - 2 * up_left)
+        paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left))
+
+        types = np.asarray(types, dtype=np.uint8)
+        pred = np.select(
+            [types[:, None] == 1, types[:, None] == 2, types[:, None] == 3, types[:, None] == 4],
+            [left, up, (left + up) >> 1, paeth],
+            0
+        )
+        out = np.empty((len(x), x.shape[1] + 1), dtype=np.uint8)
+        out[:, 0] = types
+        out[:, 1:] = (x - pred) & 255
+        return out.tobytes()
+
+    @staticmethod
+    def lzw_compress(data, early_change=1, eod=True):
+        """LZWDecode encoder, starts with a clear code and clears the table again whenever it fills up.
+
+        With eod=False it ends with clear codes up to a byte boundary instead, so the output can be
+        repeated back to back (benchmarks build big streams out of one encoded block that way).
+        """
+        out = bytearray()
+        buff = 0
+        buff_bits = 0
+        width = 9
+        table = {bytes([i]): i for i in range(256)}
+        next_code = 258
+        codes = [256]
+        word = b''
+        for i in range(len(data)):
+            c = data[i:i + 1]
+            wc = word + c
+            if wc in table:
+                word = wc
+                continue
+            codes.append(table[word])
+            table[wc] = next_code
+            next_code += 1
+            word = c
+            if next_code >= 4094:
+                codes.append(256)
+                table = {bytes([i]): i for i in range(256)}
+                next_code = 258
+        if word:
+            codes.append(table[word])
+        codes.append(257 if eod else 256)
+
+        # Widths have to follow the decoder which is one table entry behind.
+        next_code = 258
+        first = True
+        for code in codes:
+            buff = (buff << width) | code
+            buff_bits += width
+            while buff_bits >= 8:
+                buff_bits -= 8
+                out.append((buff >> buff_bits) & 255)
+            buff &= (1 << buff_bits) - 1
+            if code == 256:
+                width = 9
+                next_code = 258
+                first = True
+                continue
+            if first:
+                first = False
+                continue
+            next_code += 1
+            if next_code + early_change >= (1 << width) and width < 12:
+                width += 1
+        while not eod and buff_bits:
+            # Every clear code after the first is 9 bits, so this lines up in at most 7 more.
+            buff = (buff << 9) | 256
+            buff_bits += 9
+            while buff_bits >= 8:
+                buff_bits -= 8
+                out.append((buff >> buff_bits) & 255)
+            buff &= (1 << buff_bits) - 1
+        if buff_bits:
+            out.append((buff << (8 - buff_bits)) & 255)
+        return bytes(out)
+
+    def write(self, fname):
+        with open(fname, 'wb') as f:
+            f.write(self.build())
+        return fname
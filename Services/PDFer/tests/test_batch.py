@@ -0,0 +1,34 @@
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.batch import BatchRunner, find_pdfs
+from os.path import abspath
+import pytest
+
+@pytest.fixture(scope='module')
+def documents(tmp_path_factory):
+    """(files, { fname: [text of every page] }) for a directory of PDFs with a broken one in the middle."""
+    tmp = tmp_path_factory.mktemp('batch')
+    expected = {}
+    for d in range(6):
+        synthetic = SyntheticPdf(pages=5, fonts=2, updates=d % 3, images=d % 2, image_size=32, page_fonts=d % 2 == 0)
+        fname = abspath(synthetic.write(str(tmp / f"doc{d:04d}.pdf")))
+        expected[fname] = [synthetic.page_text(p) for p in range(1, 6)]
+    (tmp / 'doc0003_broken.pdf').write_bytes(b'%PDF-1.4\nthis is not a pdf\n')
+    return find_pdfs(str(tmp)), expected
+
+@pytest.mark.parametrize('order', BatchRunner.ORDERS)
+@pytest.mark.parametrize('workers', [1, 2])
+def test_batch(documents, workers, order):
+    files, expected = documents
+    runner = BatchRunner(workers=workers, timeout=30, order=order)
+    records = list(runner.run(files))
+
+    assert sorted(r['index'] for r in records) == list(range(len(files)))
+    if order == 'input':
+        assert [r['index'] for r in records] == list(range(len(files)))
+    for r in records:
+        if r['file'] in expected:
+            assert (r['status'], r['text']) == ('ok', expected[r['file']])
+        else:
+            # The broken file only costs its own record.
+            assert r['status'] == 'error'
+    assert (runner.stats['ok'], runner.stats['error']) == (6, 1)
@@ -0,0 +1,31 @@
+from Services.PDFer.doc_index import DocIndex, DirectoryStore, PageRefs
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.pdf_base import PdfBase
+import marshal
+import pytest
+
+def test_pages_are_restored_from_the_binary_section(tmp_path):
+    synthetic = SyntheticPdf(pages=30, fanout=4)
+    fname = synthetic.write(str(tmp_path / 'doc.pdf'))
+    store = DirectoryStore(str(tmp_path / 'cache'))
+    with PdfBase(fname, index_store=store) as base:
+        base.create_catalog()
+        pages = list(base.catalog.pages)
+
+    index = DocIndex.load(store, fname)
+    assert isinstance(index.pages, PageRefs)
+    assert list(index.pages) == pages
+    assert index.pages[-1] == pages[-1]
+    with pytest.raises(IndexError):
+        index.pages[len(pages)]
+
+    # Only the binary section has the pages, the marshal'd meta is the rest of the buffer.
+    buff = store.get(DocIndex.key(fname))
+    meta = marshal.loads(buff[len(buff) - DocIndex.HEADER.unpack_from(buff)[-1]:])
+    assert 'pages' not in meta['catalog']
+
+    with PdfBase(fname, index_store=store) as base:
+        base.create_catalog()
+        assert isinstance(base.catalog.pages, PageRefs)
+        assert base.total_pages == synthetic.pages
+        assert list(base.iter_text()) == [(p, synthetic.page_text(p)) for p in range(1, synthetic.pages + 1)]
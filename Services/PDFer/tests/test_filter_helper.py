@@ -0,0 +1,47 @@
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.filter_helper import FilterHelper, LZWTable
+from Services.PDFer.benchmark import PdfBenchmark
+import numpy as np
+import pytest
+
+WIDTH, HEIGHT = 120, 90
+
+@pytest.fixture
+def pixels():
+    rng = np.random.default_rng(0)
+    ramp = np.add.outer(np.arange(HEIGHT), np.arange(WIDTH * 3)) // 7
+    return ((ramp + rng.integers(0, 8, ramp.shape)) & 255).astype(np.uint8)
+
+@pytest.mark.parametrize('types', [1, 2, 3, 4, 'mixed'])
+@pytest.mark.parametrize('libpng', [True, False])
+def test_png_prediction(pixels, types, libpng):
+    types = np.random.default_rng(1).integers(0, 5, HEIGHT) if types == 'mixed' else np.full(HEIGHT, types)
+    data = SyntheticPdf.png_filter(pixels, 3, types)
+    out = FilterHelper.png_prediction(WIDTH, WIDTH * 3 + 3, 3, data, libpng=libpng)
+    assert np.array_equal(out, pixels)
+
+def test_png_prediction_like_the_old_byte_at_a_time_one(pixels):
+    types = np.random.default_rng(1).integers(0, 5, HEIGHT)
+    data = SyntheticPdf.png_filter(pixels, 3, types)
+    old = PdfBenchmark._legacy_png_prediction(WIDTH * 3 + 3, 3, data)
+    assert np.array_equal(np.array(old, dtype=np.uint8), pixels)
+
+def test_tiff_prediction(pixels):
+    # TIFF predictor 2 is the difference from the same component of the pixel to the left.
+    diff = pixels.reshape(HEIGHT, WIDTH, 3).astype(np.int16)
+    diff[:, 1:] -= pixels.reshape(HEIGHT, WIDTH, 3)[:, :-1]
+    data = (diff & 255).astype(np.uint8).tobytes()
+    assert np.array_equal(FilterHelper.tiff_prediction(8, 3, WIDTH, WIDTH * 3 + 3, 3, data), pixels)
+
+def test_lzw():
+    rng = np.random.default_rng(0)
+    text = b''.join(SyntheticPdf()._content(p) for p in range(1, 200))
+    ramp = np.add.outer(np.arange(64), np.arange(2048)) // 9 + rng.integers(0, 4, (64, 2048))
+    block = text + (ramp & 255).astype(np.uint8).tobytes()
+    encoded = SyntheticPdf.lzw_compress(block, eod=False)
+    data = encoded * 3 + SyntheticPdf.lzw_compress(b'')
+
+    assert FilterHelper.lzw(data) == block * 3
+    # Fed a few KiB at a time like the filter pipeline does.
+    table = LZWTable()
+    assert b''.join(table.decode(data[i:i + 4096]) for i in range(0, len(data), 4096)) == block * 3
@@ -0,0 +1,45 @@
+from Services.PDFer.filter_pipeline import FilterPipeline
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.pdf_doc import PdfDoc
+import numpy as np
+import base64, zlib
+import pytest
+
+DATA = bytes(range(256)) * 40
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 7])
+@pytest.mark.parametrize('encoded', [
+    base64.a85encode(DATA) + b'~>',
+    b'<~' + base64.a85encode(DATA, wrapcol=60) + b'~>',
+    b'\n <~' + base64.a85encode(DATA) + b'~>\n'
+], ids=['plain', 'prefixed', 'whitespace'])
+def test_ascii85(encoded, chunk_size):
+    pipeline = FilterPipeline('ASCII85Decode')
+    assert b''.join(pipeline.decode(encoded, chunk_size)) == DATA
+
+def test_chained_filters():
+    encoded = base64.a85encode(zlib.compress(DATA), adobe=True)
+    pipeline = FilterPipeline(['ASCII85Decode', 'FlateDecode'], [None, None])
+    assert pipeline.decode_all(encoded) == DATA
+
+def test_unresolved_decode_parms():
+    with pytest.raises(Exception, match='DecodeParms'):
+        FilterPipeline('FlateDecode', (7, 0, 'R'))
+
+@pytest.mark.parametrize('filters, params', [
+    ('/FlateDecode', '5 0 R'),
+    ('[/FlateDecode]', '[5 0 R]'),
+    ('6 0 R', '5 0 R')
+], ids=['params', 'params_array', 'filter_and_params'])
+def test_indirect_decode_parms(filters, params):
+    rows = np.add.outer(np.arange(6), np.arange(12)).astype(np.uint8)
+    body = zlib.compress(SyntheticPdf.png_filter(rows, 3, np.full(6, 4)))
+    data = (b'%PDF-1.4\n'
+            b'1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n'
+            b'2 0 obj\n<< /Type /Pages /Kids [] /Count 0 >>\nendobj\n'
+            b'3 0 obj\n<< /Length ' + str(len(body)).encode() + b' /Filter ' + filters.encode() +
+            b' /DecodeParms ' + params.encode() + b' >>\nstream\n' + body + b'\nendstream\nendobj\n'
+            b'5 0 obj\n<< /Predictor 12 /Colors 3 /Columns 4 >>\nendobj\n'
+            b'6 0 obj\n/FlateDecode\nendobj\n')
+    with PdfDoc(data) as doc:
+        assert doc.get_object(3, search_stream=True).decompress() == rows.tobytes()
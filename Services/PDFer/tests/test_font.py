@@ -0,0 +1,19 @@
+from Services.PDFer.font import Font
+import pytest
+
+HIGH = bytes(range(0xA0, 0x100))
+
+@pytest.mark.parametrize('encoding, codec', [('WinAnsiEncoding', 'cp1252'), ('MacRomanEncoding', 'mac_roman')])
+def test_simple_encodings(encoding, codec):
+    font = Font(None, {'Type': 'Font', 'Subtype': 'TrueType', 'BaseFont': 'Arial', 'Encoding': encoding})
+    assert font.translate([b'plain ', HIGH]) == 'plain ' + HIGH.decode(codec)
+
+def test_differences():
+    font = Font(None, {'Type': 'Font', 'Subtype': 'Type1', 'BaseFont': 'Custom', 'Encoding': {
+        'Type': 'Encoding',
+        'BaseEncoding': 'WinAnsiEncoding',
+        'Differences': [39, 'quoteright', 96, 'quoteleft', 128, 'fi', 'fl', 'ff', 'ffi', 'ffl', 160, 'space', 200, 'eacute', 'egrave', 'agrave']
+    }})
+    assert font.translate([b"it's `", bytes([128, 129, 160, 200, 201, 202, 0xE9])]) == 'it’s ‘ﬁﬂ \xe9\xe8\xe0\xe9'
+    # Every run decodes the same as looking each byte up in the compiled table.
+    assert font.translate([HIGH, b'abc']) == ''.join(font.table[b] for b in HIGH + b'abc')
@@ -0,0 +1,31 @@
+from Services.PDFer.image_stream import ImageStream
+from Services.PDFer.stream import Stream
+from PIL import Image
+import numpy as np
+import io, zlib
+import pytest
+
+@pytest.fixture
+def jpeg():
+    buf = io.BytesIO()
+    Image.fromarray(np.add.outer(np.arange(48), np.arange(64)).astype(np.uint8)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+def image(filters, data):
+    return ImageStream(None, Stream({'Type': 'XObject', 'Subtype': 'Image', 'Width': 64, 'Height': 48, 'ColorSpace': 'DeviceGray',
+                                     'BitsPerComponent': 8, 'Filter': filters}, memoryview(data)))
+
+def test_jpeg_is_written_without_decoding(tmp_path, jpeg, monkeypatch):
+    def decoded(*args):
+        raise AssertionError('The JPEG went through the filter pipeline.')
+    monkeypatch.setattr(Stream, 'decompress', decoded)
+    monkeypatch.setattr(Stream, 'iter_decompress', decoded)
+    fname = image('DCTDecode', jpeg).write(str(tmp_path / 'im'))
+    assert fname.endswith('.jpg')
+    with open(fname, 'rb') as f:
+        assert f.read() == jpeg
+
+def test_jpeg_behind_another_filter(tmp_path, jpeg):
+    fname = image(['FlateDecode', 'DCTDecode'], zlib.compress(jpeg)).write(str(tmp_path / 'im'))
+    with open(fname, 'rb') as f:
+        assert f.read() == jpeg
@@ -0,0 +1,51 @@
+from Services.PDFer.jpeg_decoder import JpegDecoder
+from PIL import Image
+import numpy as np
+import io
+import pytest
+
+@pytest.fixture(scope='module')
+def pixels():
+    rng = np.random.default_rng(0)
+    height, width = 120, 200
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) & 255], axis=2).astype(np.uint8)
+    # Some detail so the AC coefficients aren't all zero.
+    pixels[30:60, 50:100] = rng.integers(0, 256, (30, 50, 3))
+    return pixels
+
+def encode(pixels, mode='RGB', **options):
+    buf = io.BytesIO()
+    Image.fromarray(pixels, mode).save(buf, 'JPEG', quality=85, **options)
+    return buf.getvalue()
+
+@pytest.mark.parametrize('options', [{}, {'subsampling': 0}, {'progressive': True}])
+def test_like_pillow(pixels, options):
+    data = encode(pixels, **options)
+    expected = np.asarray(Image.open(io.BytesIO(data)).convert('RGB')).astype(np.int16)
+    assert np.array_equal(JpegDecoder(data).decode(), expected)
+    # Its own decoding only differs by rounding and upsampling.
+    assert np.abs(JpegDecoder(data).decode(libjpeg=False) - expected).max() <= 3
+
+def test_gray(pixels):
+    data = encode(pixels[..., 0], 'L')
+    expected = np.asarray(Image.open(io.BytesIO(data))).astype(np.int16)
+    assert np.array_equal(JpegDecoder(data).decode()[..., 0], expected)
+    assert np.abs(JpegDecoder(data).decode(libjpeg=False)[..., 0] - expected).max() <= 1
+
+def test_cmyk_is_left_the_way_it_was_stored(pixels):
+    data = encode(np.dstack([pixels, pixels[..., :1]]), 'CMYK')
+    # Pillow inverts Adobe's CMYK back, the decoder leaves that to the PDF's /Decode.
+    expected = 255 - np.asarray(Image.open(io.BytesIO(data))).astype(np.int16)
+    decoded = JpegDecoder(data).decode()
+    assert decoded.shape == expected.shape
+    assert np.abs(decoded - expected).max() <= 3
+
+def test_color_transform_overrides_libjpeg(pixels):
+    data = encode(pixels)
+    # /ColorTransform 0 on a JFIF file, libjpeg would still convert from YCbCr.
+    assert np.array_equal(JpegDecoder(data).decode(0), JpegDecoder(data).decode(0, libjpeg=False))
+
+def test_not_a_jpeg():
+    with pytest.raises(Exception, match='SOI'):
+        JpegDecoder(b'nope').decode()
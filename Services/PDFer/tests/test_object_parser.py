@@ -0,0 +1,25 @@
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.object_parser import ObjectParser
+from Services.PDFer.pdf_scanner import PdfScanner
+from Services.PDFer.pdf_parser import PDFParser
+from Services.PDFer.benchmark import PdfBenchmark
+
+def test_xref_table_like_the_old_parser():
+    data = SyntheticPdf(pages=10, objects=500).build()
+    table = data[data.rindex(b'\nxref') + 1:data.rindex(b'startxref')]
+    assert ObjectParser().parse_xref_table(table) == PDFParser().parse(PdfScanner().tokenize(table))
+
+def test_resource_dictionaries_like_the_old_parser():
+    scanner = PdfScanner()
+    parser = PDFParser()
+    object_parser = ObjectParser()
+    for data in PdfBenchmark()._resource_objects(300):
+        assert object_parser.parse_indirect_object(data) == parser.parse_indirect_object(scanner.tokenize(data))
+
+def test_deeply_nested_arrays():
+    depth = 5000
+    deep = b'1 0 obj\n' + b'[' * depth + b'<< /Kids [1 0 R] >>' + b']' * depth + b'\nendobj'
+    value = ObjectParser().parse_indirect_object(deep)['values'][0]
+    for _ in range(depth - 1):
+        value = value[0]
+    assert value[0] == {'Kids': [(1, 0, 'R')]}
@@ -0,0 +1,65 @@
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.pdf_base import PdfBase
+from Services.PDFer.byte_source import HttpSource
+from Services.PDFer.benchmark import PdfBenchmark
+import numpy as np
+import cv2 as cv
+import pytest
+
+def expected_text(synthetic):
+    return [(p, synthetic.page_text(p)) for p in range(1, synthetic.pages + 1)]
+
+@pytest.mark.parametrize('name', list(PdfBenchmark.CORPUS))
+def test_corpus_text(name):
+    options = dict(PdfBenchmark.CORPUS[name])
+    for key in ('pages', 'objects'):
+        if key in options:
+            options[key] = max(1, options[key] // 10)
+    synthetic = SyntheticPdf(**options)
+    with PdfBase(synthetic.build()) as base:
+        assert list(base.iter_text()) == expected_text(synthetic)
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_extract_text_with_each_pages_own_fonts(tmp_path, workers):
+    # Every page has its own /F1 ... /F3, a font looked up by name alone gives the wrong text.
+    synthetic = SyntheticPdf(pages=40, fonts=3, page_fonts=True)
+    fname = synthetic.write(str(tmp_path / 'text.pdf'))
+    with PdfBase(fname) as base:
+        base.create_catalog()
+        assert base.extract_text(workers=workers) == expected_text(synthetic)
+
+@pytest.mark.parametrize('fanout', [0, 10])
+def test_page_from_the_page_tree(fanout):
+    synthetic = SyntheticPdf(pages=500, fanout=fanout)
+    with PdfBase(synthetic.build()) as base:
+        base.create_catalog()
+        assert base.get_page_text(432) == synthetic.page_text(432)
+
+def test_export_images(tmp_path):
+    synthetic = SyntheticPdf(pages=3, images=4, image_size=64)
+    with PdfBase(synthetic.write(str(tmp_path / 'images.pdf'))) as base:
+        base.create_catalog()
+        written = base.export_images(str(tmp_path / 'out'), workers=2)
+    assert [w['error'] for w in written] == [None] * 4
+    for i, w in enumerate(written):
+        if w['file'].endswith('.png'):
+            # The PNGs are lossless so they have to match the pixels exactly.
+            assert np.array_equal(cv.imread(w['file'])[..., ::-1], synthetic.image_pixels(i))
+
+def test_remote_page_text():
+    synthetic = SyntheticPdf(pages=50, objects=2000, fonts=3)
+    with PdfBenchmark._serve(synthetic.build()) as (server, url):
+        with PdfBase(HttpSource(url, block_size=16 * 1024)) as base:
+            base.create_catalog()
+            assert base.get_page_text(25) == synthetic.page_text(25)
+
+@pytest.mark.parametrize('first_page', [False, True])
+def test_linearized_first_page(first_page):
+    synthetic = SyntheticPdf(pages=200, objects=5000, fonts=3, linearized=True)
+    with PdfBenchmark._serve(synthetic.build()) as (server, url):
+        with PdfBase(HttpSource(url, block_size=16 * 1024), first_page=first_page) as base:
+            base.create_catalog()
+            assert base.get_page_text(1) == synthetic.page_text(1)
+            assert base.document.partial == first_page
+            # The rest of the document still works, it just loads the xref now.
+            assert base.get_page_text(200) == synthetic.page_text(200)
@@ -0,0 +1,53 @@
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.pdf_doc import PdfDoc
+from Services.PDFer.pdf_base import PdfBase
+from Services.PDFer.stream import Stream
+import re
+import pytest
+
+def test_stream_after_a_plain_read_of_it():
+    # The dictionary of a content stream read first, the stream itself after that (i.e. get_info then the data).
+    with PdfBase(SyntheticPdf(pages=2, objects=50).build()) as base:
+        base.create_catalog()
+        contents = base._get_page(1)._contents
+        base.document.get_object(contents)
+        stream = base.document.get_object(contents, search_stream=True)
+        assert isinstance(stream, Stream)
+        assert base.document.get_object(contents, search_stream=True) is stream
+
+def test_object_streams_over_the_byte_budget_are_inflated_again():
+    data = SyntheticPdf(pages=1, objects=300, object_streams=30).build()
+    with PdfDoc(data) as doc:
+        expected = {n: doc.get_object(n) for n in doc.xref.compressed}
+        streams = {s for s, _ in doc.xref.compressed.values()}
+        budget = 2 * max(len(doc._object_stream(s).data) for s in streams)
+
+    # One parsed object cached so that every fetch goes back to its object stream.
+    with PdfDoc(data, cache_entries=1, stream_cache_bytes=budget) as doc:
+        for _ in range(2):
+            for n, value in expected.items():
+                assert doc.get_object(n) == value
+        assert doc._object_streams.misses == 2 * len(streams)
+        assert len(doc._object_stream_tables) == len(streams)
+
+def test_recovers_a_catalog_in_an_object_stream():
+    # The xref stream (and with it the trailer) cut off, the catalog is only in an object stream.
+    synthetic = SyntheticPdf(pages=10, fonts=2, object_streams=50)
+    data = synthetic.build()
+    damaged = data[:int(re.search(rb'startxref\s+(\d+)', data[data.rfind(b'startxref'):]).group(1))]
+    with PdfBase(damaged) as base:
+        base.create_catalog()
+        assert base.document.recovered
+        assert list(base.iter_text()) == [(p, synthetic.page_text(p)) for p in range(1, 11)]
+
+def test_recovery_without_a_catalog():
+    with pytest.raises(Exception, match='catalog'):
+        PdfDoc(b'%PDF-1.4\n1 0 obj\n<< /Filler 1 >>\nendobj\n')
+
+def test_stream_data_is_not_copied():
+    payload = bytes(range(256)) * 64
+    data = memoryview(b'1 0 obj\n<< /Length ' + bytes(str(len(payload)), 'latin-1') + b' >>\nstream\n' + payload + b'\nendstream\nendobj')
+    with PdfDoc(SyntheticPdf().build()) as doc:
+        stream = doc._stream_object(data)
+    assert isinstance(stream.data, memoryview)
+    assert stream.data == payload
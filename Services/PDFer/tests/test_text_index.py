@@ -0,0 +1,80 @@
+from Services.PDFer.text_index import TextIndex
+from Services.PDFer.synthetic import SyntheticPdf
+from Services.PDFer.pdf_base import PdfBase
+import Services.PDFer.text_index as text_index
+import numpy as np
+import pytest
+
+def failing_pages(pages, fail_after):
+    for i, page in enumerate(pages):
+        if i == fail_after:
+            raise Exception('Broken page.')
+        yield page
+
+def test_add_document_failing_part_way(tmp_path):
+    index = TextIndex(str(tmp_path / 'index'))
+    index.add_document('good.pdf', [(1, ['apple pear']), (2, ['pear plum'])])
+    pages = [(1, ['apple kiwi']), (2, ['kiwi']), (3, ['kiwi plum'])]
+    with pytest.raises(Exception, match='Broken page'):
+        index.add_document('bad.pdf', failing_pages(pages, 2))
+    index.flush()
+
+    assert 'bad.pdf' not in index.docs
+    assert index.search('kiwi') == []
+    assert index.search('apple') == [('good.pdf', 1)]
+
+    index.merge()
+    assert index.search('apple OR kiwi') == [('good.pdf', 1)]
+    assert index.stats()['pages'] == 2
+
+def test_add_document_failing_after_a_segment_was_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(TextIndex, 'SEGMENT_PAGES', 2)
+    index = TextIndex(str(tmp_path / 'index'))
+    pages = [(p, [f"kiwi {p}"]) for p in range(1, 6)]
+    with pytest.raises(Exception):
+        index.add_document('bad.pdf', failing_pages(pages, 3))
+    index.add_document('good.pdf', [(1, ['kiwi'])])
+    index.flush()
+
+    # Reopened from disk, the pages of the failed document were written before it failed.
+    index = TextIndex(str(tmp_path / 'index'))
+    assert len(index.segments) == 2
+    assert index.search('kiwi') == [('good.pdf', 1)]
+
+def test_update_with_a_document_failing_part_way(tmp_path, monkeypatch):
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    synthetic = SyntheticPdf(pages=3)
+    synthetic.write(str(docs / 'a.pdf'))
+    synthetic.write(str(docs / 'b.pdf'))
+
+    iter_text = PdfBase.iter_text
+    class BrokenBase(PdfBase):
+        def iter_text(self, pages=None):
+            fail_after = 2 if self.document.fname.endswith('b.pdf') else None
+            return failing_pages(iter_text(self, pages), fail_after)
+    monkeypatch.setattr(text_index, 'PdfBase', BrokenBase)
+
+    index = TextIndex(str(tmp_path / 'index'))
+    stats = index.update(str(docs))
+    assert (stats['added'], stats['failed'], stats['pages']) == (1, 1, 3)
+
+    hits = index.search('synthetic AND document')
+    assert [(fname[-5:], page) for fname, page in hits] == [('a.pdf', 1), ('a.pdf', 2), ('a.pdf', 3)]
+    index.merge()
+    assert index.search('synthetic') == hits
+
+def test_phrase_search_like_a_substring_search(tmp_path):
+    rng = np.random.default_rng(0)
+    vocab = [f"w{i}" for i in range(50)]
+    ranks = np.minimum(rng.zipf(1.3, 300 * 40), len(vocab)) - 1
+    texts = [' '.join(vocab[r] for r in ranks[p * 40:(p + 1) * 40].tolist()) for p in range(300)]
+    index = TextIndex(str(tmp_path / 'index'))
+    for d in range(0, 300, 30):
+        index.add_document(f"doc{d // 30}.pdf", [(i + 1, [t]) for i, t in enumerate(texts[d:d + 30])])
+    index.flush()
+
+    for phrase in ('w3 w4', 'w0 w0 w1'):
+        expected = [(f"doc{p // 30}.pdf", p % 30 + 1) for p, t in enumerate(texts) if f" {phrase} " in f" {t} "]
+        assert expected
+        assert index.search(f'"{phrase}"') == expected
@@ -0,0 +1,471 @@
+from .pdf_base import PdfBase
+from os.path import abspath, join, exists
+import numpy as np
+import os, re, mmap, struct, marshal, tempfile
+
+def encode_varints(values):
+    """LEB128 varints of `values` (non negative ints), 7 bits a byte with the high bit set on every byte but the last.
+
+    Returns (bytes, byte length of every value).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    for i in range(int(lengths.max(initial=0))):
+        has = lengths > i
+        byte = (values[has] >> np.uint64(7 * i)) & np.uint64(127)
+        more = (lengths[has] > i + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[has] + i] = byte | more
+    return out.tobytes(), lengths
+
+def decode_varints(data):
+    """The int64 values of a run of LEB128 varints, decoded all at once."""
+    b = np.frombuffer(data, dtype=np.uint8)
+    if len(b) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(b < 128)
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = (np.arange(len(b)) - np.repeat(starts, ends - starts + 1)) * 7
+    values = (b & 127).astype(np.int64) << shifts
+    return np.add.reduceat(values, starts)
+
+class IndexSegment:
+    """One immutable file of a TextIndex, the postings of the pages that were added together.
+
+    Binary layout (little endian):
+        header     - magic, page count, dictionary length
+        page_ids   - int64 * page count (sorted, unique across the whole index)
+        page_docs  - int64 * page count (doc id of every page)
+        page_nums  - int64 * page count (page number inside of the document)
+        dictionary - marshal'd { term: (offset, length, page count) } into the postings
+        postings   - varints, per term: page id deltas, positions per page, position deltas
+
+    Positions are word numbers on the page, the first one of every page is absolute.
+    """
+    MAGIC = b'PDFTXT01'
+    HEADER = struct.Struct('<8sqq')
+
+    def __init__(self, buff):
+        self.buffer = buff = memoryview(buff)
+        magic, n_pages, n_dict = self.HEADER.unpack_from(buff)
+        if magic != self.MAGIC:
+            raise Exception('Not a PDFer text index segment.')
+        pos = self.HEADER.size
+        self.page_ids = np.frombuffer(buff, dtype=np.int64, count=n_pages, offset=pos)
+        pos += 8 * n_pages
+        self.page_docs = np.frombuffer(buff, dtype=np.int64, count=n_pages, offset=pos)
+        pos += 8 * n_pages
+        self.page_nums = np.frombuffer(buff, dtype=np.int64, count=n_pages, offset=pos)
+        pos += 8 * n_pages
+        self.terms = marshal.loads(buff[pos:pos + n_dict])
+        self._postings = pos + n_dict
+
+    @classmethod
+    def open(cls, fname):
+        with open(fname, 'rb') as f:
+            # The map stays valid after the file is closed.
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def postings(self, term):
+        """(page_ids, counts, positions) of a term, positions are grouped by page in page order."""
+        entry = self.terms.get(term)
+        if entry is None:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        offset, length, n = entry
+        start = self._postings + offset
+        values = decode_varints(self.buffer[start:start + length])
+        pages = np.cumsum(values[:n])
+        counts = values[n:2 * n]
+        deltas = values[2 * n:]
+        # Cumulative sum that starts over on every page.
+        firsts = np.cumsum(counts) - counts
+        total = np.cumsum(deltas)
+        positions = total - np.repeat(total[firsts] - deltas[firsts], counts)
+        return pages, counts, positions
+
+    @classmethod
+    def dumps(cls, page_ids, page_docs, page_nums, postings):
+        """The segment bytes, `postings` is [(term, page_ids, counts, positions)] in any order."""
+        dictionary = {}
+        chunks = []
+        offset = 0
+        for term, pages, counts, positions in postings:
+            pages = np.asarray(pages, dtype=np.int64)
+            counts = np.asarray(counts, dtype=np.int64)
+            positions = np.asarray(positions, dtype=np.int64)
+            deltas = np.diff(positions, prepend=0)
+            firsts = np.cumsum(counts) - counts
+            deltas[firsts] = positions[firsts]
+            values = np.concatenate([np.diff(pages, prepend=0), counts, deltas])
+            chunks.append(values)
+            dictionary[term] = [offset, len(values), len(pages)]
+            offset += len(values)
+
+        # Every term is encoded in one go, the dictionary is switched from value to byte offsets after.
+        data, lengths = encode_varints(np.concatenate(chunks) if chunks else [])
+        ends = np.concatenate([[0], np.cumsum(lengths)])
+        for term, entry in dictionary.items():
+            first, count = entry[0], entry[1]
+            dictionary[term] = (int(ends[first]), int(ends[first + count] - ends[first]), entry[2])
+
+        meta = marshal.dumps(dictionary)
+        return b''.join([
+            cls.HEADER.pack(cls.MAGIC, len(page_ids), len(meta)),
+            np.asarray(page_ids, dtype=np.int64).tobytes(),
+            np.asarray(page_docs, dtype=np.int64).tobytes(),
+            np.asarray(page_nums, dtype=np.int64).tobytes(),
+            meta,
+            data
+        ])
+
+class QueryParser:
+    """Parses a search query into a tree of ('term', t), ('phrase', [t, ...]), ('and', a, b), ('or', a, b) and ('not', a).
+
+    Words next to each other are ANDed, "quoted words" are a phrase, AND/OR/NOT (upper case) and
+    parentheses work like they usually do with NOT binding tightest and OR loosest. A word that
+    breaks into more than one term (i.e. e-mail) is a phrase too.
+    """
+    TOKEN_REGEX = re.compile(r'"([^"]*)"|(\()|(\))|([^\s()"]+)')
+
+    def __init__(self, query):
+        self.tokens = []
+        for phrase, left, right, word in self.TOKEN_REGEX.findall(query):
+            if left or right:
+                self.tokens.append(left or right)
+            elif word in ('AND', 'OR', 'NOT'):
+                self.tokens.append(word)
+            else:
+                terms = TextIndex.terms(phrase or word)
+                if terms:
+                    self.tokens.append(('term', terms[0]) if len(terms) == 1 else ('phrase', terms))
+        self.pos = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise Exception('Empty query.')
+        node = self._or()
+        if self.pos < len(self.tokens):
+            raise Exception(f"Unexpected {self.tokens[self.pos]!r} in the query.")
+        return node
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _or(self):
+        node = self._and()
+        while self._peek() == 'OR':
+            self.pos += 1
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._peek() not in (None, 'OR', ')'):
+            if self._peek() == 'AND':
+                self.pos += 1
+            node = ('and', node, self._not())
+        return node
+
+    def _not(self):
+        if self._peek() == 'NOT':
+            self.pos += 1
+            return ('not', self._not())
+        token = self._peek()
+        self.pos += 1
+        if token == '(':
+            node = self._or()
+            if self._peek() != ')':
+                raise Exception('Missing ) in the query.')
+            self.pos += 1
+            return node
+        if not isinstance(token, tuple):
+            raise Exception(f"Unexpected {token!r} in the query.")
+        return token
+
+class TextIndex:
+    """A persistent inverted index of the text of a directory of PDFs (term -> document, page, word position).
+
+    The index directory has an `index.meta` (the documents, their mtime and size and which doc ids
+    were deleted) and IndexSegment files. Every update only extracts the files that are new or
+    changed, their pages go into a new segment and the old versions are only marked deleted, so
+    nothing that was already indexed is touched. Segments are merged (and deleted pages dropped)
+    once there are more than MAX_SEGMENTS of them.
+
+    Queries (see QueryParser) are answered page by page with NumPy set operations on the decoded
+    postings, phrases by matching positions.
+    """
+    META = 'index.meta'
+    VERSION = 1
+    # Pages held in memory before they are written out as a segment.
+    SEGMENT_PAGES = 20000
+    MAX_SEGMENTS = 8
+    WORD_REGEX = re.compile(r'\w+')
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        meta = {}
+        if exists(join(self.path, self.META)):
+            with open(join(self.path, self.META), 'rb') as f:
+                meta = marshal.loads(f.read())
+            if meta.get('version') != self.VERSION:
+                raise Exception(f"Text index in {self.path} is from another version, delete it to rebuild.")
+        # { fname: (doc_id, mtime_ns, size, page count) }
+        self.docs = meta.get('docs', {})
+        self.deleted = set(meta.get('deleted', []))
+        self.segments = meta.get('segments', [])
+        self.next_doc = meta.get('next_doc', 0)
+        self.next_page = meta.get('next_page', 0)
+        self._open = {}
+        self._paths = None
+        # The segment being built { term: [[page_ids], [counts], [positions]] } and its page table.
+        self._postings = {}
+        self._pages = ([], [], [])
+
+    @classmethod
+    def terms(cls, text):
+        return cls.WORD_REGEX.findall(text.lower())
+
+    def _segment(self, name):
+        segment = self._open.get(name)
+        if segment is None:
+            segment = self._open[name] = IndexSegment.open(join(self.path, name))
+        return segment
+
+    def _write(self, name, data):
+        # Write then rename so a reader never sees half of a file.
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, join(self.path, name))
+
+    def add_document(self, fname, pages, mtime_ns=0, size=0):
+        """Indexes `pages` ([(page_number, lines), ...] like PdfBase.iter_text) as the document `fname`.
+
+        If `pages` raises part of the way through, the pages it already gave are marked deleted
+        (they may already be in a written segment) and the error is raised again.
+        """
+        self.remove_document(fname)
+        doc_id = self.next_doc
+        self.next_doc += 1
+        try:
+            count = self._add_pages(doc_id, pages)
+        except Exception:
+            self.deleted.add(doc_id)
+            raise
+        self.docs[fname] = (doc_id, mtime_ns, size, count)
+        self._paths = None
+        return count
+
+    def _add_pages(self, doc_id, pages):
+        count = 0
+        for page_number, lines in pages:
+            page_id = self.next_page
+            self.next_page += 1
+            count += 1
+            self._pages[0].append(page_id)
+            self._pages[1].append(doc_id)
+            self._pages[2].append(page_number)
+            words = self.terms('\n'.join(lines) if isinstance(lines, list) else lines)
+            seen = {}
+            for position, word in enumerate(words):
+                positions = seen.get(word)
+                if positions is None:
+                    seen[word] = [position]
+                else:
+                    positions.append(position)
+            for word, positions in seen.items():
+                posting = self._postings.get(word)
+                if posting is None:
+                    posting = self._postings[word] = ([], [], [])
+                posting[0].append(page_id)
+                posting[1].append(len(positions))
+                posting[2].extend(positions)
+            if len(self._pages[0]) >= self.SEGMENT_PAGES:
+                self._flush_segment()
+        return count
+
+    def remove_document(self, fname):
+        entry = self.docs.pop(fname, None)
+        if entry is not None:
+            self.deleted.add(entry[0])
+            self._paths = None
+
+    def _flush_segment(self):
+        if not self._pages[0]:
+            return
+        name = f"segment-{self._pages[0][0]:012d}.idx"
+        postings = [(term, *posting) for term, posting in self._postings.items()]
+        self._write(name, IndexSegment.dumps(*self._pages, postings))
+        self.segments.append(name)
+        self._postings = {}
+        self._pages = ([], [], [])
+
+    def flush(self):
+        """Writes out the pending pages and the index meta, merges the segments when there are too many."""
+        self._flush_segment()
+        if len(self.segments) > self.MAX_SEGMENTS:
+            self.merge()
+        self._write(self.META, marshal.dumps({
+            'version': self.VERSION,
+            'docs': self.docs,
+            'deleted': sorted(self.deleted),
+            'segments': self.segments,
+            'next_doc': self.next_doc,
+            'next_page': self.next_page
+        }))
+
+    def merge(self):
+        """Rewrites every segment into one, the pages of deleted (and replaced) documents are dropped."""
+        if not self.segments:
+            return
+        segments = [self._segment(name) for name in self.segments]
+        deleted = np.array(sorted(self.deleted), dtype=np.int64)
+        keep = [~np.isin(s.page_docs, deleted) for s in segments]
+        live = [s.page_ids[k] for s, k in zip(segments, keep)]
+        page_table = [np.concatenate([a[k] for a, k in zip(arrays, keep)]) for arrays in (
+            [s.page_ids for s in segments], [s.page_docs for s in segments], [s.page_nums for s in segments]
+        )]
+
+        postings = []
+        for term in sorted(set().union(*[s.terms for s in segments])):
+            parts = ([], [], [])
+            for segment, pages_alive in zip(segments, live):
+                pages, counts, positions = segment.postings(term)
+                if not len(pages):
+                    continue
+                alive = np.isin(pages, pages_alive)
+                parts[0].append(pages[alive])
+                parts[1].append(counts[alive])
+                parts[2].append(positions[np.repeat(alive, counts)])
+            if parts[0] and sum(len(p) for p in parts[0]):
+                postings.append((term, *[np.concatenate(p) for p in parts]))
+
+        name = f"segment-{self.next_page:012d}.idx"
+        self._write(name, IndexSegment.dumps(*page_table, postings))
+        old = self.segments
+        self.segments = [name]
+        self.deleted = set()
+        self._open = {}
+        for fname in old:
+            if fname != name:
+                os.remove(join(self.path, fname))
+
+    def update(self, root, extensions=('.pdf',)):
+        """Brings the index up to date with the PDFs under `root`, only new and changed (mtime/size) files are read.
+
+        Returns the counts of what happened { 'added', 'updated', 'removed', 'unchanged', 'failed', 'pages' }
+        and the errors of the files that couldn't be read.
+        """
+        stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0, 'failed': 0, 'pages': 0, 'errors': {}}
+        found = set()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if abspath(join(dirpath, d)) != abspath(self.path))
+            for name in sorted(filenames):
+                if not name.lower().endswith(extensions):
+                    continue
+                fname = abspath(join(dirpath, name))
+                found.add(fname)
+                st = os.stat(fname)
+                entry = self.docs.get(fname)
+                if entry is not None and entry[1] == st.st_mtime_ns and entry[2] == st.st_size:
+                    stats['unchanged'] += 1
+                    continue
+                try:
+                    with PdfBase(fname) as base:
+                        stats['pages'] += self.add_document(fname, base.iter_text(), st.st_mtime_ns, st.st_size)
+                except Exception as e:
+                    # A broken file doesn't stop the rest, it's tried again next time.
+                    self.remove_document(fname)
+                    stats['failed'] += 1
+                    stats['errors'][fname] = str(e)
+                    continue
+                stats['updated' if entry is not None else 'added'] += 1
+
+        root = join(abspath(root), '')
+        for fname in [f for f in self.docs if f.startswith(root) and f not in found]:
+            self.remove_document(fname)
+            stats['removed'] += 1
+        self.flush()
+        return stats
+
+    def _pages_of(self, node, segment):
+        """The sorted page ids of `segment` that match the query tree `node`."""
+        kind = node[0]
+        if kind == 'term':
+            return segment.postings(node[1])[0]
+        if kind == 'and':
+            left = self._pages_of(node[1], segment)
+            # a AND NOT b is the usual way NOT is used, it doesn't need every page.
+            if node[2][0] == 'not':
+                return np.setdiff1d(left, self._pages_of(node[2][1], segment), assume_unique=True)
+            return np.intersect1d(left, self._pages_of(node[2], segment), assume_unique=True)
+        if kind == 'or':
+            return np.union1d(self._pages_of(node[1], segment), self._pages_of(node[2], segment))
+        if kind == 'not':
+            return np.setdiff1d(segment.page_ids, self._pages_of(node[1], segment), assume_unique=True)
+        return self._phrase(node[1], segment)
+
+    @staticmethod
+    def _member(sorted_values, values):
+        """np.isin for a sorted `sorted_values`, a binary search instead of a sort of both."""
+        if not len(sorted_values):
+            return np.zeros(len(values), dtype=bool)
+        i = np.searchsorted(sorted_values, values)
+        return sorted_values[np.minimum(i, len(sorted_values) - 1)] == values
+
+    @classmethod
+    def _phrase(cls, terms, segment):
+        postings = [segment.postings(t) for t in terms]
+        candidates = postings[0][0]
+        for pages, _, _ in postings[1:]:
+            candidates = np.intersect1d(candidates, pages, assume_unique=True)
+        if not len(candidates):
+            return candidates
+        # (page_id << 32 | position) for every word (sorted, like the postings), the phrase is there
+        # where word i sits at position + i.
+        keys = []
+        for pages, counts, positions in postings:
+            keep = cls._member(candidates, pages)
+            keys.append((np.repeat(pages[keep], counts[keep]) << 32) | positions[np.repeat(keep, counts)])
+        matches = keys[0]
+        for i, k in enumerate(keys[1:], 1):
+            matches = matches[cls._member(k, matches + i)]
+        return np.unique(matches >> 32)
+
+    def search(self, query, limit=None):
+        """[(fname, page_number), ...] of the pages that match `query`, in the order they were indexed."""
+        tree = QueryParser(query).parse()
+        if self._paths is None:
+            self._paths = {v[0]: k for k, v in self.docs.items()}
+        deleted = np.array(sorted(self.deleted), dtype=np.int64)
+        hits = []
+        for name in self.segments:
+            segment = self._segment(name)
+            pages = self._pages_of(tree, segment)
+            rows = np.searchsorted(segment.page_ids, pages)
+            docs = segment.page_docs[rows]
+            alive = ~np.isin(docs, deleted)
+            for doc, page in zip(docs[alive].tolist(), segment.page_nums[rows[alive]].tolist()):
+                hits.append((self._paths[doc], page))
+                if limit is not None and len(hits) >= limit:
+                    return hits
+        return hits
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'documents': len(self.docs),
+            'pages': sum(d[3] for d in self.docs.values()),
+            'segments': len(self.segments),
+            'deleted_documents': len(self.deleted),
+            'bytes': sum(os.path.getsize(join(self.path, n)) for n in self.segments)
+        }
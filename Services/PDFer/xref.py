@@ -1,49 +1,130 @@
 from pprint import pprint
+from array import array
+from bisect import bisect_right
+import numpy as np
+
+def object_bounds(xref, boundaries=(), eof=None):
+    """Computes where every object in the xref starts and ends.
+
+    Returns two `array('q')` indexed by object number, objects that aren't in the file
+    have a start of -1. An object ends where the next object (or one of the extra
+    `boundaries` like the xref table) starts, the last one ends at `eof`.
+    """
+    size = max(xref.keys(), default=-1) + 1
+    starts = array('q', [-1]) * size
+    ends = array('q', [-1]) * size
+
+    for k, v in xref.items():
+        # Free entries point to the next free object not a byte offset,
+        # and compressed entries live inside of an object stream.
+        if v.get('in_use', True) and 'byte_offset' in v:
+            starts[k] = v['byte_offset']
+
+    addresses = sorted(set([s for s in starts if s >= 0]).union(boundaries))
+    last = len(addresses)
+
+    for k, start in enumerate(starts):
+        if start < 0:
+            continue
+        i = bisect_right(addresses, start)
+        ends[k] = addresses[i] if i < last else (eof if eof is not None else start)
+
+    return starts, ends
+
 class XRef:
     """Holds the xref"""
 
-    def __init__(self, start, fname, xref=None):
+    def __init__(self, start, source, xref=None, boundaries=()):
         self.xref_start = start
-        self.fname = fname
-        self.table = self._create_table(xref) if xref else None
+        # Other places objects end at besides the next object (the older xref sections of an updated file).
+        self.boundaries = boundaries
+        # Buffer of the whole file (usually a memoryview of the document's mmap).
+        self.source = source
+        self.starts = None
+        self.ends = None
+        # { obj_number: (object_stream_number, index) }
+        self.compressed = {}
+        if xref:
+            self.update_table(xref)
+
+    @classmethod
+    def from_index(cls, index, source):
+        """Builds the XRef from a saved DocIndex instead of a parsed table."""
+        xref = cls(index.xref_start, source)
+        xref.starts = index.starts
+        xref.ends = index.ends
+        xref.compressed = index.compressed
+        return xref
+
+    def update_table(self, xref):
+        self.starts, self.ends = object_bounds(xref, [self.xref_start, *self.boundaries], len(self.source))
+        self.compressed = {k: (v['stream'], v['index']) for k, v in xref.items() if 'stream' in v}
 
-    def _create_table(self, xref):
-        # self.table = { obj_number: (start_byte, end_byte) }
-        sorted_addresses = sorted([v['byte_offset'] for k, v in xref.items()])
+    @staticmethod
+    def decode_stream(stream):
+        """Decodes a cross-reference stream (/Type /XRef) into the same table PDFParser.xref returns.
+
+        Every row is sum(W) bytes, each field is a big-endian integer W[i] bytes wide.
+        (Source: PDF reference 1.7 Chapter 3, section 4, subsection 7 [3.4.7], Table 3.15)
+        """
+        widths = stream.get_info('W')
+        size = stream.get_info('Size')
+        index = stream.get_info('Index') or [0, size]
+
+        # Any predictor from the DecodeParms is undone by the filter pipeline.
+        data = np.frombuffer(stream.decompress(), dtype=np.uint8)
+        rows = data.reshape(-1, sum(widths))
+
+        fields = []
+        col = 0
+        for w in widths:
+            field = np.zeros(len(rows), dtype=np.int64)
+            for j in range(col, col + w):
+                field = (field << 8) | rows[:, j]
+            fields.append(field)
+            col += w
+
+        # A zero width means the default value, type 1 for the first field and 0 for the rest.
+        types = fields[0] if widths[0] else np.ones(len(rows), dtype=np.int64)
+        numbers = np.concatenate([np.arange(index[i], index[i] + index[i + 1]) for i in range(0, len(index), 2)])
 
         table = {}
-        
-        for k, v in xref.items():
-            start = v['byte_offset']
-            start_index = sorted_addresses.index(start)
-            
-            if start_index == len(sorted_addresses) - 1:
-                table[k] = (start, self.xref_start)
+        for n, t, a, b in zip(numbers.tolist(), types.tolist(), fields[1].tolist(), fields[2].tolist()):
+            if t == 1:
+                table[n] = { 'byte_offset': a, 'gen_number': b, 'in_use': True }
+            elif t == 2:
+                table[n] = { 'stream': a, 'index': b, 'gen_number': 0, 'in_use': True }
             else:
-                table[k] = (start, sorted_addresses[start_index + 1])
-
+                table[n] = { 'byte_offset': a, 'gen_number': b, 'in_use': False }
         return table
 
-    def update_table(self, xref):
-        self.table = self._create_table(xref)
+    def __contains__(self, obj_number):
+        if isinstance(obj_number, tuple):
+            obj_number = obj_number[0]
+        if obj_number in self.compressed:
+            return True
+        return 0 <= obj_number < len(self.starts) and self.starts[obj_number] >= 0
+
+    @property
+    def table(self):
+        """{ obj_number: (start_byte, end_byte) }"""
+        if self.starts is None:
+            return None
+        return {k: (s, self.ends[k]) for k, s in enumerate(self.starts) if s >= 0}
 
     def get_object(self, obj_number):
-        """From the file, returns bytes of the object."""
+        """From the file, returns a memoryview of the object's bytes (no copy is made)."""
         if isinstance(obj_number, tuple):
             obj_number = obj_number[0]
 
-        start, end = self.table[obj_number]
-
-        #TODO: check if xref table is in RAM(redis?)
-        with open(self.fname, 'rb') as f:
-            f.seek(start)
-            data = f.read(end - start)
+        if not (0 <= obj_number < len(self.starts) and self.starts[obj_number] >= 0):
+            raise KeyError(obj_number)
 
-        return data
+        return self.source[self.starts[obj_number]:self.ends[obj_number]]
 
     def toJSON(self):
         return {
             'start': self.xref_start,
-            'table': self.table
+            'table': self.table,
+            'compressed': self.compressed
         }
-    
\ No newline at end of file
@@ -125,7 +125,7 @@ def pdfer_flags(sub):
         '-f',
         '--file',
         type=str,
-        help='PDF File location.',
+        help='PDF File location (a path or an http(s) url, urls are read with range requests).',
         default=False
         )
     pdfer_parser.add_argument(
@@ -221,6 +221,85 @@ def pdfer_flags(sub):
         help='Get a section of the pdf file given the start and end in bytes.',
         metavar=('START', 'END')
         )
+    pdfer_parser.add_argument(
+        '-c',
+        '--cache-dir',
+        nargs='?',
+        const=True,
+        help='Keep a document index so the pdf base reopens without reparsing (default dir: ~/.cache/fungrams/pdfer).',
+        metavar='DIR',
+        default=False
+        )
+    pdfer_parser.add_argument(
+        '-j',
+        '--jsonl',
+        action='store_true',
+        help='Stream the text of every page to stdout as JSON lines, one page at a time.',
+        default=False
+        )
+    pdfer_parser.add_argument(
+        '--index',
+        help='Build (or bring up to date) a full text index of the PDFs under DIR, only new and changed files are read.',
+        metavar='DIR',
+        default=None
+        )
+    pdfer_parser.add_argument(
+        '--index-path',
+        help='Where the full text index is kept (default: DIR/.pdfer-index).',
+        metavar='PATH',
+        default=None
+        )
+    pdfer_parser.add_argument(
+        '--search',
+        help='Search the full text index of --index DIR, i.e. \'"exact phrase" AND word NOT (this OR that)\'.',
+        metavar='QUERY',
+        default=None
+        )
+    pdfer_parser.add_argument(
+        '--batch',
+        help='Process every PDF under DIR on a pool of worker processes, one JSON line per document on stdout.',
+        metavar='DIR',
+        default=None
+        )
+    pdfer_parser.add_argument(
+        '--workers',
+        type=int,
+        help='Worker processes for --batch (default: one per cpu).',
+        metavar='N',
+        default=None
+        )
+    pdfer_parser.add_argument(
+        '--timeout',
+        type=float,
+        help='Seconds --batch gives each document before its worker is killed.',
+        metavar='SEC',
+        default=60
+        )
+    pdfer_parser.add_argument(
+        '--order',
+        choices=['completion', 'input'],
+        help='Write --batch records as they finish (completion) or in the order the files were found (input).',
+        default='completion'
+        )
+    pdfer_parser.add_argument(
+        '--bench',
+        nargs='*',
+        help='Run the PDFer benchmarks on synthetic PDFs (all of them if no names are given, "suite" is the end to end one).',
+        metavar='NAME',
+        default=None
+        )
+    pdfer_parser.add_argument(
+        '--bench-out',
+        help='Write the benchmark results to FILE as JSON.',
+        metavar='FILE',
+        default=None
+        )
+    pdfer_parser.add_argument(
+        '--bench-compare',
+        help='Compare the benchmark results with the JSON of an earlier run (i.e. another commit).',
+        metavar='FILE',
+        default=None
+        )
     pdfer_parser.set_defaults(func=pdfer.start)
 
 def impro_flags(sub):